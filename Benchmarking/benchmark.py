@@ -5,6 +5,9 @@ from openai import AsyncOpenAI, APIError
 from pathlib import Path
 import re
 import random
+import os
+# Shared with grading_service; run with src/utils on PYTHONPATH (see README).
+from adaptive_concurrency import AdaptiveConcurrencyLimiter, retry_after_seconds
 
 # --- 1. CONFIGURATION ---
 MODELS_TO_TEST = [
@@ -19,9 +22,10 @@ MODELS_TO_TEST = [
 DATA_ROOT_PATH = Path("./DataCollection")
 PROMPTS_PATH = Path("./prompts")
 RESULTS_FILEPATH = Path("./benchmark_grading_results_optimized.csv")
-BASE_URL = "https://api.seedbox.ai/v1"
+# Set BASE_URL=http://localhost:5010/v1 to benchmark against the offline mock LLM server (mock_llm/)
+BASE_URL = os.getenv("BASE_URL", "https://api.seedbox.ai/v1")
 
-# Per-model concurrency limits
+# Per-model starting concurrency; the adaptive limiter raises it while the provider is healthy and cuts it on 429/5xx
 MODEL_CONFIG = {
     "gpt-4o-mini": 80,
     "gpt-4o": 10,
@@ -32,29 +36,33 @@ MODEL_CONFIG = {
     "gemma3-27b": 15,
 }
 DEFAULT_CONCURRENCY_LIMIT = 10
+MAX_CONCURRENCY_LIMIT = 200
+LATENCY_TARGET_SECONDS = 120.0
 MAX_RETRIES = 3
 INITIAL_RETRY_DELAY = 2.0
 
 
 # --- 2. ASYNCHRONOUS WORKER ---
-async def grade_task_worker(semaphore_map, client, job, prompt_name, template, model_name):
+async def grade_task_worker(limiter_map, client, job, prompt_name, template, model_name):
     """Performs a single grading API call."""
-    semaphore = semaphore_map[model_name]
-    async with semaphore:
-        level = "Leistungskurs" if job['subject'] in ["Chemie", "Wirtschaft"] else "Basiskurs"
-
-        user_prompt = template['user'].format(
-            subject=job['subject'], level=level, max_points=job['max_points'],
-            task_text=job['task_text'], student_answer=job['student_answer'],
-            materials_text=job.get('materials_text', "Keine Materialien vorhanden.")
-        )
-        messages = [{"role": "system", "content": template['system']}, {"role": "user", "content": user_prompt}]
-        job_id = job['job_id']
-        print(f"Starting job: {job_id} | Model: {model_name}")
-
-        retry_delay = INITIAL_RETRY_DELAY
-        for attempt in range(MAX_RETRIES):
-            try:
+    limiter = limiter_map[model_name]
+    level = "Leistungskurs" if job['subject'] in ["Chemie", "Wirtschaft"] else "Basiskurs"
+
+    user_prompt = template['user'].format(
+        subject=job['subject'], level=level, max_points=job['max_points'],
+        task_text=job['task_text'], student_answer=job['student_answer'],
+        materials_text=job.get('materials_text', "Keine Materialien vorhanden.")
+    )
+    messages = [{"role": "system", "content": template['system']}, {"role": "user", "content": user_prompt}]
+    job_id = job['job_id']
+
+    retry_delay = INITIAL_RETRY_DELAY
+    for attempt in range(MAX_RETRIES):
+        try:
+            # Each attempt takes its own slot, so back-off sleeps do not hold on to concurrency.
+            async with limiter.slot():
+                concurrency_limit = limiter.limit
+                print(f"Starting job: {job_id} | Model: {model_name} | Concurrency limit: {concurrency_limit}")
                 start_time = time.monotonic()
                 completion = await client.chat.completions.create(
                     model=model_name,
@@ -64,47 +72,49 @@ async def grade_task_worker(semaphore_map, client, job, prompt_name, template, m
                 )
                 end_time = time.monotonic()
 
-                input_tokens = completion.usage.prompt_tokens
-                output_tokens = completion.usage.completion_tokens
-
-                print(f"  -> SUCCESS on job: {job_id} | Model: {model_name} in {end_time - start_time:.2f}s")
+            input_tokens = completion.usage.prompt_tokens
+            output_tokens = completion.usage.completion_tokens
+
+            print(f"  -> SUCCESS on job: {job_id} | Model: {model_name} in {end_time - start_time:.2f}s")
+            return {
+                "job_id": job_id,
+                "data_type": job['data_type'],  # ADDED: Pass data_type to results
+                "subject": job['subject'],
+                "model": model_name,
+                "prompt_style": prompt_name,
+                "max_points": job['max_points'],
+                "actual_points": job['actual_points'],
+                "ai_evaluation_json": completion.choices[0].message.content,
+                "latency_seconds": end_time - start_time,
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "concurrency_limit": concurrency_limit,
+                "error": None
+            }
+        except (APIError, Exception) as e:
+            error_status = e.status_code if isinstance(e, APIError) else 'N/A'
+            if attempt < MAX_RETRIES - 1:
+                print(
+                    f"  -> ERROR on job {job_id} (Status: {error_status}, Attempt {attempt + 1}/{MAX_RETRIES}). Retrying...")
+                await asyncio.sleep(max(retry_delay, retry_after_seconds(e) or 0))
+                retry_delay = (retry_delay * 2) + random.uniform(0, 1)
+            else:
+                print(f"  -> FATAL ERROR on job {job_id} (Status: {error_status}). No more retries.")
                 return {
                     "job_id": job_id,
-                    "data_type": job['data_type'],  # ADDED: Pass data_type to results
+                    "data_type": job['data_type'],  # ADDED: Pass data_type to results, even on error
                     "subject": job['subject'],
                     "model": model_name,
                     "prompt_style": prompt_name,
                     "max_points": job['max_points'],
                     "actual_points": job['actual_points'],
-                    "ai_evaluation_json": completion.choices[0].message.content,
-                    "latency_seconds": end_time - start_time,
-                    "input_tokens": input_tokens,
-                    "output_tokens": output_tokens,
-                    "error": None
+                    "ai_evaluation_json": None,
+                    "latency_seconds": -1,
+                    "input_tokens": None,
+                    "output_tokens": None,
+                    "concurrency_limit": limiter.limit,
+                    "error": str(e)
                 }
-            except (APIError, Exception) as e:
-                error_status = e.status_code if isinstance(e, APIError) else 'N/A'
-                if attempt < MAX_RETRIES - 1:
-                    print(
-                        f"  -> ERROR on job {job_id} (Status: {error_status}, Attempt {attempt + 1}/{MAX_RETRIES}). Retrying...")
-                    await asyncio.sleep(retry_delay)
-                    retry_delay = (retry_delay * 2) + random.uniform(0, 1)
-                else:
-                    print(f"  -> FATAL ERROR on job {job_id} (Status: {error_status}). No more retries.")
-                    return {
-                        "job_id": job_id,
-                        "data_type": job['data_type'],  # ADDED: Pass data_type to results, even on error
-                        "subject": job['subject'],
-                        "model": model_name,
-                        "prompt_style": prompt_name,
-                        "max_points": job['max_points'],
-                        "actual_points": job['actual_points'],
-                        "ai_evaluation_json": None,
-                        "latency_seconds": -1,
-                        "input_tokens": None,
-                        "output_tokens": None,
-                        "error": str(e)
-                    }
 
 
 # --- 3. MAIN ASYNCHRONOUS EXECUTION AND HELPERS ---
@@ -119,12 +129,13 @@ async def run_benchmark():
     grading_jobs = discover_grading_jobs(DATA_ROOT_PATH)
     if not grading_jobs: return
 
-    semaphore_map = {}
-    print("\nConfiguring per-model concurrency limits...")
+    limiter_map = {}
+    print("\nConfiguring adaptive per-model concurrency limits...")
     for model in MODELS_TO_TEST:
         limit = MODEL_CONFIG.get(model, DEFAULT_CONCURRENCY_LIMIT)
-        semaphore_map[model] = asyncio.Semaphore(limit)
-        print(f" - {model}: {limit} concurrent requests")
+        limiter_map[model] = AdaptiveConcurrencyLimiter(model, initial_limit=limit, max_limit=MAX_CONCURRENCY_LIMIT,
+                                                        latency_target_seconds=LATENCY_TARGET_SECONDS)
+        print(f" - {model}: starting at {limit} concurrent requests (max {MAX_CONCURRENCY_LIMIT})")
 
     client = AsyncOpenAI(base_url=BASE_URL, api_key=api_key)
     tasks = []
@@ -134,13 +145,19 @@ async def run_benchmark():
     for job in grading_jobs:
         for prompt_name, template in prompt_templates.items():
             for model_name in MODELS_TO_TEST:
-                task = grade_task_worker(semaphore_map, client, job, prompt_name, template, model_name)
+                task = grade_task_worker(limiter_map, client, job, prompt_name, template, model_name)
                 tasks.append(task)
 
     print("All tasks created. Running them concurrently...")
     results = await asyncio.gather(*tasks)
     await client.close()
 
+    print("\nFinal adaptive concurrency per model:")
+    for model, limiter in limiter_map.items():
+        stats = limiter.stats()
+        print(f" - {model}: limit {stats['limit']} ({stats['increases']} increases, {stats['decreases']} decreases, "
+              f"{stats['overloaded']} overloaded responses)")
+
     final_results = [res for res in results if res]
     print("\nBenchmark complete. Saving results...")
     results_df = pd.DataFrame(final_results)
@@ -152,6 +169,8 @@ async def run_benchmark():
 
 # --- 4. HELPER FUNCTIONS ---
 def get_api_key_from_file():
+    if os.getenv("SEEDBOX_API_KEY"):
+        return os.environ["SEEDBOX_API_KEY"]
     try:
         script_location = Path(__file__).resolve().parent
         secret_file_path = script_location.parent / 'secret.txt'
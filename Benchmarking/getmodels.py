@@ -12,11 +12,14 @@ RESULTS_FILEPATH = Path("./benchmark_results.csv")
 
 MODELS_TO_EXCLUDE = ["auto", "smallest-chat-model"]
 
-BASE_URL = "https://api.seedbox.ai"
+# Set BASE_URL=http://localhost:5010 to run against the offline mock LLM server (mock_llm/)
+BASE_URL = os.getenv("BASE_URL", "https://api.seedbox.ai")
 
 
 
 def get_api_key_from_file():
+    if os.getenv("SEEDBOX_API_KEY"):
+        return os.environ["SEEDBOX_API_KEY"]
     try:
         script_location = Path(__file__).resolve()
         project_root = script_location.parents[2]
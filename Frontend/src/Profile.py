@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
-from frontendData import session, User, Course, Enrollment
+from frontendData import session, User
+from frontendQueries import teacher_courses_with_counts
 
 st.title("Welcome to your Grading AI!")
 
@@ -20,9 +21,7 @@ if 'logged_in' in st.session_state and st.session_state.logged_in:
     if role == "Teacher":
         teacher_courses_display = []
         if user_id:
-            courses = session.query(Course).filter_by(teacher_id=user_id).all()
-            for course in courses:
-                num_students = session.query(Enrollment).filter_by(course_id=course.course_id).count()
+            for course, num_students in teacher_courses_with_counts(user_id):
                 teacher_courses_display.append({
                     "Course name": course.name,
                     "Number of students": num_students,
@@ -1,7 +1,12 @@
 import streamlit as st
-from frontendData import session, User, Course, Enrollment
+from frontendData import session, User, Course
+from frontendQueries import course_enrollments, student_enrollments
+from mongo_pool import PooledMongoClient
+from file_links import load_file_link_secret, signed_file_url
+from submission_content import SUMMARY_PROJECTION
+from run_metrics import record_run
 import pandas as pd
-from pymongo import MongoClient, errors as pymongo_errors
+from pymongo import errors as pymongo_errors
 from bson.objectid import ObjectId
 import bcrypt
 import os
@@ -9,6 +14,9 @@ from datetime import datetime
 import gridfs
 from io import BytesIO
 import requests
+import time
+
+run_started_at = time.perf_counter()
 
 st.set_page_config(
     page_title="Grading AI",
@@ -26,20 +34,40 @@ MONGO_EXAMS_DB_NAME = "Exams"
 MONGO_PDF_SUBMISSIONS_COLLECTION = "pdf_submissions"
 PDF_PROCESSOR_URL_ENV = os.getenv("PDF_PROCESSOR_URL", "http://pdf-processor-service:5003")
 GRADING_SERVICE_URL_ENV = os.getenv("GRADING_SERVICE_URL", "http://grading-service:5002")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "20"))
+MONGO_HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv("MONGO_HEALTH_CHECK_INTERVAL_SECONDS", "30"))
+# Files are downloaded from file-service (behind nginx at this path) only when a link is clicked, never read on render.
+FILE_DOWNLOAD_BASE_URL = os.getenv("FILE_DOWNLOAD_BASE_URL", "/files")
+FILE_LINK_SECRET = load_file_link_secret()
+FILE_LINK_TTL_SECONDS = int(os.getenv("FILE_LINK_TTL_SECONDS", "3600"))
+# Batch grading runs on the grading service's job queue; the page only starts a batch and polls its progress. The
+# service also sets how many submissions of a batch may be graded at the same time.
+BATCH_PROGRESS_POLL_SECONDS = float(os.getenv("BATCH_PROGRESS_POLL_SECONDS", "2"))
 
 MONGO_URI = f"mongodb://{MONGO_USER_FRONTEND}:{MONGO_PASSWORD_FRONTEND}@{MONGO_HOST}:27017/?authSource=admin"
 
+@st.cache_resource
+def get_frontend_mongo():
+    """One pooled client per server process, shared by every browser session and rerun."""
+    return PooledMongoClient("frontend", MONGO_URI, max_pool_size=MONGO_MAX_POOL_SIZE, server_selection_timeout_ms=5000,
+                             health_check_interval_seconds=MONGO_HEALTH_CHECK_INTERVAL_SECONDS)
+
+@st.cache_resource(max_entries=1)
+def get_mongo_handles(client_id, _client):
+    """Database, collection and GridFS handles for the current client; client_id changes when the pool reconnects."""
+    db = _client[MONGO_DB_NAME_FRONTEND]
+    return db, db[MONGO_FILES_COLLECTION_FRONTEND], gridfs.GridFS(db), _client[MONGO_EXAMS_DB_NAME][MONGO_PDF_SUBMISSIONS_COLLECTION]
+
 db_frontend = None
 fs = None
 mongo_client_global = None
 files_metadata_collection = None
+pdf_submissions_collection = None
 
 try:
-    mongo_client_global = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-    mongo_client_global.admin.command('ping')
-    db_frontend = mongo_client_global[MONGO_DB_NAME_FRONTEND]
-    files_metadata_collection = db_frontend[MONGO_FILES_COLLECTION_FRONTEND]
-    fs = gridfs.GridFS(db_frontend)
+    # Pings only when the last health check is older than MONGO_HEALTH_CHECK_INTERVAL_SECONDS, not on every rerun.
+    mongo_client_global = get_frontend_mongo().get()
+    db_frontend, files_metadata_collection, fs, pdf_submissions_collection = get_mongo_handles(id(mongo_client_global), mongo_client_global)
 except Exception as e:
     st.error(f"MongoDB/GridFS Connection Error (Frontend): {e}. Application cannot start.")
     st.stop()
@@ -87,6 +115,9 @@ def logout_page_func():
     if st.button("Confirm Log Out", key="confirm_logout_nav_btn"): logout_action()
 logout_nav_page = st.Page(logout_page_func, title="Log Out", icon="🚪")
 
+def file_download_link(label, gridfs_id):
+    st.link_button(label, signed_file_url(FILE_DOWNLOAD_BASE_URL, FILE_LINK_SECRET, str(gridfs_id), FILE_LINK_TTL_SECONDS))
+
 def delete_file_from_gridfs_and_metadata(metadata_id_to_delete, gridfs_id_to_delete):
     global fs, files_metadata_collection
     if fs is None or db_frontend is None: st.error("GridFS not initialized."); return False
@@ -107,13 +138,80 @@ def delete_file_from_gridfs_and_metadata(metadata_id_to_delete, gridfs_id_to_del
         except Exception as e_meta: st.error(f"Error deleting orphaned metadata: {e_meta}"); return False
     except Exception as e: st.error(f"Error during file deletion: {e}"); return False
 
+def submit_for_processing(payload, label):
+    """Queues an upload for OCR on the PDF processor and remembers the job so the course page can show its status."""
+    response = requests.post(f"{PDF_PROCESSOR_URL_ENV}/process_submission", json=payload, timeout=30)
+    if response.status_code == 429:
+        raise RuntimeError(f"The PDF processor is busy, please retry in {response.headers.get('Retry-After', 'a few')} seconds.")
+    response.raise_for_status()
+    job = {"job_id": response.json()["job_id"], "label": label, "course_id": payload["course_id"]}
+    st.session_state.setdefault("processing_jobs", []).append(job)
+    return job["job_id"]
+
+def show_processing_jobs(course_id):
+    jobs = [job for job in st.session_state.get("processing_jobs", []) if job["course_id"] == str(course_id)]
+    if not jobs: return
+    still_running = []
+    for job in jobs:
+        try: status = requests.get(f"{PDF_PROCESSOR_URL_ENV}/jobs/{job['job_id']}", timeout=5).json()
+        except Exception as e: st.caption(f"⚠️ Could not fetch processing status for {job['label']}: {e}"); still_running.append(job); continue
+        if status.get("status") in ("queued", "running"):
+            st.info(f"⏳ {job['label']}: OCR {status['status']}..."); still_running.append(job)
+        elif status.get("status") == "failed":
+            st.error(f"OCR failed for {job['label']}: {(status.get('result') or {}).get('message')}")
+    st.session_state["processing_jobs"] = [job for job in st.session_state["processing_jobs"] if job["course_id"] != str(course_id)] + still_running
+    if still_running and st.button("Refresh processing status", key=f"refresh_processing_{course_id}"): st.rerun()
+
 # --- Page Layout Generation Functions ---
+def fetch_latest_grading_batch(course_id):
+    """The course's latest batch (or None) and the service's batch settings ({} if the service could not be reached)."""
+    try:
+        api_response = requests.get(f"{GRADING_SERVICE_URL_ENV}/batches", params={"course_id": str(course_id), "limit": 1}, timeout=10)
+        api_response.raise_for_status()
+        body = api_response.json()
+        batches = body.get("batches", [])
+        return (batches[0] if batches else None), body
+    except (requests.exceptions.RequestException, ValueError) as e:
+        st.caption(f"Could not load batch grading status: {e}")
+        return None, {}
+
+def format_eta(seconds):
+    if seconds is None: return "—"
+    return f"{int(seconds // 60)}m {int(seconds % 60)}s" if seconds >= 60 else f"{int(seconds)}s"
+
+def answer_sheet_student_names(course_id):
+    return {str(doc["_id"]): doc.get("student_name", "Unknown") for doc in pdf_submissions_collection.find({"course_id": str(course_id), "category": "answer_sheet"}, {"_id": 1, "student_name": 1})}
+
+def grading_batch_panel(batch_id, student_name_by_doc_id, batch=None):
+    """Progress of a batch; student_name_by_doc_id is looked up once by the caller, not on every poll."""
+    if batch is None:
+        try:
+            api_response = requests.get(f"{GRADING_SERVICE_URL_ENV}/batches/{batch_id}", timeout=10)
+            batch = api_response.json()
+        except (requests.exceptions.RequestException, ValueError) as e: st.warning(f"Could not load batch progress: {e}"); return
+        if not api_response.ok:
+            # A transient service error only skips this poll; the next one tries again.
+            st.warning(f"Could not load batch progress: {batch.get('message') if isinstance(batch, dict) else api_response.status_code}"); return
+    finished, total = batch["finished"], max(batch["total"], 1)
+    st.progress(finished / total, text=f"Graded {finished} of {batch['total']} submissions")
+    st.caption(f"⏱️ {batch['documents_per_minute']} submissions/min · {batch['counts']['running']} in progress (max {batch['max_in_flight']}) · {batch['elapsed_seconds']:.0f}s elapsed · ETA {format_eta(batch['eta_seconds'])}")
+    for result in batch["results"]:
+        student_name = student_name_by_doc_id.get(result["document_id"], "Unknown")
+        if result["status"] == "completed": st.markdown(f"✅ {student_name}: {result['final_grade']} / 100")
+        else: st.warning(f"Failed to grade for {student_name}: {result['message']}")
+    if batch["status"] != "running" and st.session_state.get(f"grading_batch_polling_{batch_id}"):
+        # The batch finished while this fragment was polling: rerun the whole page so grades and lists refresh.
+        st.session_state.pop(f"grading_batch_polling_{batch_id}")
+        st.rerun()
+    if batch["status"] == "running": st.session_state[f"grading_batch_polling_{batch_id}"] = True
+
 def _generate_teacher_course_page_layout(course_obj):
     if f"qp_uploader_key_{course_obj.course_id}" not in st.session_state: st.session_state[f"qp_uploader_key_{course_obj.course_id}"] = 0
     if f"ref_uploader_key_{course_obj.course_id}" not in st.session_state: st.session_state[f"ref_uploader_key_{course_obj.course_id}"] = 0
     st.title(f"📘 {course_obj.name} (ID: {course_obj.course_id}) - Teacher View")
     is_completed = not course_obj.is_active
     if is_completed: st.info("This course is marked as completed. Uploads and grading might be disabled.")
+    show_processing_jobs(course_obj.course_id)
     st.subheader("❓ Question Paper")
     current_qp_key = f"qp_upload_{course_obj.course_id}_{st.session_state[f'qp_uploader_key_{course_obj.course_id}']}"
     uploaded_qp = st.file_uploader(label="Upload question paper PDF", type=["pdf"], key=current_qp_key, disabled=is_completed)
@@ -124,12 +222,10 @@ def _generate_teacher_course_page_layout(course_obj):
             st.success(f"QP '{uploaded_qp.name}' uploaded!"); st.session_state[f"qp_uploader_key_{course_obj.course_id}"] += 1
             st.info(f"Sending QP '{uploaded_qp.name}' for OCR processing...")
             pdf_processor_payload = {"gridfs_file_id": str(file_id), "course_id": str(course_obj.course_id), "course_name": course_obj.name, "uploader_username": st.session_state.username, "original_filename": uploaded_qp.name, "category": "question_paper"}
-            response = requests.post(f"{PDF_PROCESSOR_URL_ENV}/process_submission", json=pdf_processor_payload, timeout=180)
-            response.raise_for_status()
-            st.success(f"QP sent for OCR successfully."); st.rerun()
+            submit_for_processing(pdf_processor_payload, f"QP '{uploaded_qp.name}'")
+            st.success(f"QP queued for OCR."); st.rerun()
         except Exception as e:
             st.error(f"Error during QP upload/processing: {e}")
-            if 'response' in locals() and response: st.error(f"Details: Status {response.status_code}, Body: {response.text[:500]}")
     qp_docs_meta = list(files_metadata_collection.find({"course_id": course_obj.course_id, "file_type": "question_paper"}).sort("upload_timestamp", -1))
     if qp_docs_meta:
         for doc_meta in qp_docs_meta:
@@ -138,8 +234,7 @@ def _generate_teacher_course_page_layout(course_obj):
             with cols[0]: st.write(f"- {doc_meta['file_name']} ({doc_meta['upload_timestamp']:%Y-%m-%d %H:%M})")
             with cols[1]:
                 if fs and gridfs_id:
-                    try: grid_out = fs.get(gridfs_id); st.download_button("Download", grid_out.read(), doc_meta['file_name'], key=f"dl_qp_{meta_id_str}")
-                    except: st.caption("DL Error")
+                    file_download_link("Download", gridfs_id)
             with cols[2]:
                 if st.button("Delete", key=f"del_qp_{meta_id_str}", type="secondary", disabled=is_completed):
                     if delete_file_from_gridfs_and_metadata(doc_meta['_id'], gridfs_id): st.rerun()
@@ -154,12 +249,10 @@ def _generate_teacher_course_page_layout(course_obj):
             st.success(f"Ref Material '{uploaded_ref.name}' uploaded!"); st.session_state[f"ref_uploader_key_{course_obj.course_id}"] += 1
             st.info(f"Sending Ref Material '{uploaded_ref.name}' for OCR processing...")
             pdf_processor_payload_ref = {"gridfs_file_id": str(file_id_ref), "course_id": str(course_obj.course_id), "course_name": course_obj.name, "uploader_username": st.session_state.username, "original_filename": uploaded_ref.name, "category": "reference_material"}
-            response_ref = requests.post(f"{PDF_PROCESSOR_URL_ENV}/process_submission", json=pdf_processor_payload_ref, timeout=180)
-            response_ref.raise_for_status()
-            st.success(f"Ref Material sent for OCR successfully."); st.rerun()
+            submit_for_processing(pdf_processor_payload_ref, f"Ref Material '{uploaded_ref.name}'")
+            st.success(f"Ref Material queued for OCR."); st.rerun()
         except Exception as e:
             st.error(f"Error during Ref Material upload/processing: {e}")
-            if 'response_ref' in locals() and response_ref: st.error(f"Details: Status {response_ref.status_code}, Body: {response_ref.text[:500]}")
     ref_docs_meta = list(files_metadata_collection.find({"course_id": course_obj.course_id, "file_type": "reference_material"}).sort("upload_timestamp", -1))
     if ref_docs_meta:
         for doc_meta in ref_docs_meta:
@@ -168,22 +261,24 @@ def _generate_teacher_course_page_layout(course_obj):
             with cols[0]: st.write(f"- {doc_meta['file_name']} ({doc_meta['upload_timestamp']:%Y-%m-%d %H:%M})")
             with cols[1]:
                 if fs and gridfs_id:
-                    try: grid_out = fs.get(gridfs_id); st.download_button("Download", grid_out.read(), doc_meta['file_name'], key=f"dl_ref_{meta_id_str}")
-                    except: st.caption("DL Error")
+                    file_download_link("Download", gridfs_id)
             with cols[2]:
                 if st.button("Delete", key=f"del_ref_{meta_id_str}", type="secondary", disabled=is_completed):
                     if delete_file_from_gridfs_and_metadata(doc_meta['_id'], gridfs_id): st.rerun()
     else: st.info("No reference materials uploaded.")
     st.markdown("---")
     st.subheader("📋 Enrolled Students & Submissions")
-    enrollments = session.query(Enrollment).filter_by(course_id=course_obj.course_id).all()
+    enrollments = course_enrollments(course_obj.course_id)
     if not enrollments: st.info("No students enrolled in this course.")
     else:
         st.markdown("#### Student Answer Sheets Submitted (via UI):")
         any_ui_submissions_found = False
+        ui_submissions_by_student = {}
+        for sub_meta in files_metadata_collection.find({"course_id": course_obj.course_id, "file_type": "student_answer_sheet", "student_id": {"$in": [e.student_id for e in enrollments]}}).sort("upload_timestamp", -1):
+            ui_submissions_by_student.setdefault(sub_meta["student_id"], []).append(sub_meta)
         for enr_loop in enrollments:
             student_for_submission_view = enr_loop.student
-            student_ui_submissions = list(files_metadata_collection.find({"course_id": course_obj.course_id, "student_id": student_for_submission_view.id, "file_type": "student_answer_sheet"}).sort("upload_timestamp", -1))
+            student_ui_submissions = ui_submissions_by_student.get(student_for_submission_view.id, [])
             if student_ui_submissions:
                 any_ui_submissions_found = True
                 with st.expander(f"{student_for_submission_view.name} ({student_for_submission_view.username}) - {len(student_ui_submissions)} submission(s)"):
@@ -193,8 +288,7 @@ def _generate_teacher_course_page_layout(course_obj):
                         with sub_cols[0]: st.write(f"- {sub_meta['file_name']} (Uploaded: {sub_meta['upload_timestamp']:%Y-%m-%d %H:%M})")
                         with sub_cols[1]:
                             if fs and gridfs_id:
-                                try: grid_out_sub = fs.get(gridfs_id); st.download_button("Download Ans", grid_out_sub.read(), sub_meta['file_name'], key=f"dl_ans_{meta_id_str}")
-                                except: st.caption("DL Err")
+                                file_download_link("Download Ans", gridfs_id)
                         with sub_cols[1]:
                             if st.button("Delete Submission", key=f"del_ans_{meta_id_str}", type="secondary"):
                                 if delete_file_from_gridfs_and_metadata(sub_meta['_id'], gridfs_id): st.rerun()
@@ -202,44 +296,48 @@ def _generate_teacher_course_page_layout(course_obj):
         st.markdown("---")
         st.subheader("🚀 Batch AI Grading")
         all_student_ids_in_course = [str(e.student_id) for e in enrollments]
-        processed_submissions_cursor = mongo_client_global[MONGO_EXAMS_DB_NAME][MONGO_PDF_SUBMISSIONS_COLLECTION].find({"course_id": str(course_obj.course_id), "category": "answer_sheet", "student_id": {"$in": all_student_ids_in_course}, "ai_evaluation_details": {"$exists": False}})
+        processed_submissions_cursor = pdf_submissions_collection.find({"course_id": str(course_obj.course_id), "category": "answer_sheet", "student_id": {"$in": all_student_ids_in_course}, "ai_evaluation_details": {"$exists": False}}, {"_id": 1, "student_id": 1})
         ungraded_submissions = []
         student_id_to_name_map = {str(e.student_id): e.student.name for e in enrollments}
         for doc in processed_submissions_cursor:
             student_id = doc.get('student_id')
             ungraded_submissions.append({"doc_id": str(doc["_id"]), "student_name": student_id_to_name_map.get(student_id, "Unknown")})
-        if ungraded_submissions and not is_completed:
+        latest_batch, batch_settings = fetch_latest_grading_batch(course_obj.course_id)
+        batch_student_names = answer_sheet_student_names(course_obj.course_id) if latest_batch else {}
+        if latest_batch and latest_batch["status"] == "running":
+            # Polls only this fragment; the batch itself runs on the grading service and survives reruns and refreshes.
+            st.fragment(grading_batch_panel, run_every=BATCH_PROGRESS_POLL_SECONDS)(latest_batch["batch_id"], batch_student_names)
+        elif ungraded_submissions and not is_completed:
             st.info(f"{len(ungraded_submissions)} submissions are ready for batch grading.")
+            max_in_flight = st.number_input("Submissions graded at the same time", min_value=1, max_value=batch_settings.get("max_in_flight_limit"), value=batch_settings.get("default_max_in_flight", 1), key=f"batch_max_in_flight_{course_obj.course_id}")
             if st.button(f"Grade All {len(ungraded_submissions)} Ungraded Submissions", key=f"batch_grade_{course_obj.course_id}", use_container_width=True):
-                success_count, failure_count = 0, 0
-                with st.spinner(f"Grading all {len(ungraded_submissions)} submissions..."):
-                    for sub in ungraded_submissions:
-                        try:
-                            st.write(f"Grading submission for {sub['student_name']}...")
-                            payload = {"document_id": sub['doc_id']}
-                            if st.session_state.get("custom_api_url") and st.session_state.get("custom_api_key"):
-                                payload["custom_api_url"] = st.session_state["custom_api_url"]
-                                payload["custom_api_key"] = st.session_state["custom_api_key"]
-                            api_response = requests.post(f"{GRADING_SERVICE_URL_ENV}/grade_document", json=payload, timeout=240)
-                            api_response.raise_for_status()
-                            success_count += 1
-                        except Exception as e:
-                            failure_count += 1
-                            st.warning(f"Failed to grade for {sub['student_name']}: {e}")
-                st.success(f"Batch grading complete! {success_count} succeeded, {failure_count} failed."); st.rerun()
+                payload = {"document_ids": [sub["doc_id"] for sub in ungraded_submissions], "course_id": str(course_obj.course_id), "max_in_flight": int(max_in_flight)}
+                if st.session_state.get("custom_api_url") and st.session_state.get("custom_api_key"):
+                    payload["custom_api_url"] = st.session_state["custom_api_url"]
+                    payload["custom_api_key"] = st.session_state["custom_api_key"]
+                try:
+                    api_response = requests.post(f"{GRADING_SERVICE_URL_ENV}/grade_batches", json=payload, timeout=30)
+                    api_response.raise_for_status()
+                    st.rerun()
+                except requests.exceptions.RequestException as e:
+                    st.error(f"Could not start batch grading: {e}")
         else:
             st.info("No submissions are currently ready for batch grading.")
+        if latest_batch and latest_batch["status"] != "running":
+            with st.expander(f"Last batch: {latest_batch['counts']['completed']} graded, {latest_batch['counts']['failed']} failed"):
+                grading_batch_panel(latest_batch["batch_id"], batch_student_names, latest_batch)
         st.markdown("---")
         st.subheader("📝 Individual Grading & Review")
-        selected_enrollment_id = st.selectbox("Select a Single Student to Grade/Review:", [enr.enrollment_id for enr in enrollments], format_func=lambda x: f"{session.query(Enrollment).get(x).student.name} (Enrollment ID: {x})", key=f"sel_stud_for_grade_{course_obj.course_id}")
+        enrollments_by_id = {enr.enrollment_id: enr for enr in enrollments}
+        selected_enrollment_id = st.selectbox("Select a Single Student to Grade/Review:", list(enrollments_by_id), format_func=lambda x: f"{enrollments_by_id[x].student.name} (Enrollment ID: {x})", key=f"sel_stud_for_grade_{course_obj.course_id}")
         if selected_enrollment_id:
-            enrollment_to_grade = session.query(Enrollment).get(selected_enrollment_id)
+            enrollment_to_grade = enrollments_by_id[selected_enrollment_id]
             st.write(f"**Reviewing for: {enrollment_to_grade.student.name}**")
             student_ui_submission_meta = files_metadata_collection.find_one({"student_id": enrollment_to_grade.student_id, "course_id": course_obj.course_id, "file_type": "student_answer_sheet"})
             ocr_doc_id_for_grading, gridfs_id_of_submission_to_process, ocr_processed_submission = None, None, None
             if student_ui_submission_meta and student_ui_submission_meta.get('gridfs_file_id'):
                 gridfs_id_of_submission_to_process = str(student_ui_submission_meta['gridfs_file_id'])
-                ocr_processed_submission = mongo_client_global[MONGO_EXAMS_DB_NAME][MONGO_PDF_SUBMISSIONS_COLLECTION].find_one({"processed_from_gridfs_id": gridfs_id_of_submission_to_process, "category": "answer_sheet"})
+                ocr_processed_submission = pdf_submissions_collection.find_one({"processed_from_gridfs_id": gridfs_id_of_submission_to_process, "category": "answer_sheet"}, SUMMARY_PROJECTION)
                 if ocr_processed_submission:
                     ocr_doc_id_for_grading = str(ocr_processed_submission['_id'])
                     if "ai_evaluation_details" not in ocr_processed_submission:
@@ -326,9 +424,7 @@ def _generate_student_course_page_layout(course_obj, enrollment_obj):
     if existing_submission_meta:
         st.success(f"You submitted '{existing_submission_meta['file_name']}' on {existing_submission_meta['upload_timestamp']:%Y-%m-%d %H:%M}.")
         if fs and existing_submission_meta.get('gridfs_file_id'):
-            try:
-                grid_out_own = fs.get(existing_submission_meta['gridfs_file_id']); st.download_button("Download Your Submission", grid_out_own.read(), existing_submission_meta['file_name'], key=f"s_dl_own_{existing_submission_meta['_id']}")
-            except: pass
+            file_download_link("Download Your Submission", existing_submission_meta['gridfs_file_id'])
     else:
         if is_course_completed_by_teacher:
             st.warning("Cannot submit homework as the course is completed.")
@@ -344,18 +440,17 @@ def _generate_student_course_page_layout(course_obj, enrollment_obj):
                     st.session_state[uploader_session_key] += 1
                     st.info("Your submission is now being processed for grading...")
                     processor_payload = {"gridfs_file_id": str(file_id), "course_id": str(course_obj.course_id), "course_name": course_obj.name, "category": "answer_sheet", "original_filename": uploaded_hw.name, "uploader_username": st.session_state.username, "student_id": str(st.session_state.user_id), "student_name": enrollment_obj.student.name, "teacher_username": course_obj.teacher.username}
-                    response = requests.post(f"{PDF_PROCESSOR_URL_ENV}/process_submission", json=processor_payload, timeout=180)
-                    response.raise_for_status()
-                    st.success("Your submission has been sent for processing.")
+                    submit_for_processing(processor_payload, f"Answer sheet '{uploaded_hw.name}'")
+                    st.success("Your submission has been queued for processing.")
                     st.rerun()
                 except Exception as e:
                     st.error(f"Error submitting homework: {e}")
-                    if 'response' in locals() and response: st.error(f"Details: Status {response.status_code}, Body: {response.text[:500]}")
+    show_processing_jobs(course_obj.course_id)
     st.markdown("---")
     st.subheader("AI Grading Evaluation")
     if existing_submission_meta and existing_submission_meta.get('gridfs_file_id'):
         gridfs_id_str = str(existing_submission_meta.get('gridfs_file_id'))
-        ocr_submission = mongo_client_global[MONGO_EXAMS_DB_NAME][MONGO_PDF_SUBMISSIONS_COLLECTION].find_one({"processed_from_gridfs_id": gridfs_id_str})
+        ocr_submission = pdf_submissions_collection.find_one({"processed_from_gridfs_id": gridfs_id_str}, SUMMARY_PROJECTION)
         if ocr_submission and "ai_evaluation_details" in ocr_submission:
             details = ocr_submission["ai_evaluation_details"]
             final_grade = details.get("final_grade", "N/A")
@@ -389,58 +484,63 @@ def create_student_course_page_callable(course_obj, enrollment_obj):
     def specific_student_course_page(): _generate_student_course_page_layout(course_obj, enrollment_obj)
     specific_student_course_page.__name__ = f"student_course_view_{course_obj.course_id}"
     return specific_student_course_page
-if not st.session_state.logged_in:
-    with st.container():
-        st.title("Grading AI Portal")
-        st.subheader("🔐 Sign up / Log in")
-        choice = st.selectbox("Choose Action:", ["Login", "Sign Up"], key="main_login_signup_choice")
-        form_username = st.text_input("Username", key="main_form_username")
-        form_password = st.text_input("Password", type="password", key="main_form_password")
-        if choice == "Sign Up":
-            form_full_name = st.text_input("Full Name", key="main_form_full_name")
-            form_role = st.selectbox("Select Role:", ["Teacher", "Student"], key="main_form_role")
-            if st.button("Sign Up", key="main_signup_btn"):
-                if form_username and form_password and form_full_name:
-                    signup(form_username, form_password, form_role, form_full_name)
-                else:
-                    st.error("All fields are required for sign up.")
-        elif choice == "Login":
-            if st.button("Log In", key="main_login_btn"):
-                if form_username and form_password:
-                    login(form_username, form_password)
-                else:
-                    st.error("Username and password are required for login.")
-else:
-    if st.session_state.logged_in:
-        st.sidebar.title(f"Welcome, {st.session_state.username}!")
-        st.sidebar.caption(f"Role: {st.session_state.role}")
-        navigation_config = {"Account": [profile_page_nav, logout_nav_page]}
-        if st.session_state.role == "Teacher":
-            user_id = st.session_state.user_id
-            try:
-                active_courses = session.query(Course).filter_by(teacher_id=user_id, is_active=True).order_by(Course.name).all()
-                completed_courses = session.query(Course).filter_by(teacher_id=user_id, is_active=False).order_by(Course.name).all()
-            except Exception as e: st.sidebar.error(f"DB error: {e}"); active_courses, completed_courses = [], []
-            teacher_active_pages = [st.Page(create_teacher_course_page_callable(c), title=f"Active: {c.name} (TC{c.course_id})", icon="📖") for c in active_courses]
-            teacher_completed_pages = [st.Page(create_teacher_course_page_callable(c), title=f"{c.name} (TC{c.course_id})", icon="📘") for c in completed_courses]
-            navigation_config["Manage Courses"] = [course_allocation_page_nav]
-            if teacher_active_pages: navigation_config["Active Courses"] = teacher_active_pages
-            if teacher_completed_pages: navigation_config["Completed Courses"] = teacher_completed_pages
-        elif st.session_state.role == "Student":
-            user_id = st.session_state.user_id
-            try:
-                enrollments = session.query(Enrollment).filter_by(student_id=user_id).all()
-                student_active_course_pages, student_completed_course_pages = [], []
-                for enr in enrollments:
-                    if enr.course:
-                        page_callable = create_student_course_page_callable(enr.course, enr)
-                        page_title = f"{enr.course.name} (SC{enr.course.course_id})"
-                        if enr.course.is_active: student_active_course_pages.append(st.Page(page_callable, title=page_title, icon="📄"))
-                        else: student_completed_course_pages.append(st.Page(page_callable, title=page_title, icon="✅"))
-            except Exception as e: st.sidebar.error(f"DB error loading student courses: {e}"); student_active_course_pages, student_completed_course_pages = [], []
-            navigation_config["My Learning Summary"] = [my_courses_page_nav, grades_page_nav]
-            if student_active_course_pages: navigation_config["My Active Courses"] = student_active_course_pages
-            if student_completed_course_pages: navigation_config["My Completed Courses"] = student_completed_course_pages
-        navigation_config["Tools"] = [settings_page_nav]
-        pg = st.navigation(navigation_config)
-        pg.run()
+try:
+    if not st.session_state.logged_in:
+        with st.container():
+            st.title("Grading AI Portal")
+            st.subheader("🔐 Sign up / Log in")
+            choice = st.selectbox("Choose Action:", ["Login", "Sign Up"], key="main_login_signup_choice")
+            form_username = st.text_input("Username", key="main_form_username")
+            form_password = st.text_input("Password", type="password", key="main_form_password")
+            if choice == "Sign Up":
+                form_full_name = st.text_input("Full Name", key="main_form_full_name")
+                form_role = st.selectbox("Select Role:", ["Teacher", "Student"], key="main_form_role")
+                if st.button("Sign Up", key="main_signup_btn"):
+                    if form_username and form_password and form_full_name:
+                        signup(form_username, form_password, form_role, form_full_name)
+                    else:
+                        st.error("All fields are required for sign up.")
+            elif choice == "Login":
+                if st.button("Log In", key="main_login_btn"):
+                    if form_username and form_password:
+                        login(form_username, form_password)
+                    else:
+                        st.error("Username and password are required for login.")
+    else:
+        if st.session_state.logged_in:
+            st.sidebar.title(f"Welcome, {st.session_state.username}!")
+            st.sidebar.caption(f"Role: {st.session_state.role}")
+            navigation_config = {"Account": [profile_page_nav, logout_nav_page]}
+            if st.session_state.role == "Teacher":
+                user_id = st.session_state.user_id
+                try:
+                    active_courses = session.query(Course).filter_by(teacher_id=user_id, is_active=True).order_by(Course.name).all()
+                    completed_courses = session.query(Course).filter_by(teacher_id=user_id, is_active=False).order_by(Course.name).all()
+                except Exception as e: st.sidebar.error(f"DB error: {e}"); active_courses, completed_courses = [], []
+                teacher_active_pages = [st.Page(create_teacher_course_page_callable(c), title=f"Active: {c.name} (TC{c.course_id})", icon="📖") for c in active_courses]
+                teacher_completed_pages = [st.Page(create_teacher_course_page_callable(c), title=f"{c.name} (TC{c.course_id})", icon="📘") for c in completed_courses]
+                navigation_config["Manage Courses"] = [course_allocation_page_nav]
+                if teacher_active_pages: navigation_config["Active Courses"] = teacher_active_pages
+                if teacher_completed_pages: navigation_config["Completed Courses"] = teacher_completed_pages
+            elif st.session_state.role == "Student":
+                user_id = st.session_state.user_id
+                try:
+                    enrollments = student_enrollments(user_id)
+                    student_active_course_pages, student_completed_course_pages = [], []
+                    for enr in enrollments:
+                        if enr.course:
+                            page_callable = create_student_course_page_callable(enr.course, enr)
+                            page_title = f"{enr.course.name} (SC{enr.course.course_id})"
+                            if enr.course.is_active: student_active_course_pages.append(st.Page(page_callable, title=page_title, icon="📄"))
+                            else: student_completed_course_pages.append(st.Page(page_callable, title=page_title, icon="✅"))
+                except Exception as e: st.sidebar.error(f"DB error loading student courses: {e}"); student_active_course_pages, student_completed_course_pages = [], []
+                navigation_config["My Learning Summary"] = [my_courses_page_nav, grades_page_nav]
+                if student_active_course_pages: navigation_config["My Active Courses"] = student_active_course_pages
+                if student_completed_course_pages: navigation_config["My Completed Courses"] = student_completed_course_pages
+            navigation_config["Tools"] = [settings_page_nav]
+            pg = st.navigation(navigation_config)
+            pg.run()
+finally:
+    # Ends this run's database session, returning its connection to the pool; st.rerun()/st.stop() pass here too.
+    session.remove()
+    record_run(time.perf_counter() - run_started_at)
@@ -1,5 +1,6 @@
 import streamlit as st
-from frontendData import session, User, Course, Enrollment
+from frontendData import session, Course, Enrollment
+from frontendQueries import teacher_courses_with_counts, students
 import pandas as pd
 
 st.title("➕ Allocate a New Course")
@@ -20,7 +21,7 @@ course_name = st.text_input("Course Name")
 course_duration = st.number_input("Duration (weeks)", min_value=1, max_value=52, value=12)
 
 st.subheader("Student Selection")
-all_students = session.query(User).filter_by(user_type="student").all()
+all_students = students()
 if not all_students:
     st.info("No students available to select. Please ensure students are registered with the 'student' role.")
     student_options_display = []
@@ -65,13 +66,12 @@ if st.button("Allocate Course"):
 
 st.markdown("---")
 st.subheader("Your Existing Courses")
-teacher_courses_list = session.query(Course).filter_by(teacher_id=teacher_id).order_by(Course.course_id.desc()).all()
+teacher_courses_list = teacher_courses_with_counts(teacher_id)
 if not teacher_courses_list:
     st.info("You are not currently teaching any courses.")
 else:
     courses_data_display = []
-    for course_item in teacher_courses_list:
-        num_students = session.query(Enrollment).filter_by(course_id=course_item.course_id).count()
+    for course_item, num_students in teacher_courses_list:
         courses_data_display.append({
             "ID": course_item.course_id,
             "Name": course_item.name,
@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-from frontendData import session, User, Course, Enrollment
+from frontendQueries import student_enrollments
 
 st.header(f"📊 Grades for {st.session_state.get('username', 'Unknown User')}")
 
@@ -8,10 +8,10 @@ if st.session_state.get("logged_in") and st.session_state.get("role") == "Studen
     student_id = st.session_state.get("user_id")
 
     if student_id:
-        student_enrollments = session.query(Enrollment).filter_by(student_id=student_id).all()
+        enrollments = student_enrollments(student_id)
         grades_data = []
-        if student_enrollments:
-            for enrollment in student_enrollments:
+        if enrollments:
+            for enrollment in enrollments:
                 course_name = enrollment.course.name if enrollment.course else "N/A"
                 grades_data.append({
                     "Course Name": course_name,
@@ -1,5 +1,5 @@
 import streamlit as st
-from frontendData import session, User, Course, Enrollment
+from frontendQueries import student_enrollments
 import pandas as pd
 
 st.title("📚 My Courses Overview")
@@ -18,12 +18,12 @@ if not student_id:
     st.stop()
 
 try:
-    student_enrollments = session.query(Enrollment).filter_by(student_id=student_id).all()
+    enrollments = student_enrollments(student_id)
     active_courses_summary = []
     completed_courses_summary = []
 
-    if student_enrollments:
-        for enrollment in student_enrollments:
+    if enrollments:
+        for enrollment in enrollments:
             course = enrollment.course
             teacher_name = course.teacher.name if course and course.teacher else "N/A"
             course_summary_info = {
@@ -1,19 +1,136 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, ForeignKey, UniqueConstraint
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy import create_engine, event, Column, Integer, String, Boolean, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
+import streamlit as st
+import logging
 import os
+import threading
+import time
 
 MYSQL_HOST = os.getenv("MYSQL_HOST", "localhost")
 MYSQL_USER = os.getenv("MYSQL_USER", "user")
 MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "password")
 MYSQL_DATABASE = os.getenv("MYSQL_DATABASE", "Informations")
 MYSQL_PORT = os.getenv("MYSQL_PORT", "3306")
+# One pool is shared by every browser session of this Streamlit server; a script run holds at most one connection.
+MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", "10"))
+MYSQL_MAX_OVERFLOW = int(os.getenv("MYSQL_MAX_OVERFLOW", "20"))
+MYSQL_POOL_TIMEOUT_SECONDS = int(os.getenv("MYSQL_POOL_TIMEOUT_SECONDS", "30"))
+MYSQL_POOL_RECYCLE_SECONDS = int(os.getenv("MYSQL_POOL_RECYCLE_SECONDS", "3600"))
+MYSQL_SLOW_CHECKOUT_MS = float(os.getenv("MYSQL_SLOW_CHECKOUT_MS", "200"))
 
 SQLALCHEMY_DATABASE_URL = f"mysql+mysqlconnector://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_recycle=3600)
+logger = logging.getLogger(__name__)
+
+
+class PoolCheckoutMetrics:
+    """Counts pool checkouts and measures how long they wait for a free connection."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checkouts = 0
+        self._failures = 0
+        self._in_use = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def record_wait(self, wait):
+        with self._lock:
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+        if wait * 1000 >= MYSQL_SLOW_CHECKOUT_MS:
+            logger.warning(f"Waited {wait * 1000:.0f} ms for a MySQL connection; the pool may be too small.")
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+
+    def checked_out(self, *args):
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+
+    def checked_in(self, *args):
+        with self._lock:
+            self._in_use = max(0, self._in_use - 1)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "checkouts": self._checkouts,
+                "checkout_failures": self._failures,
+                "in_use": self._in_use,
+                "avg_checkout_wait_ms": round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                "max_checkout_wait_ms": round(self._wait_max * 1000, 3),
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times how long getting a connection takes, i.e. the wait for a free slot plus any connect."""
+
+    metrics = None
+
+    def _do_get(self):
+        started_at = time.monotonic()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            # Pool timeout or a failed connect.
+            self.metrics.record_failure()
+            raise
+        self.metrics.record_wait(time.monotonic() - started_at)
+        return connection
+
+    def recreate(self):
+        # Called when the pool is invalidated (e.g. the server restarted); keep counting into the same metrics.
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+@st.cache_resource
+def get_engine():
+    """The process-wide engine, created once and shared by all sessions and reruns of the app."""
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        poolclass=InstrumentedQueuePool,
+        pool_size=MYSQL_POOL_SIZE,
+        max_overflow=MYSQL_MAX_OVERFLOW,
+        pool_timeout=MYSQL_POOL_TIMEOUT_SECONDS,
+        pool_recycle=MYSQL_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=True,
+    )
+    metrics = PoolCheckoutMetrics()
+    engine.pool.metrics = metrics
+    event.listen(engine, "checkout", metrics.checked_out)
+    event.listen(engine, "checkin", metrics.checked_in)
+    return engine
+
+
+def pool_stats():
+    engine = get_engine()
+    return {
+        "pool_size": engine.pool.size(),
+        "max_overflow": MYSQL_MAX_OVERFLOW,
+        "checked_out": engine.pool.checkedout(),
+        "overflow": max(0, engine.pool.overflow()),
+        **engine.pool.metrics.stats(),
+    }
+
+
 Base = declarative_base()
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-session = SessionLocal()
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+
+def new_session():
+    return SessionLocal(bind=get_engine())
+
+
+# Streamlit runs each script run in its own thread, so the thread-scoped session is private to one user's run.
+# app.py calls session.remove() when the run ends (also on st.rerun()/st.stop()), which returns the connection and
+# drops the identity map; a rerun in the same thread then starts with a fresh session.
+session = scoped_session(new_session)
 
 class User(Base):
     __tablename__ = "users"
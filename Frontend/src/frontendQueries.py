@@ -0,0 +1,39 @@
+"""Read queries behind the frontend pages, each answered in a fixed number of round-trips.
+
+Pages list courses, enrollments and students; loading related rows lazily or counting per row would cost one query
+per course or student, so relationships are eager-loaded and counts are grouped here instead.
+"""
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from frontendData import session, User, Course, Enrollment
+
+
+def teacher_courses_with_counts(teacher_id):
+    """(course, number of enrolled students) for every course of a teacher, newest first, in one GROUP BY query."""
+    student_count = func.count(Enrollment.enrollment_id)
+    return (session.query(Course, student_count)
+            .outerjoin(Enrollment, Enrollment.course_id == Course.course_id)
+            .filter(Course.teacher_id == teacher_id)
+            .group_by(Course.course_id)
+            .order_by(Course.course_id.desc())
+            .all())
+
+
+def course_enrollments(course_id):
+    """Enrollments of a course with their students loaded in the same query."""
+    return (session.query(Enrollment)
+            .options(joinedload(Enrollment.student))
+            .filter(Enrollment.course_id == course_id)
+            .all())
+
+
+def student_enrollments(student_id):
+    """Enrollments of a student with their courses and the courses' teachers loaded in the same query."""
+    return (session.query(Enrollment)
+            .options(joinedload(Enrollment.course).joinedload(Course.teacher))
+            .filter(Enrollment.student_id == student_id)
+            .all())
+
+
+def students():
+    return session.query(User).filter_by(user_type="student").all()
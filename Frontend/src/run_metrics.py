@@ -0,0 +1,38 @@
+import os
+import threading
+from collections import deque
+
+# Number of recent script runs kept for the latency figures on the settings page.
+RUN_METRICS_WINDOW = int(os.getenv("RUN_METRICS_WINDOW", "500"))
+
+_lock = threading.Lock()
+_recent_seconds = deque(maxlen=RUN_METRICS_WINDOW)
+_total_runs = 0
+
+
+def record_run(seconds):
+    """Records the wall time of one script run (initial load or rerun) of app.py."""
+    global _total_runs
+    with _lock:
+        _recent_seconds.append(seconds)
+        _total_runs += 1
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run_stats():
+    with _lock:
+        recent = sorted(_recent_seconds)
+        total_runs = _total_runs
+    if not recent:
+        return {"runs": total_runs}
+    return {
+        "runs": total_runs,
+        "window": len(recent),
+        "avg_ms": round(sum(recent) / len(recent) * 1000, 1),
+        "p50_ms": round(_percentile(recent, 0.5) * 1000, 1),
+        "p95_ms": round(_percentile(recent, 0.95) * 1000, 1),
+        "max_ms": round(recent[-1] * 1000, 1),
+    }
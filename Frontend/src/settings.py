@@ -2,6 +2,8 @@ import streamlit as st
 import pandas as pd
 import os
 from pymongo import MongoClient
+from frontendData import pool_stats
+from run_metrics import run_stats
 
 st.title("⚙️ Application Settings")
 
@@ -24,10 +26,10 @@ st.info("These settings are primarily for display and debugging. Database passwo
 
 if st.button("Test Database Connections (from Frontend perspective)",
              key="settings_test_db_conn_btn"):
-    from frontendData import SessionLocal
+    from frontendData import new_session
     from frontendData import User
 
-    test_session = SessionLocal()
+    test_session = new_session()
     try:
         user_count = test_session.query(User).count()
         st.success(f"MySQL Connection OK. Found {user_count} users.")
@@ -46,6 +48,15 @@ if st.button("Test Database Connections (from Frontend perspective)",
     except Exception as e:
         st.error(f"MongoDB Connection Test FAILED: {e}")
 
+st.subheader("MySQL Connection Pool:")
+try:
+    st.table(pd.DataFrame(list(pool_stats().items()), columns=["Metric", "Value"]))
+except Exception as e:
+    st.error(f"Could not read MySQL pool statistics: {e}")
+
+st.subheader("Page Run Latency (this server process):")
+st.table(pd.DataFrame(list(run_stats().items()), columns=["Metric", "Value"]))
+
 st.markdown("---")
 
 st.subheader("Custom AI Service Configuration")
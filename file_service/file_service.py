@@ -0,0 +1,151 @@
+from flask import Flask, Response, request, jsonify
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo import errors as pymongo_errors
+from urllib.parse import quote
+from werkzeug.http import http_date
+import gridfs
+import logging
+import os
+import re
+
+from mongo_pool import PooledMongoClient
+from file_links import load_file_link_secret, verify_file_signature
+
+# --- Logger Setup ---
+logger = logging.getLogger(__name__)
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handler.setFormatter(formatter)
+    logger.addHandler(handler)
+logger.setLevel(logging.INFO)
+
+app = Flask(__name__)
+
+# --- MongoDB Configuration ---
+MONGO_HOST_ENV = os.getenv("MONGO_HOST", "mongodb-server")
+MONGO_FRONTEND_USER = os.getenv("MONGO_USER_FRONTEND", "root")
+MONGO_FRONTEND_PASSWORD = os.getenv("MONGO_PASSWORD_FRONTEND", "example")
+MONGO_FRONTEND_DB_NAME = os.getenv("MONGO_DB_NAME_FRONTEND", "grading_ai_frontend")
+MONGO_FRONTEND_URI = f"mongodb://{MONGO_FRONTEND_USER}:{MONGO_FRONTEND_PASSWORD}@{MONGO_HOST_ENV}:27017/{MONGO_FRONTEND_DB_NAME}?authSource=admin"
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "20"))
+
+# --- Download Configuration ---
+# Shared with the frontend, which signs the links this service accepts.
+FILE_LINK_SECRET = load_file_link_secret()
+# Bytes read from GridFS and written to the client at a time; GridFS stores files in 255 KiB chunks.
+STREAM_CHUNK_BYTES = int(os.getenv("STREAM_CHUNK_BYTES", str(255 * 1024)))
+SERVICE_PORT = int(os.getenv("FILE_SERVICE_PORT", "5004"))
+SINGLE_BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+frontend_mongo = PooledMongoClient("frontend", MONGO_FRONTEND_URI, max_pool_size=MONGO_MAX_POOL_SIZE)
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_byte_range(range_header, length):
+    """(start, end) with an inclusive end for a single "bytes=" range, or None to send the whole file.
+
+    Multi-range and malformed headers are ignored, which RFC 9110 allows; a range starting past the end raises
+    RangeNotSatisfiable.
+    """
+    match = SINGLE_BYTE_RANGE.match(range_header or "")
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if length == 0:
+        # No byte of an empty file can be selected, not even by a suffix range.
+        raise RangeNotSatisfiable()
+    if first == "":
+        suffix_length = int(last)
+        if suffix_length == 0:
+            raise RangeNotSatisfiable()
+        return max(0, length - suffix_length), length - 1
+    start = int(first)
+    end = min(int(last), length - 1) if last else length - 1
+    if start >= length or end < start:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+def stream_file(grid_out, start, end):
+    """Yields bytes start..end of a GridFS file, reading one chunk at a time instead of the whole file."""
+    try:
+        grid_out.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = grid_out.read(min(STREAM_CHUNK_BYTES, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        grid_out.close()
+
+
+@app.route('/health')
+def health_check():
+    return jsonify({"status": "ok", "message": "File service is healthy"}), 200
+
+
+@app.route('/mongo/stats')
+def mongo_stats():
+    return jsonify({"frontend": frontend_mongo.stats()}), 200
+
+
+@app.route('/files/<file_id>', methods=['GET', 'HEAD'])
+def download_file(file_id):
+    if not FILE_LINK_SECRET:
+        logger.error("No file link secret is configured; refusing downloads.")
+        return jsonify({"message": "Downloads are not configured"}), 503
+    if not verify_file_signature(FILE_LINK_SECRET, file_id, request.args.get("expires"), request.args.get("sig")):
+        return jsonify({"message": "Download link is invalid or has expired"}), 403
+    try:
+        grid_out = gridfs.GridFS(frontend_mongo.get()[MONGO_FRONTEND_DB_NAME]).get(ObjectId(file_id))
+    except (InvalidId, gridfs.errors.NoFile):
+        return jsonify({"message": f"File not found: {file_id}"}), 404
+    except pymongo_errors.ConnectionFailure as e:
+        frontend_mongo.mark_unhealthy()
+        logger.error(f"MongoDB unavailable while opening file {file_id}: {e}")
+        return jsonify({"message": "File storage is unavailable"}), 503
+
+    length = grid_out.length
+    etag = f'"{file_id}-{length}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": "private, max-age=3600",
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(grid_out.filename or file_id)}",
+    }
+    if grid_out.upload_date:
+        headers["Last-Modified"] = http_date(grid_out.upload_date)
+
+    # A Range is only honoured for the version of the file the client already has part of.
+    if_range = request.headers.get("If-Range")
+    range_header = request.headers.get("Range") if not if_range or if_range == etag else None
+    try:
+        byte_range = parse_byte_range(range_header, length)
+    except RangeNotSatisfiable:
+        grid_out.close()
+        return Response(status=416, headers={**headers, "Content-Range": f"bytes */{length}"})
+
+    status = 200
+    start, end = 0, length - 1
+    if byte_range:
+        status = 206
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    headers["Content-Length"] = str(end - start + 1 if length else 0)
+    if request.method == 'HEAD' or length == 0:
+        grid_out.close()
+        return Response(status=status, headers=headers, mimetype=grid_out.content_type or "application/octet-stream")
+    return Response(stream_file(grid_out, start, end), status=status, headers=headers,
+                    mimetype=grid_out.content_type or "application/octet-stream", direct_passthrough=True)
+
+
+if __name__ == '__main__':
+    logger.info(f"Starting file service on port {SERVICE_PORT}...")
+    app.run(host='0.0.0.0', port=SERVICE_PORT, threaded=True)
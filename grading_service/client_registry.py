@@ -0,0 +1,124 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+def api_key_fingerprint(api_key):
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+
+
+class ClientRegistry:
+    """Bounded, reusable API clients keyed by (base_url, sha256(api_key)).
+
+    Reusing a client keeps its HTTP keep-alive connections and TLS sessions. Clients are leased while in use, and
+    LRU or idle eviction only closes a client once its last lease has been released.
+    """
+
+    def __init__(self, factory, closer, max_clients=32, idle_seconds=600):
+        self._factory = factory
+        self._closer = closer
+        self._max_clients = max_clients
+        self._idle_seconds = idle_seconds
+        self._entries = OrderedDict()
+        self._pinned = set()
+        self._lock = threading.Lock()
+        self._counters = {"created": 0, "reused": 0, "evicted": 0}
+
+    def pin(self, base_url, api_key):
+        """Keeps the client for this configuration out of LRU and idle eviction (used for the default client)."""
+        with self._lock:
+            self._pinned.add((base_url, api_key_fingerprint(api_key)))
+
+    def acquire(self, base_url, api_key):
+        """Returns (client, release); call release() once the client is no longer used."""
+        key = (base_url, api_key_fingerprint(api_key))
+        to_close = []
+        with self._lock:
+            to_close.extend(self._expire_idle())
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {"client": self._factory(base_url, api_key), "leases": 0, "last_used": time.monotonic(),
+                         "evicted": False}
+                self._entries[key] = entry
+                self._counters["created"] += 1
+                to_close.extend(self._evict_overflow(keep=key))
+            else:
+                self._counters["reused"] += 1
+            self._entries.move_to_end(key)
+            entry["leases"] += 1
+        self._close_all(to_close)
+
+        released = []
+
+        def release():
+            if released:
+                return
+            released.append(True)
+            with self._lock:
+                entry["leases"] -= 1
+                entry["last_used"] = time.monotonic()
+                close_now = entry["evicted"] and entry["leases"] == 0
+            if close_now:
+                self._close_all([entry["client"]])
+
+        return entry["client"], release
+
+    @contextmanager
+    def lease(self, base_url, api_key):
+        client, release = self.acquire(base_url, api_key)
+        try:
+            yield client
+        finally:
+            release()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update({
+                "open_clients": len(self._entries),
+                "leased_clients": sum(1 for entry in self._entries.values() if entry["leases"]),
+                "max_clients": self._max_clients,
+                "idle_seconds": self._idle_seconds,
+            })
+        return stats
+
+    def _expire_idle(self):
+        # Caller holds self._lock.
+        now = time.monotonic()
+        expired = [key for key, entry in self._entries.items()
+                   if key not in self._pinned and entry["leases"] == 0
+                   and now - entry["last_used"] > self._idle_seconds]
+        return [self._detach(key) for key in expired]
+
+    def _evict_overflow(self, keep):
+        # Caller holds self._lock. Leased clients are detached now and closed when their last lease ends.
+        to_close = []
+        for key in list(self._entries.keys()):
+            if len(self._entries) <= self._max_clients:
+                break
+            if key == keep or key in self._pinned:
+                continue
+            client = self._detach(key)
+            if client is not None:
+                to_close.append(client)
+        return to_close
+
+    def _detach(self, key):
+        entry = self._entries.pop(key)
+        entry["evicted"] = True
+        self._counters["evicted"] += 1
+        return entry["client"] if entry["leases"] == 0 else None
+
+    def _close_all(self, clients):
+        for client in clients:
+            if client is None:
+                continue
+            try:
+                self._closer(client)
+            except Exception as e:
+                logger.warning(f"Failed to close evicted API client: {e}")
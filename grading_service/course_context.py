@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from submission_content import load_content
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_CATEGORIES = ("question_paper", "reference_material")
+
+
+class CourseContextCache:
+    """Caches the latest question paper and reference material per course.
+
+    An entry is trusted for revalidate_after_seconds. After that, one projection-only query per category checks
+    whether a newer upload exists before the (large) content is served again.
+    """
+
+    def __init__(self, collection_getter, revalidate_after_seconds=5.0, max_courses=256):
+        self._collection_getter = collection_getter
+        self._revalidate_after_seconds = revalidate_after_seconds
+        self._max_courses = max_courses
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._course_locks = {}
+        self._counters = {"hits": 0, "revalidations": 0, "loads": 0, "invalidations": 0}
+
+    def get(self, course_id):
+        """Returns {"question_paper": doc or None, "reference_material": doc or None}; docs hold only "content"."""
+        entry = self._fresh_entry(course_id)
+        if entry is not None:
+            return entry["documents"]
+
+        # One thread per course (re)loads; concurrent graders of the same course wait and reuse its result.
+        with self._course_lock(course_id):
+            entry = self._fresh_entry(course_id)
+            if entry is not None:
+                return entry["documents"]
+
+            collection = self._collection_getter()
+            fingerprint = self._fingerprint(collection, course_id)
+            with self._lock:
+                entry = self._entries.get(course_id)
+                if entry is not None and entry["fingerprint"] == fingerprint:
+                    entry["checked_at"] = time.monotonic()
+                    self._counters["revalidations"] += 1
+                    return entry["documents"]
+
+            documents = {}
+            for category, doc_id in zip(CONTEXT_CATEGORIES, fingerprint):
+                document = collection.find_one({"_id": doc_id}, {"content": 1}) if doc_id is not None else None
+                if document is not None:
+                    # Assembled from the pages collection once per load; callers keep reading doc["content"].
+                    document["content"] = load_content(collection, document)
+                documents[category] = document
+            with self._lock:
+                self._counters["loads"] += 1
+                self._entries[course_id] = {"fingerprint": fingerprint, "documents": documents,
+                                            "checked_at": time.monotonic()}
+                self._entries.move_to_end(course_id)
+                while len(self._entries) > self._max_courses:
+                    self._entries.popitem(last=False)
+            logger.info(f"Loaded grading context for course {course_id} (fingerprint {fingerprint}).")
+            return documents
+
+    def invalidate(self, course_id=None):
+        with self._lock:
+            if course_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(course_id, None)
+            self._counters["invalidations"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["cached_courses"] = len(self._entries)
+        stats["revalidate_after_seconds"] = self._revalidate_after_seconds
+        return stats
+
+    def _fresh_entry(self, course_id):
+        with self._lock:
+            entry = self._entries.get(course_id)
+            if entry is None or time.monotonic() - entry["checked_at"] > self._revalidate_after_seconds:
+                return None
+            self._entries.move_to_end(course_id)
+            self._counters["hits"] += 1
+            return entry
+
+    def _course_lock(self, course_id):
+        with self._lock:
+            return self._course_locks.setdefault(course_id, threading.Lock())
+
+    @staticmethod
+    def _fingerprint(collection, course_id):
+        """Ids of the newest question paper and reference material; fetches no content."""
+        fingerprint = []
+        for category in CONTEXT_CATEGORIES:
+            newest = collection.find_one({"course_id": course_id, "category": category}, {"_id": 1},
+                                         sort=[("processing_timestamp", -1), ("_id", -1)])
+            fingerprint.append(newest["_id"] if newest else None)
+        return tuple(fingerprint)
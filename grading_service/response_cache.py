@@ -0,0 +1,137 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from pymongo import errors as pymongo_errors
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(request_kwargs):
+    """Content address of a chat completion request: model, messages, response_format and temperature."""
+    key_material = {
+        "model": request_kwargs.get("model"),
+        "messages": request_kwargs.get("messages"),
+        "response_format": request_kwargs.get("response_format"),
+        "temperature": request_kwargs.get("temperature"),
+    }
+    return hashlib.sha256(json.dumps(key_material, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _utcnow():
+    return datetime.utcnow()
+
+
+class ResponseCache:
+    """Two-tier LLM response cache: an in-process LRU in front of a Mongo collection with TTL and size caps."""
+
+    def __init__(self, collection_getter, max_memory_entries=1024, ttl_seconds=7 * 24 * 3600,
+                 max_persistent_entries=50000, eviction_check_interval=100):
+        self._collection_getter = collection_getter
+        self._max_memory_entries = max_memory_entries
+        self._ttl_seconds = ttl_seconds
+        self._max_persistent_entries = max_persistent_entries
+        self._eviction_check_interval = eviction_check_interval
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts_since_eviction_check = 0
+        self._counters = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def ensure_indexes(self):
+        collection = self._collection_getter()
+        # MongoDB's TTL monitor removes entries older than ttl_seconds on its own.
+        collection.create_index("created_at", expireAfterSeconds=self._ttl_seconds)
+        collection.create_index("last_accessed_at")
+
+    def get(self, key):
+        now = _utcnow()
+        expired_before = now - timedelta(seconds=self._ttl_seconds)
+        with self._lock:
+            if key in self._memory:
+                response, created_at = self._memory[key]
+                if created_at > expired_before:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return response
+                del self._memory[key]
+
+        try:
+            # The TTL monitor only runs about once a minute, so expired entries it has not removed yet are skipped.
+            entry = self._collection_getter().find_one_and_update(
+                {"_id": key, "created_at": {"$gt": expired_before}},
+                {"$set": {"last_accessed_at": now}, "$inc": {"hits": 1}},
+                projection={"response": 1, "created_at": 1}
+            )
+        except pymongo_errors.PyMongoError as e:
+            logger.warning(f"Response cache lookup failed, treating as miss: {e}")
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["persistent_hits"] += 1
+            self._remember(key, entry["response"], entry["created_at"])
+        return entry["response"]
+
+    def put(self, key, response, model=None):
+        now = _utcnow()
+        with self._lock:
+            self._remember(key, response, now)
+            self._counters["stores"] += 1
+            self._puts_since_eviction_check += 1
+            check_eviction = self._puts_since_eviction_check >= self._eviction_check_interval
+            if check_eviction:
+                self._puts_since_eviction_check = 0
+
+        try:
+            self._collection_getter().update_one(
+                {"_id": key},
+                {"$set": {"response": response, "model": model, "size_bytes": len(response.encode("utf-8")),
+                          "created_at": now, "last_accessed_at": now},
+                 "$setOnInsert": {"hits": 0}},
+                upsert=True
+            )
+            if check_eviction:
+                self._evict_persistent()
+        except pymongo_errors.PyMongoError as e:
+            logger.warning(f"Response cache store failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            memory_entries = len(self._memory)
+        lookups = counters["memory_hits"] + counters["persistent_hits"] + counters["misses"]
+        hits = counters["memory_hits"] + counters["persistent_hits"]
+        counters.update({
+            "lookups": lookups,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": memory_entries,
+            "max_memory_entries": self._max_memory_entries,
+            "max_persistent_entries": self._max_persistent_entries,
+            "ttl_seconds": self._ttl_seconds,
+        })
+        return counters
+
+    def _remember(self, key, response, created_at):
+        # Caller holds self._lock. Entries keep their original creation time so they expire with the stored copy.
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_persistent(self):
+        collection = self._collection_getter()
+        overflow = collection.estimated_document_count() - self._max_persistent_entries
+        if overflow <= 0:
+            return
+        stale_ids = [entry["_id"] for entry in
+                     collection.find({}, {"_id": 1}).sort("last_accessed_at", 1).limit(overflow)]
+        if stale_ids:
+            deleted = collection.delete_many({"_id": {"$in": stale_ids}}).deleted_count
+            with self._lock:
+                self._counters["evictions"] += deleted
+            logger.info(f"Response cache evicted {deleted} least recently used entries.")
@@ -0,0 +1,268 @@
+from flask import Flask, request, jsonify
+from flask_restful import Resource, Api
+import os
+import re
+import json
+import math
+import time
+import uuid
+import random
+import hashlib
+import logging
+import threading
+
+app = Flask(__name__)
+api = Api(app)
+
+# --- Configuration ---
+# Offline, OpenAI-compatible stand-in for api.seedbox.ai. Point SEEDBOX_API_BASE_URL (grading_service) or BASE_URL
+# (Benchmarking scripts) at http://<host>:5010/v1. All settings can be changed at runtime via POST /mock/config.
+DEFAULT_CONFIG = {
+    "models": [m.strip() for m in os.getenv(
+        "MOCK_LLM_MODELS", "gpt-4o-mini,gpt-4o,qwen3-30b,qwen3-235b,gemma3-27b").split(",") if m.strip()],
+    # "fixed", "uniform", "normal" or "lognormal"; sampled once per request as time to first token
+    "latency_distribution": os.getenv("MOCK_LLM_LATENCY_DISTRIBUTION", "lognormal"),
+    "latency_mean_seconds": float(os.getenv("MOCK_LLM_LATENCY_MEAN_SECONDS", "1.5")),
+    "latency_stddev_seconds": float(os.getenv("MOCK_LLM_LATENCY_STDDEV_SECONDS", "0.5")),
+    "latency_min_seconds": float(os.getenv("MOCK_LLM_LATENCY_MIN_SECONDS", "0.05")),
+    "latency_max_seconds": float(os.getenv("MOCK_LLM_LATENCY_MAX_SECONDS", "30")),
+    # Added per completion token on top of the sampled latency; 0 disables generation time
+    "output_tokens_per_second": float(os.getenv("MOCK_LLM_OUTPUT_TOKENS_PER_SECOND", "0")),
+    "completion_tokens": int(os.getenv("MOCK_LLM_COMPLETION_TOKENS", "250")),
+    "rate_limit_probability": float(os.getenv("MOCK_LLM_RATE_LIMIT_PROBABILITY", "0")),
+    "server_error_probability": float(os.getenv("MOCK_LLM_SERVER_ERROR_PROBABILITY", "0")),
+    "server_error_status": int(os.getenv("MOCK_LLM_SERVER_ERROR_STATUS", "503")),
+    # Requests beyond this many in flight get a 429, like a provider at capacity; 0 means unlimited
+    "max_concurrency": int(os.getenv("MOCK_LLM_MAX_CONCURRENCY", "0")),
+    "retry_after_seconds": float(os.getenv("MOCK_LLM_RETRY_AFTER_SECONDS", "1")),
+    # Providers cache prompt prefixes in 128-token steps once the prefix is at least 1024 tokens
+    "prefix_cache_min_tokens": int(os.getenv("MOCK_LLM_PREFIX_CACHE_MIN_TOKENS", "1024")),
+    "seed": int(os.getenv("MOCK_LLM_SEED", "42")),
+}
+MOCK_LLM_PORT = int(os.getenv("MOCK_LLM_PORT", "5010"))
+
+GRADING_CRITERIA = ("relevance_accuracy", "reference_material", "grammar_word_choice", "logical_structure")
+MAX_POINTS_PATTERN = re.compile(r"Maximale Punktzahl:\**\s*([0-9]+(?:[.,][0-9]+)?)")
+FILLER_WORDS = ("the answer addresses the question and uses the material with a clear structure and mostly "
+                "correct terminology although some points could be explained in more detail").split()
+
+config = dict(DEFAULT_CONFIG)
+config_lock = threading.Lock()
+latency_rng = random.Random(config["seed"])
+state_lock = threading.Lock()
+in_flight = 0
+seen_prefixes = set()
+counters = {"requests": 0, "completed": 0, "rate_limited": 0, "server_errors": 0, "prompt_tokens": 0,
+            "cached_tokens": 0, "completion_tokens": 0}
+
+
+# --- Helpers ---
+def estimate_tokens(text):
+    # Same four-characters-per-token estimate the grading service uses for budgeting.
+    return (len(text) + 3) // 4
+
+
+def message_text(message):
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content
+
+
+def sample_latency(settings):
+    mean, stddev = settings["latency_mean_seconds"], settings["latency_stddev_seconds"]
+    distribution = settings["latency_distribution"]
+    with config_lock:
+        if distribution == "fixed":
+            latency = mean
+        elif distribution == "uniform":
+            latency = latency_rng.uniform(mean - stddev, mean + stddev)
+        elif distribution == "normal":
+            latency = latency_rng.gauss(mean, stddev)
+        else:
+            # Lognormal with the requested mean and standard deviation: the long tail real providers show.
+            sigma_squared = math.log(1 + (stddev / mean) ** 2) if mean > 0 else 0.0
+            latency = latency_rng.lognormvariate(math.log(mean) - sigma_squared / 2, math.sqrt(sigma_squared)) \
+                if mean > 0 else 0.0
+    return min(max(latency, settings["latency_min_seconds"]), settings["latency_max_seconds"])
+
+
+def filler_text(rng, word_count):
+    return " ".join(rng.choice(FILLER_WORDS) for _ in range(max(word_count, 1)))
+
+
+def build_content(messages, json_mode, completion_tokens, rng):
+    """Deterministic reply for a prompt: the grading schema, the benchmark schema, or plain text."""
+    prompt = "\n".join(message_text(m) for m in messages)
+    if "relevance_accuracy" in prompt:
+        words_per_justification = max(completion_tokens // (len(GRADING_CRITERIA) * 2), 5)
+        return json.dumps({criterion: {"score": rng.randint(40, 100),
+                                       "justification": filler_text(rng, words_per_justification)}
+                           for criterion in GRADING_CRITERIA})
+    if "awarded_points" in prompt:
+        match = MAX_POINTS_PATTERN.search(prompt)
+        max_points = float(match.group(1).replace(",", ".")) if match else 10.0
+        return json.dumps({"awarded_points": round(rng.uniform(0, max_points) * 2) / 2})
+    text = filler_text(rng, max(completion_tokens * 3 // 4, 1))
+    return json.dumps({"response": text}) if json_mode else text
+
+
+def cached_prefix_tokens(messages, settings):
+    """Tokens of the leading system message a provider would serve from its prefix cache."""
+    if not messages or messages[0].get("role") != "system":
+        return 0
+    system_text = message_text(messages[0])
+    prefix_tokens = estimate_tokens(system_text)
+    if prefix_tokens < settings["prefix_cache_min_tokens"]:
+        return 0
+    prefix_hash = hashlib.sha256(system_text.encode("utf-8")).hexdigest()
+    with state_lock:
+        seen = prefix_hash in seen_prefixes
+        seen_prefixes.add(prefix_hash)
+    return (prefix_tokens // 128) * 128 if seen else 0
+
+
+def error_response(message, error_type, status_code, retry_after=None):
+    headers = {"Retry-After": f"{retry_after:g}"} if retry_after else {}
+    return {"error": {"message": message, "type": error_type, "code": status_code}}, status_code, headers
+
+
+def current_config():
+    with config_lock:
+        return dict(config)
+
+
+# --- API Resources ---
+class ChatCompletions(Resource):
+    def post(self):
+        global in_flight
+        data = request.get_json(silent=True)
+        if not data or not data.get("messages"):
+            return error_response("'messages' is required.", "invalid_request_error", 400)
+        settings = current_config()
+        model = data.get("model") or settings["models"][0]
+        if model not in settings["models"] and model != "auto":
+            return error_response(f"The model '{model}' does not exist.", "invalid_request_error", 404)
+
+        with state_lock:
+            counters["requests"] += 1
+            in_flight += 1
+            over_capacity = 0 < settings["max_concurrency"] < in_flight
+        try:
+            with config_lock:
+                fault_roll = latency_rng.random()
+            if over_capacity or fault_roll < settings["rate_limit_probability"]:
+                with state_lock:
+                    counters["rate_limited"] += 1
+                return error_response("Rate limit reached for requests.", "rate_limit_error", 429,
+                                      settings["retry_after_seconds"])
+            if fault_roll < settings["rate_limit_probability"] + settings["server_error_probability"]:
+                with state_lock:
+                    counters["server_errors"] += 1
+                return error_response("The server had an error while processing your request.", "server_error",
+                                      settings["server_error_status"])
+
+            messages = data["messages"]
+            # Content only depends on the request and the seed, so repeated runs grade identically.
+            content_seed = hashlib.sha256(
+                (json.dumps(messages, sort_keys=True) + model + str(settings["seed"])).encode("utf-8")).hexdigest()
+            rng = random.Random(content_seed)
+            completion_tokens_target = int(data.get("max_tokens") or settings["completion_tokens"])
+            json_mode = (data.get("response_format") or {}).get("type") in ("json_object", "json_schema")
+            content = build_content(messages, json_mode, completion_tokens_target, rng)
+
+            prompt_tokens = sum(estimate_tokens(message_text(m)) + 4 for m in messages)
+            cached_tokens = cached_prefix_tokens(messages, settings)
+            completion_tokens = estimate_tokens(content)
+            latency = sample_latency(settings)
+            if settings["output_tokens_per_second"] > 0:
+                latency += completion_tokens / settings["output_tokens_per_second"]
+            time.sleep(latency)
+
+            with state_lock:
+                counters["completed"] += 1
+                counters["prompt_tokens"] += prompt_tokens
+                counters["cached_tokens"] += cached_tokens
+                counters["completion_tokens"] += completion_tokens
+            return {
+                "id": f"chatcmpl-mock-{uuid.uuid4().hex[:24]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens,
+                          "prompt_tokens_details": {"cached_tokens": cached_tokens}},
+                "system_fingerprint": "mock-llm",
+            }, 200
+        finally:
+            with state_lock:
+                in_flight -= 1
+
+
+class Models(Resource):
+    def get(self):
+        models = current_config()["models"]
+        # "data" is the OpenAI list format; "chat_models" is what Seedbox's /models returns (Benchmarking/getmodels.py).
+        return {"object": "list",
+                "data": [{"id": m, "object": "model", "created": 0, "owned_by": "mock-llm"} for m in models],
+                "chat_models": models}, 200
+
+
+class MockConfig(Resource):
+    def get(self):
+        return current_config(), 200
+
+    def post(self):
+        global latency_rng
+        data = request.get_json(silent=True) or {}
+        reset = data.pop("reset", False)
+        unknown = sorted(set(data) - set(DEFAULT_CONFIG))
+        if unknown:
+            return {'message': f'Unknown settings: {", ".join(unknown)}'}, 400
+        with config_lock:
+            if reset:
+                config.clear()
+                config.update(DEFAULT_CONFIG)
+            for key, value in data.items():
+                config[key] = type(DEFAULT_CONFIG[key])(value) if not isinstance(DEFAULT_CONFIG[key], list) else value
+            latency_rng = random.Random(config["seed"])
+            updated = dict(config)
+        app.logger.info(f"Mock LLM configuration updated: {data}")
+        return updated, 200
+
+
+# Both with and without /v1 so either style of base URL works.
+api.add_resource(ChatCompletions, '/v1/chat/completions', '/chat/completions')
+api.add_resource(Models, '/v1/models', '/models')
+api.add_resource(MockConfig, '/mock/config')
+
+
+@app.route('/mock/stats')
+def mock_stats():
+    with state_lock:
+        stats = {**counters, "in_flight": in_flight, "distinct_cached_prefixes": len(seen_prefixes)}
+    return jsonify(stats), 200
+
+
+@app.route('/mock/reset', methods=['POST'])
+def mock_reset():
+    global latency_rng
+    with state_lock:
+        for key in counters:
+            counters[key] = 0
+        seen_prefixes.clear()
+    with config_lock:
+        latency_rng = random.Random(config["seed"])
+    return jsonify({"message": "Mock LLM counters and prefix cache reset."}), 200
+
+
+@app.route('/health')
+def health_check():
+    return jsonify({"status": "ok", "message": "Mock LLM server is running"}), 200
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    app.run(host='0.0.0.0', port=MOCK_LLM_PORT, threaded=True)
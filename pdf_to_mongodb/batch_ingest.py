@@ -0,0 +1,361 @@
+"""Batch ingestion of many PDFs into the Exams DB, e.g. to back-fill a semester of scanned exams.
+
+Input is a directory of PDFs (metadata from the command line, optionally the student from the file name) or a
+CSV/JSONL manifest with one row per PDF. Documents are extracted in parallel worker processes, stored with
+insert_many, and every stored document is appended to a checkpoint file so an interrupted run resumes where it
+stopped:
+
+    python batch_ingest.py --manifest /app/pdfs/semester.csv --checkpoint /app/pdfs/semester.checkpoint.jsonl
+    python batch_ingest.py --dir /app/pdfs/exam1 --course-id 7 --course "Law 101" --category answer_sheet \\
+        --username teacher1 --teacher teacher1 --filename-pattern "(?P<student_id>\\d+)_(?P<student_name>[^.]+)"
+"""
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bson.objectid import ObjectId
+from pymongo import errors as pymongo_errors
+
+import pdf_to_mongodb as ingest
+
+logger = ingest.logger
+
+CATEGORIES = ("question_paper", "answer_sheet", "reference_material")
+# Manifest columns; only pdf is required if the rest is given on the command line.
+MANIFEST_FIELDS = ("pdf", "course_id", "course", "category", "username", "teacher", "student_name", "student_id",
+                   "lang")
+DEFAULT_INSERT_BATCH_SIZE = 50
+
+
+def read_manifest(path):
+    """Rows of a CSV (with a header) or JSONL manifest; relative pdf paths are relative to the manifest."""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    for row in rows:
+        unknown = set(row) - set(MANIFEST_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown manifest columns: {', '.join(sorted(unknown))}")
+        if row.get("pdf") and not os.path.isabs(row["pdf"]):
+            row["pdf"] = os.path.join(base_dir, row["pdf"])
+    return rows
+
+
+def scan_directory(path, filename_pattern=None):
+    """One row per PDF below path, in a stable order; filename_pattern's named groups become row fields."""
+    pattern = re.compile(filename_pattern) if filename_pattern else None
+    rows = []
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            if not name.lower().endswith(".pdf"):
+                continue
+            row = {"pdf": os.path.join(root, name)}
+            if pattern:
+                match = pattern.search(name)
+                if not match:
+                    logger.warning(f"Skipping {name}: file name does not match --filename-pattern.")
+                    continue
+                row.update({key: value for key, value in match.groupdict().items() if value})
+            rows.append(row)
+    return sorted(rows, key=lambda row: row["pdf"])
+
+
+def complete_rows(rows, defaults):
+    """Fills rows with the command-line defaults and validates them; returns (valid rows, errors)."""
+    valid, errors = [], []
+    for row in rows:
+        row = {**defaults, **{key: value for key, value in row.items() if value not in (None, "")}}
+        missing = [field for field in ("pdf", "course_id", "course", "category", "username", "teacher")
+                   if not row.get(field)]
+        if missing:
+            errors.append(f"{row.get('pdf', '<no pdf>')}: missing {', '.join(missing)}")
+        elif row["category"] not in CATEGORIES:
+            errors.append(f"{row['pdf']}: invalid category '{row['category']}'")
+        elif not os.path.exists(row["pdf"]):
+            errors.append(f"{row['pdf']}: file not found")
+        else:
+            row["course_id"] = str(row["course_id"])
+            row["key"] = row_key(row)
+            valid.append(row)
+    return valid, errors
+
+
+def row_key(row):
+    # Identifies a row across runs: the same file may legitimately be ingested for another course or student.
+    return "|".join([os.path.abspath(row["pdf"]), row["course_id"], row["category"], str(row.get("student_id") or "")])
+
+
+def load_checkpoint(path):
+    """Keys of the rows a previous run stored."""
+    done = set()
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["key"])
+                except (ValueError, KeyError):
+                    # A line cut short by the interruption itself.
+                    continue
+    return done
+
+
+def _init_batch_worker(log_level):
+    logger.setLevel(log_level)
+
+
+def extract_row(row, options):
+    """Runs in a worker process: extracts one PDF and returns its Exams DB document, its pages and the time taken."""
+    start_time = time.monotonic()
+    pages = ingest.extract_pages(pdf_source=row["pdf"], ocr_threshold=options["ocr_threshold"],
+                                 language=row.get("lang") or options["lang"], ocr_dpi=options["ocr_dpi"],
+                                 workers=options["ocr_workers"], page_timeout=options["ocr_page_timeout"],
+                                 document_timeout=options["ocr_document_timeout"],
+                                 cache=ingest.ocr_cache if options["use_ocr_cache"] else None,
+                                 adaptive_dpi=options["adaptive_dpi"], ocr_mode=options["ocr_mode"])
+    document = ingest.cli_submission_document(row["pdf"], pages, row["course_id"], row["course"], row["category"],
+                                              row["username"], row["teacher"],
+                                              row.get("student_name") or "N/A", row.get("student_id"))
+    document["batch_key"] = row["key"]
+    return document, pages, time.monotonic() - start_time
+
+
+class BatchWriter:
+    """Buffers extracted documents, stores them and their pages with insert_many and checkpoints them."""
+
+    def __init__(self, collection, checkpoint_path, batch_size):
+        self._collection = collection
+        self._pages_collection = collection.database[ingest.PAGES_COLLECTION_NAME]
+        self._checkpoint = open(checkpoint_path, "a", encoding="utf-8") if checkpoint_path else None
+        self._batch_size = batch_size
+        self._buffer = []
+        self.stored = []
+        self.failed = []
+
+    def add(self, document, pages):
+        document["_id"] = ObjectId()
+        self._buffer.append((document, pages))
+        if len(self._buffer) >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        buffered, self._buffer = self._buffer, []
+        documents = [document for document, _ in buffered]
+        page_documents = [page for document, pages in buffered for page in ingest.page_documents(document["_id"], pages)]
+        # index in documents -> why it was not stored
+        failures = {}
+        # Submissions that may or may not have been stored; their pages must stay.
+        unknown_ids = set()
+        index_by_id = {document["_id"]: i for i, document in enumerate(documents)}
+        if page_documents:
+            try:
+                # Pages first, so a reader never finds a submission whose pages are still missing.
+                self._pages_collection.insert_many(page_documents, ordered=False)
+            except pymongo_errors.BulkWriteError as e:
+                # A submission is only stored with all of its pages.
+                for error in e.details.get("writeErrors", []):
+                    failures[index_by_id[page_documents[error["index"]]["submission_id"]]] = error.get("errmsg")
+            except pymongo_errors.PyMongoError as e:
+                failures = {i: f"storing pages failed: {e}" for i in range(len(documents))}
+        remaining = [document for i, document in enumerate(documents) if i not in failures]
+        if remaining:
+            try:
+                # Unordered: one bad document does not stop the rest of the batch.
+                self._collection.insert_many(remaining, ordered=False)
+            except pymongo_errors.BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    failures[index_by_id[remaining[error["index"]]["_id"]]] = error.get("errmsg")
+            except pymongo_errors.PyMongoError as e:
+                remaining_ids = [document["_id"] for document in remaining]
+                try:
+                    # The connection may have dropped part-way through: whatever did get stored is kept.
+                    unstored_ids = set(remaining_ids) - set(
+                        self._collection.distinct("_id", {"_id": {"$in": remaining_ids}}))
+                except pymongo_errors.PyMongoError:
+                    # Not checkpointed either way; a rerun skips those it finds by batch_key.
+                    unstored_ids = unknown_ids = set(remaining_ids)
+                failures.update((index_by_id[document_id], str(e)) for document_id in unstored_ids)
+        if failures:
+            self.failed.extend((documents[i]["batch_key"], reason) for i, reason in sorted(failures.items()))
+            self._delete_pages([documents[i]["_id"] for i in failures if documents[i]["_id"] not in unknown_ids])
+        failed_indexes = set(failures)
+        stored = [(document, pages) for i, (document, pages) in enumerate(buffered) if i not in failed_indexes]
+        # Only what the follow-up steps need, so a long run does not keep every document's text in memory.
+        self.stored.extend({"_id": document["_id"], "course_id": document["course_id"],
+                            "category": document["category"],
+                            "content": ingest.pages_to_markdown(pages)
+                            if document["category"] == "reference_material" else None}
+                           for document, pages in stored)
+        stored = [document for document, _ in stored]
+        if self._checkpoint:
+            for document in stored:
+                self._checkpoint.write(json.dumps({"key": document["batch_key"], "id": str(document["_id"])}) + "\n")
+            self._checkpoint.flush()
+            os.fsync(self._checkpoint.fileno())
+        logger.info(f"Stored {len(stored)} documents ({len(self.stored)} so far).")
+
+    def _delete_pages(self, submission_ids):
+        """Removes the pages of submissions that were not stored, so a rerun does not leave them orphaned."""
+        if not submission_ids:
+            return
+        try:
+            self._pages_collection.delete_many({"submission_id": {"$in": submission_ids}})
+        except pymongo_errors.PyMongoError as e:
+            logger.error(f"Could not delete the pages of {len(submission_ids)} unstored submissions "
+                         f"({[str(i) for i in submission_ids]}): {e}")
+
+    def close(self):
+        self.flush()
+        if self._checkpoint:
+            self._checkpoint.close()
+
+
+def run_batch(rows, options, jobs, checkpoint_path, insert_batch_size):
+    """Extracts and stores rows; returns a summary with throughput figures."""
+    collection = ingest.get_exams_client()[ingest.MONGO_EXAMS_DB_NAME][ingest.MONGO_EXAMS_COLLECTION_NAME]
+    done = load_checkpoint(checkpoint_path)
+    pending = [row for row in rows if row["key"] not in done]
+    if pending:
+        # Stored after the last checkpoint write, e.g. killed between insert_many and the fsync.
+        already_stored = set(collection.distinct("batch_key", {"batch_key": {"$in": [row["key"] for row in pending]}}))
+        done |= already_stored
+        pending = [row for row in pending if row["key"] not in already_stored]
+    logger.info(f"Batch: {len(rows)} documents, {len(rows) - len(pending)} already stored, {len(pending)} to process "
+                f"with {jobs} worker process(es).")
+
+    writer = BatchWriter(collection, checkpoint_path, insert_batch_size)
+    extraction_failures = []
+    total_pages = 0
+    start_time = time.monotonic()
+    context = multiprocessing.get_context(
+        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+    executor = ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=_init_batch_worker,
+                                   initargs=(options["worker_log_level"],))
+    try:
+        futures = {executor.submit(extract_row, row, options): row for row in pending}
+        for finished, future in enumerate(as_completed(futures), 1):
+            row = futures[future]
+            try:
+                document, pages, seconds = future.result()
+            except Exception as e:
+                logger.error(f"Extraction failed for {row['pdf']}: {type(e).__name__}: {e}")
+                extraction_failures.append((row["key"], str(e)))
+                continue
+            page_count = len(pages)
+            total_pages += page_count
+            writer.add(document, pages)
+            elapsed = time.monotonic() - start_time
+            logger.info(f"[{finished}/{len(pending)}] {os.path.basename(row['pdf'])}: {page_count} pages in "
+                        f"{seconds:.1f}s ({finished / elapsed:.2f} docs/s overall).")
+    finally:
+        # On an interruption, documents not started yet are dropped (the next run picks them up) while whatever
+        # was extracted is still stored and checkpointed.
+        executor.shutdown(wait=True, cancel_futures=True)
+        writer.close()
+    elapsed = time.monotonic() - start_time
+
+    for course_id, document_id, content in [(d["course_id"], d["_id"], d["content"]) for d in writer.stored
+                                            if d["category"] == "reference_material"]:
+        ingest.store_reference_index(course_id, document_id, content)
+    for course_id in sorted({d["course_id"] for d in writer.stored if d["category"] in ingest.COURSE_CONTEXT_CATEGORIES}):
+        ingest.notify_course_context_changed(course_id)
+
+    return {
+        "documents": len(rows),
+        "skipped": len(rows) - len(pending),
+        "stored": len(writer.stored),
+        "failed": len(extraction_failures) + len(writer.failed),
+        "failures": extraction_failures + writer.failed,
+        "pages": total_pages,
+        "elapsed_seconds": round(elapsed, 2),
+        "docs_per_second": round(len(writer.stored) / elapsed, 3) if elapsed > 0 else 0.0,
+        "pages_per_second": round(total_pages / elapsed, 3) if elapsed > 0 else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch CLI: extract/OCR many PDFs and bulk-insert them into MongoDB")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", help="Directory of PDFs (searched recursively)")
+    source.add_argument("--manifest", help=f"CSV (with header) or JSONL manifest; columns: {', '.join(MANIFEST_FIELDS)}")
+    parser.add_argument("--filename-pattern",
+                        help="--dir only: regex whose named groups (e.g. student_id, student_name) are taken from "
+                             "each file name")
+    parser.add_argument("--checkpoint", help="File recording stored documents; rerun with the same file to resume "
+                                             "(default: <dir or manifest>.checkpoint.jsonl)")
+    parser.add_argument("--jobs", type=int, default=ingest.OCR_WORKERS,
+                        help="Documents processed in parallel, one worker process each")
+    parser.add_argument("--insert-batch-size", type=int, default=DEFAULT_INSERT_BATCH_SIZE,
+                        help="Documents per insert_many")
+    for field, help_text in (("course-id", "Course ID"), ("course", "Course name"), ("username", "Uploader's username"),
+                             ("teacher", "Teacher's username for the course"), ("student-name", "Name of the student"),
+                             ("student-id", "Student ID")):
+        parser.add_argument(f"--{field}", help=f"{help_text} for rows that do not set it")
+    parser.add_argument("--category", choices=CATEGORIES, help="Type of document for rows that do not set it")
+    parser.add_argument("--lang", default="eng", help="Tesseract language for OCR (e.g., eng, deu)")
+    parser.add_argument("--ocr-threshold", type=int, default=20, help="Char count threshold for OCR attempt")
+    parser.add_argument("--ocr-dpi", type=int, default=300,
+                        help="DPI for OCR rendering (the highest DPI tried when adaptive DPI is on)")
+    parser.add_argument("--no-adaptive-dpi", action="store_true",
+                        help="OCR every page at --ocr-dpi instead of trying lower DPIs first")
+    parser.add_argument("--ocr-mode", choices=ingest.OCR_MODES, default=ingest.OCR_MODE,
+                        help="'regions' OCRs only images without a text layer, 'page' OCRs whole pages")
+    parser.add_argument("--ocr-workers", type=int, default=1,
+                        help="OCR processes per document; keep at 1 when --jobs already uses the CPUs")
+    parser.add_argument("--ocr-page-timeout", type=float, default=ingest.OCR_PAGE_TIMEOUT_SECONDS,
+                        help="Seconds before OCR of a single page is abandoned (parallel OCR only)")
+    parser.add_argument("--ocr-document-timeout", type=float, default=ingest.OCR_DOCUMENT_TIMEOUT_SECONDS,
+                        help="Seconds before parallel OCR of one document is abandoned (0 = no limit)")
+    parser.add_argument("--no-ocr-cache", action="store_true", help="Always OCR, ignoring cached results")
+    parser.add_argument("--verbose", action="store_true", help="Log per-page progress from the worker processes")
+    args = parser.parse_args()
+
+    rows = read_manifest(args.manifest) if args.manifest else scan_directory(args.dir, args.filename_pattern)
+    defaults = {"course_id": args.course_id, "course": args.course, "category": args.category,
+                "username": args.username, "teacher": args.teacher, "student_name": args.student_name,
+                "student_id": args.student_id}
+    rows, errors = complete_rows(rows, {key: value for key, value in defaults.items() if value})
+    for error in errors:
+        print(f"Skipping {error}", file=sys.stderr)
+    if not rows:
+        print("Batch Error: no documents to process.", file=sys.stderr)
+        sys.exit(1)
+
+    checkpoint_path = args.checkpoint or f"{os.path.abspath(args.manifest or args.dir).rstrip(os.sep)}.checkpoint.jsonl"
+    options = {"ocr_threshold": args.ocr_threshold, "lang": args.lang, "ocr_dpi": args.ocr_dpi,
+               "ocr_workers": args.ocr_workers, "ocr_page_timeout": args.ocr_page_timeout,
+               "ocr_document_timeout": args.ocr_document_timeout,
+               "use_ocr_cache": ingest.OCR_CACHE_ENABLED and not args.no_ocr_cache,
+               "adaptive_dpi": ingest.OCR_ADAPTIVE_DPI and not args.no_adaptive_dpi, "ocr_mode": args.ocr_mode,
+               "worker_log_level": logging.INFO if args.verbose else logging.WARNING}
+    try:
+        ingest.ensure_exams_indexes()
+        summary = run_batch(rows, options, max(1, args.jobs), checkpoint_path, max(1, args.insert_batch_size))
+    except KeyboardInterrupt:
+        print(f"Interrupted; rerun with --checkpoint {checkpoint_path} to resume.", file=sys.stderr)
+        sys.exit(130)
+    except Exception as e:
+        print(f"Batch Error: {type(e).__name__} - {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+    for key, error in summary.pop("failures"):
+        print(f"Failed: {key}: {error}", file=sys.stderr)
+    print(f"Stored {summary['stored']} of {summary['documents']} documents ({summary['skipped']} from earlier runs, "
+          f"{summary['failed']} failed) in {summary['elapsed_seconds']:.1f}s: {summary['docs_per_second']:.2f} docs/s, "
+          f"{summary['pages']} pages at {summary['pages_per_second']:.2f} pages/s. Checkpoint: {checkpoint_path}")
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+import fitz  # PyMuPDF
+from pymongo import errors as pymongo_errors
+
+logger = logging.getLogger(__name__)
+
+HASH_READ_CHUNK_BYTES = 1024 * 1024
+
+
+def ocr_settings_fingerprint(language, ocr_dpi, ocr_threshold=None):
+    # OCR output depends on these settings as much as on the content, so they are part of every key.
+    return f"lang={language};dpi={ocr_dpi};threshold={ocr_threshold}"
+
+
+def document_cache_key(pdf_source, settings_fingerprint):
+    """SHA-256 of the PDF bytes (a path is read in chunks) plus the OCR settings."""
+    digest = hashlib.sha256()
+    if isinstance(pdf_source, (bytes, bytearray)):
+        digest.update(pdf_source)
+    else:
+        with open(pdf_source, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_READ_CHUNK_BYTES), b""):
+                digest.update(chunk)
+    digest.update(settings_fingerprint.encode("utf-8"))
+    return "doc:" + digest.hexdigest()
+
+
+def page_cache_key(page, settings_fingerprint, hash_dpi):
+    """SHA-256 of the page rendered in grayscale at hash_dpi plus the OCR settings.
+
+    Rendering is far cheaper than OCR and catches the same page inside different PDFs (e.g. a question paper
+    re-exported for another course).
+    """
+    pixmap = page.get_pixmap(dpi=hash_dpi, colorspace=fitz.csGRAY, alpha=False)
+    digest = hashlib.sha256()
+    digest.update(f"{pixmap.width}x{pixmap.height};".encode("ascii"))
+    digest.update(pixmap.samples)
+    digest.update(settings_fingerprint.encode("utf-8"))
+    return "page:" + digest.hexdigest()
+
+
+class OCRCache:
+    """Content-addressed cache of OCR results in a Mongo collection, evicted by age (TTL index) and total size."""
+
+    def __init__(self, collection_getter, ttl_seconds=90 * 24 * 3600, max_total_bytes=512 * 1024 * 1024,
+                 eviction_check_interval=200):
+        self._collection_getter = collection_getter
+        self._ttl_seconds = ttl_seconds
+        self._max_total_bytes = max_total_bytes
+        self._eviction_check_interval = eviction_check_interval
+        self._lock = threading.Lock()
+        self._puts_since_eviction_check = 0
+        self._counters = {"document_hits": 0, "document_misses": 0, "page_hits": 0, "page_misses": 0,
+                          "stores": 0, "evictions": 0}
+
+    def ensure_indexes(self):
+        collection = self._collection_getter()
+        # MongoDB's TTL monitor removes entries that have not been used for ttl_seconds.
+        collection.create_index("last_accessed_at", expireAfterSeconds=self._ttl_seconds)
+
+    def get_document(self, key):
+        """Returns the cached page records of a whole document, or None."""
+        entry = self._touch_many([key]).get(key)
+        # Entries written before page records were cached only hold texts; they are refreshed on the next store.
+        pages = entry.get("pages") if entry else None
+        with self._lock:
+            self._counters["document_hits" if pages is not None else "document_misses"] += 1
+        return pages
+
+    def get_pages(self, keys):
+        """Returns {key: {"text", "ocr_dpi", "ocr_quality"}} for the cached pages among keys."""
+        entries = self._touch_many(keys)
+        with self._lock:
+            hits = sum(key in entries for key in keys)
+            self._counters["page_hits"] += hits
+            self._counters["page_misses"] += len(keys) - hits
+        return {key: {"text": entry["text"], "ocr_dpi": entry.get("ocr_dpi"), "ocr_quality": entry.get("ocr_quality")}
+                for key, entry in entries.items()}
+
+    def put_document(self, key, pages):
+        self._put(key, {"kind": "document", "pages": pages},
+                  sum(len(page["text"].encode("utf-8")) for page in pages))
+
+    def put_page(self, key, text, ocr_dpi=None, ocr_quality=None):
+        self._put(key, {"kind": "page", "text": text, "ocr_dpi": ocr_dpi, "ocr_quality": ocr_quality},
+                  len(text.encode("utf-8")))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        for kind in ("document", "page"):
+            lookups = stats[f"{kind}_hits"] + stats[f"{kind}_misses"]
+            stats[f"{kind}_hit_rate"] = round(stats[f"{kind}_hits"] / lookups, 4) if lookups else 0.0
+        stats.update({"ttl_seconds": self._ttl_seconds, "max_total_bytes": self._max_total_bytes})
+        return stats
+
+    def _touch_many(self, keys):
+        if not keys:
+            return {}
+        try:
+            collection = self._collection_getter()
+            entries = {entry["_id"]: entry for entry in collection.find({"_id": {"$in": list(keys)}})}
+            if entries:
+                collection.update_many({"_id": {"$in": list(entries)}},
+                                       {"$set": {"last_accessed_at": datetime.utcnow()}, "$inc": {"hits": 1}})
+            return entries
+        except pymongo_errors.PyMongoError as e:
+            logger.warning(f"OCR cache lookup failed, treating as miss: {e}")
+            return {}
+
+    def _put(self, key, fields, size_bytes):
+        with self._lock:
+            self._counters["stores"] += 1
+            self._puts_since_eviction_check += 1
+            check_eviction = self._puts_since_eviction_check >= self._eviction_check_interval
+            if check_eviction:
+                self._puts_since_eviction_check = 0
+
+        now = datetime.utcnow()
+        try:
+            self._collection_getter().update_one(
+                {"_id": key},
+                {"$set": {**fields, "size_bytes": size_bytes, "created_at": now, "last_accessed_at": now},
+                 "$setOnInsert": {"hits": 0}},
+                upsert=True
+            )
+            if check_eviction:
+                self._evict_to_size()
+        except pymongo_errors.PyMongoError as e:
+            logger.warning(f"OCR cache store failed: {e}")
+
+    def _evict_to_size(self):
+        collection = self._collection_getter()
+        totals = list(collection.aggregate([{"$group": {"_id": None, "total": {"$sum": "$size_bytes"}}}]))
+        overflow = (totals[0]["total"] if totals else 0) - self._max_total_bytes
+        if overflow <= 0:
+            return
+        stale_ids, freed = [], 0
+        for entry in collection.find({}, {"_id": 1, "size_bytes": 1}).sort("last_accessed_at", 1):
+            stale_ids.append(entry["_id"])
+            freed += entry.get("size_bytes", 0)
+            if freed >= overflow:
+                break
+        deleted = collection.delete_many({"_id": {"$in": stale_ids}}).deleted_count
+        with self._lock:
+            self._counters["evictions"] += deleted
+        logger.info(f"OCR cache evicted {deleted} least recently used entries ({freed / 1e6:.1f} MB).")
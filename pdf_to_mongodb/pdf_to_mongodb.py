@@ -1,7 +1,9 @@
 import fitz  # PyMuPDF
-from pymongo import MongoClient, errors as pymongo_errors
+from pymongo import ReturnDocument, errors as pymongo_errors
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
 import os
+import re
 from datetime import datetime
 import logging
 from flask import Flask, request, jsonify
@@ -10,6 +12,17 @@ import tempfile
 import gridfs
 import sys
 import argparse
+import requests
+import time
+import multiprocessing
+import resource
+from contextlib import contextmanager, nullcontext
+import threading
+import queue
+from reference_index import build_index
+from mongo_pool import PooledMongoClient
+from submission_content import PAGES_COLLECTION_NAME, CONTENT_PREVIEW_CHARS, join_page_texts, ensure_page_indexes
+from ocr_cache import OCRCache, ocr_settings_fingerprint, document_cache_key, page_cache_key
 
 # --- Logger Setup ---
 logger = logging.getLogger(__name__)
@@ -36,173 +49,893 @@ MONGO_EXAMS_USER = os.getenv("MONGO_INITDB_ROOT_USERNAME", "root")
 MONGO_EXAMS_PASSWORD = os.getenv("MONGO_INITDB_ROOT_PASSWORD", "example")
 MONGO_EXAMS_DB_NAME = "Exams"
 MONGO_EXAMS_COLLECTION_NAME = "pdf_submissions"
+MONGO_REFERENCE_INDEX_COLLECTION_NAME = "reference_index"
+MONGO_OCR_CACHE_COLLECTION_NAME = "ocr_cache"
+MONGO_PROCESSING_JOBS_COLLECTION_NAME = "processing_jobs"
 MONGO_EXAMS_URI = f"mongodb://{MONGO_EXAMS_USER}:{MONGO_EXAMS_PASSWORD}@{MONGO_HOST_ENV}:27017/{MONGO_EXAMS_DB_NAME}?authSource=admin"
 
+# One pooled client per database server for the whole process (API handlers, processing workers and the CLI)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv("MONGO_HEALTH_CHECK_INTERVAL_SECONDS", "30"))
+
+GRADING_SERVICE_URL = os.getenv("GRADING_SERVICE_URL", "http://grading-service:5002")
+COURSE_CONTEXT_CATEGORIES = ("question_paper", "reference_material")
+
+# --- OCR Configuration ---
+# Pages that need OCR are spread across this many worker processes; 1 OCRs sequentially in the calling process.
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(min(os.cpu_count() or 1, 4))))
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", str(os.cpu_count() or 1)))
+OCR_PAGE_TIMEOUT_SECONDS = float(os.getenv("OCR_PAGE_TIMEOUT_SECONDS", "120"))
+# Upper bound for the parallel OCR of one document, however many times its pool had to be restarted; 0 disables it.
+OCR_DOCUMENT_TIMEOUT_SECONDS = float(os.getenv("OCR_DOCUMENT_TIMEOUT_SECONDS", "1800"))
+OCR_POLL_INTERVAL_SECONDS = 0.1
+
+# Adaptive DPI: pages are OCR'd at the lower OCR_DPI_STEPS first and re-rendered at the next step (up to the requested
+# DPI) only while the result scores below OCR_MIN_QUALITY; see estimate_ocr_quality.
+OCR_ADAPTIVE_DPI = os.getenv("OCR_ADAPTIVE_DPI", "true").lower() == "true"
+OCR_DPI_STEPS = [int(dpi) for dpi in os.getenv("OCR_DPI_STEPS", "150,300").split(",") if dpi.strip()]
+OCR_MIN_QUALITY = float(os.getenv("OCR_MIN_QUALITY", "0.6"))
+# Typed text yields a few hundred characters per percent of dark pixels, handwriting far fewer; below this the OCR
+# most likely missed text that is on the page.
+OCR_MIN_CHARS_PER_INK_PERCENT = float(os.getenv("OCR_MIN_CHARS_PER_INK_PERCENT", "15"))
+OCR_BLANK_INK_RATIO = 0.002
+OCR_INK_DPI = 36
+DARK_PIXEL_VALUES = bytes(range(128))
+# "regions" OCRs only images that lack a text layer and keeps the native text around them; "page" OCRs whole pages.
+OCR_MODE = os.getenv("OCR_MODE", "regions")
+OCR_MODES = ("regions", "page")
+OCR_MIN_REGION_AREA_RATIO = float(os.getenv("OCR_MIN_REGION_AREA_RATIO", "0.01"))
+# Image regions covering more than this share of a page are OCR'd as the whole page (a scanned page).
+OCR_FULL_PAGE_REGION_SHARE = 0.85
+# Letters only (any script, so umlauts count), optionally followed by punctuation.
+WORDLIKE_TOKEN = re.compile(r"^[(\"'„]?[^\W\d_]{2,}[-.,;:!?)\"'“]*$")
+
+# Background processing: /process_submission queues jobs for these worker threads (each OCR still uses OCR_WORKERS
+# processes) and answers 429 once PROCESSING_QUEUE_SIZE jobs are waiting.
+PROCESSING_WORKERS = int(os.getenv("PROCESSING_WORKERS", "2"))
+PROCESSING_QUEUE_SIZE = int(os.getenv("PROCESSING_QUEUE_SIZE", "20"))
+PROCESSING_RETRY_AFTER_SECONDS = int(os.getenv("PROCESSING_RETRY_AFTER_SECONDS", "10"))
+
+# Content-addressed OCR cache: whole documents by SHA-256 of their bytes, single pages by SHA-256 of a low-DPI render
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "true").lower() == "true"
+OCR_CACHE_TTL_DAYS = int(os.getenv("OCR_CACHE_TTL_DAYS", "90"))
+OCR_CACHE_MAX_MB = int(os.getenv("OCR_CACHE_MAX_MB", "512"))
+OCR_CACHE_HASH_DPI = int(os.getenv("OCR_CACHE_HASH_DPI", "72"))
+
+# --- Ingestion Configuration ---
+# Uploads up to this size are opened straight from memory; larger ones are spooled chunk by chunk to a file in
+# INGEST_SPOOL_DIR (tmpfs by default, so the spool is memory-backed and never touches disk).
+INGEST_SPOOL_THRESHOLD_BYTES = int(os.getenv("INGEST_SPOOL_THRESHOLD_MB", "32")) * 1024 * 1024
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+
+
+# --- Shared Clients ---
+exams_mongo = PooledMongoClient("exams", MONGO_EXAMS_URI, max_pool_size=MONGO_MAX_POOL_SIZE,
+                                min_pool_size=MONGO_MIN_POOL_SIZE,
+                                server_selection_timeout_ms=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                                health_check_interval_seconds=MONGO_HEALTH_CHECK_INTERVAL_SECONDS)
+frontend_mongo = PooledMongoClient("frontend", MONGO_FRONTEND_URI, max_pool_size=MONGO_MAX_POOL_SIZE,
+                                   min_pool_size=MONGO_MIN_POOL_SIZE,
+                                   server_selection_timeout_ms=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                                   health_check_interval_seconds=MONGO_HEALTH_CHECK_INTERVAL_SECONDS)
+
+
+def get_exams_client():
+    return exams_mongo.get()
+
+
+def get_frontend_client():
+    return frontend_mongo.get()
+
+
+ocr_cache = OCRCache(
+    lambda: get_exams_client()[MONGO_EXAMS_DB_NAME][MONGO_OCR_CACHE_COLLECTION_NAME],
+    ttl_seconds=OCR_CACHE_TTL_DAYS * 24 * 3600,
+    max_total_bytes=OCR_CACHE_MAX_MB * 1024 * 1024
+)
+
+
+# --- Ingestion Helpers ---
+def open_pdf(pdf_source):
+    """Opens a PDF from a file path or from its bytes."""
+    if isinstance(pdf_source, (bytes, bytearray)):
+        return fitz.open(stream=pdf_source, filetype="pdf")
+    return fitz.open(pdf_source)
+
+
+@contextmanager
+def spooled_pdf(chunks):
+    """Writes byte chunks to a spool file in INGEST_SPOOL_DIR and yields its path; the file is removed afterwards."""
+    fd, spool_path = tempfile.mkstemp(suffix=".pdf", dir=INGEST_SPOOL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as spool_file:
+            for chunk in chunks:
+                spool_file.write(chunk)
+        yield spool_path
+    finally:
+        try:
+            os.remove(spool_path)
+        except OSError as e:
+            logger.warning(f"Could not remove spool file {spool_path}: {e}")
+
+
+@contextmanager
+def gridfs_pdf_source(grid_out):
+    """Yields a PDF source for a GridFS file: its bytes, or a spool file path for very large uploads."""
+    if grid_out.length <= INGEST_SPOOL_THRESHOLD_BYTES:
+        yield grid_out.read()
+    else:
+        # Iterating a GridOut yields one chunk at a time, so the upload is never held in memory as a whole.
+        with spooled_pdf(grid_out) as spool_path:
+            logger.info(f"Spooled {grid_out.length / 1e6:.1f} MB upload to {spool_path}.")
+            yield spool_path
+
+
+def reset_peak_rss():
+    # Linux only: writing 5 to clear_refs resets VmHWM, so the next reading is the peak of this document alone.
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@contextmanager
+def log_resource_usage(label):
+    """Logs wall time and peak RSS of the enclosed work (process-wide, so concurrent requests are included)."""
+    peak_is_per_document = reset_peak_rss()
+    start_time = time.monotonic()
+    try:
+        yield
+    finally:
+        logger.info(f"{label}: wall time {time.monotonic() - start_time:.2f}s, peak RSS {peak_rss_mb():.1f} MB"
+                    f"{'' if peak_is_per_document else ' (since process start)'}.")
+
 
 # --- Core OCR and DB Logic ---
-def pdf_to_markdown(pdf_path, ocr_threshold=20, language="eng", ocr_dpi=300):
-    markdown_content = ""
+def untexted_image_regions(page, min_text_chars):
+    """Rectangles of images on the page without a text layer of their own; overlapping images are merged."""
+    page_area = abs(page.rect)
+    regions = []
+    for image in page.get_image_info():
+        rect = fitz.Rect(image["bbox"]) & page.rect
+        # Tiny images are logos, bullets and rules rather than scanned content.
+        if rect.is_empty or abs(rect) < page_area * OCR_MIN_REGION_AREA_RATIO:
+            continue
+        if len(page.get_textbox(rect).strip()) >= min_text_chars:
+            continue
+        for merged in regions:
+            if merged.intersects(rect):
+                merged.include_rect(rect)
+                break
+        else:
+            regions.append(rect)
+    return regions
+
+
+def ocr_regions(page, language, ocr_dpi, regions):
+    """OCRs only the given regions of a page and merges the result with its native text in reading order."""
+    # Native text blocks; anything inside a region is superseded by the region's OCR.
+    blocks = [(fitz.Rect(block[:4]), block[4].strip()) for block in page.get_text("blocks")
+              if block[6] == 0 and block[4].strip() and not any(region.contains(fitz.Rect(block[:4]))
+                                                                 for region in regions)]
+    for region in regions:
+        pixmap = page.get_pixmap(dpi=ocr_dpi, clip=region, colorspace=fitz.csGRAY, alpha=False)
+        with fitz.open("pdf", pixmap.pdfocr_tobytes(language=language)) as region_doc:
+            region_text = region_doc[0].get_text("text").strip()
+        if region_text:
+            blocks.append((region, region_text))
+    # Top to bottom, then left to right: the same order as PyMuPDF's sort=True.
+    blocks.sort(key=lambda block: (round(block[0].y0, 1), block[0].x0))
+    return "\n".join(text for _, text in blocks)
+
+
+def ocr_pixel_count(page, ocr_dpi, regions=None):
+    scale = (ocr_dpi / 72) ** 2
+    return int(sum(rect.width * rect.height for rect in (regions or [page.rect])) * scale)
+
+
+def ocr_page(page, page_num, language, ocr_dpi, regions=None):
+    """Returns the OCR text of a page, or None if OCR failed. With regions, only those rectangles are OCR'd."""
+    try:
+        if regions:
+            extracted_text = ocr_regions(page, language, ocr_dpi, regions)
+            logger.info(f"  Page {page_num}: OCR of {len(regions)} region(s) at {ocr_dpi} DPI successful "
+                        f"({len(extracted_text)} chars with native text).")
+            return extracted_text
+        tp_ocr = page.get_textpage_ocr(language=language, dpi=ocr_dpi, flags=3, full=True)
+        if tp_ocr:
+            ocr_text = page.get_text("text", textpage=tp_ocr)
+            extracted_text = ocr_text.strip() if ocr_text else ""
+            logger.info(f"  Page {page_num}: OCR at {ocr_dpi} DPI successful ({len(extracted_text)} chars).")
+            return extracted_text
+        logger.info(f"  Page {page_num}: OCR TextPage generation failed.")
+    except RuntimeError as rt_err:
+        logger.error(f"  Page {page_num}: OCR attempt failed with RuntimeError: {rt_err}")
+    except Exception as ocr_error:
+        logger.error(f"  Page {page_num}: OCR failed with unexpected error: {ocr_error}")
+    return None
+
+
+def ocr_dpi_steps(ocr_dpi, adaptive=True):
+    """DPIs to try for a page, lowest first; the last one is always ocr_dpi."""
+    if not adaptive:
+        return [ocr_dpi]
+    return sorted({dpi for dpi in OCR_DPI_STEPS if dpi < ocr_dpi}) + [ocr_dpi]
+
+
+def page_ink_ratio(page):
+    """Share of dark pixels on a coarse grayscale render of the page."""
+    samples = page.get_pixmap(dpi=OCR_INK_DPI, colorspace=fitz.csGRAY, alpha=False).samples
+    if not samples:
+        return 0.0
+    # translate() deletes the dark byte values in C; whatever remains is light.
+    return (len(samples) - len(samples.translate(None, DARK_PIXEL_VALUES))) / len(samples)
+
+
+def estimate_ocr_quality(text, ink_ratio):
+    """Scores an OCR result from 0 to 1 without Tesseract's word confidences, which PyMuPDF does not expose.
+
+    The score is the share of tokens that look like words (garbled OCR yields fragments and symbol runs), scaled down
+    when far fewer characters came out than the page's ink suggests (OCR that missed most of the text).
+    """
+    if ink_ratio < OCR_BLANK_INK_RATIO:
+        return 1.0  # Nothing on the page a higher DPI could recover.
+    tokens = text.split()
+    if not tokens:
+        return 0.0
+    word_ratio = sum(bool(WORDLIKE_TOKEN.match(token)) for token in tokens) / len(tokens)
+    coverage = min(1.0, len(text) / (ink_ratio * 100) / OCR_MIN_CHARS_PER_INK_PERCENT)
+    return round(word_ratio * coverage, 3)
+
+
+def ocr_page_adaptive(page, page_num, language, dpi_steps, min_quality, regions=None):
+    """OCRs a page (or only its regions) at each DPI of dpi_steps in turn until the result scores at least min_quality.
+
+    Returns a page record with the text (None if every attempt failed), the DPI of the kept result, its quality
+    score, the number of attempts, the pixels OCR'd over all attempts and the total OCR time. If no attempt reaches
+    min_quality the best one is kept.
+    """
+    start_time = time.monotonic()
+    ink_ratio = page_ink_ratio(page)
+    best = None
+    attempts = 0
+    ocr_pixels = 0
+    for step, dpi in enumerate(dpi_steps):
+        attempts += 1
+        ocr_pixels += ocr_pixel_count(page, dpi, regions)
+        text = ocr_page(page, page_num, language, dpi, regions)
+        if text is None:
+            continue
+        quality = estimate_ocr_quality(text, ink_ratio)
+        # On ties the higher DPI wins; it costs no more at this point.
+        if best is None or quality >= best["ocr_quality"]:
+            best = {"text": text, "ocr_dpi": dpi, "ocr_quality": quality}
+        if quality >= min_quality:
+            break
+        if step + 1 < len(dpi_steps):
+            logger.info(f"  Page {page_num}: OCR quality {quality:.2f} at {dpi} DPI is below {min_quality:.2f}; "
+                        f"retrying at {dpi_steps[step + 1]} DPI.")
+    record = best or {"text": None, "ocr_dpi": dpi_steps[-1], "ocr_quality": None}
+    record.update({"ocr_attempts": attempts, "ocr_regions": len(regions) if regions else 0, "ocr_pixels": ocr_pixels,
+                   "ocr_seconds": round(time.monotonic() - start_time, 3)})
+    return record
+
+
+# Per-process state of OCR pool workers: each worker opens the document once, independently of the parent.
+_worker_doc = None
+_worker_started_at = None
+
+
+def _init_ocr_worker(pdf_path, started_at):
+    global _worker_doc, _worker_started_at
+    _worker_doc = fitz.open(pdf_path)
+    _worker_started_at = started_at
+
+
+def _ocr_page_in_worker(page_index, language, dpi_steps, min_quality, region_tuples):
+    # Recorded in shared memory so the parent can time out a page from when it actually started.
+    _worker_started_at[page_index] = time.time()
+    regions = [fitz.Rect(region) for region in region_tuples] if region_tuples else None
+    return ocr_page_adaptive(_worker_doc[page_index], page_index + 1, language, dpi_steps, min_quality, regions)
+
+
+def ocr_pages_in_parallel(pdf_path, page_regions, language, dpi_steps, min_quality, workers, page_timeout,
+                          document_timeout=None):
+    """OCRs pages across a process pool; page_regions maps page indexes to their OCR regions (None for the whole page).
+
+    Returns {page_index: page record}. Failed or timed-out pages are None. A worker stuck on a page cannot be
+    interrupted, so when a page exceeds page_timeout the pool is terminated and the unfinished pages are resubmitted
+    to a fresh one. Pages still unfinished after document_timeout seconds are all given up.
+    """
+    # forkserver avoids forking the multi-threaded Flask process; workers fork from a clean server process.
+    context = multiprocessing.get_context(
+        "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+    started_at = context.Array('d', max(page_regions) + 1, lock=False)
+    deadline = time.time() + document_timeout if document_timeout else None
+    records = {}
+    timed_out = []
+    unfinished = list(page_regions)
+    while unfinished:
+        for page_index in unfinished:
+            started_at[page_index] = 0
+        pool = context.Pool(processes=min(workers, len(unfinished)), initializer=_init_ocr_worker,
+                            initargs=(pdf_path, started_at))
+        try:
+            # Rects are passed as plain tuples to keep the pickled task small.
+            pending = {page_index: pool.apply_async(_ocr_page_in_worker, (
+                page_index, language, dpi_steps, min_quality,
+                [tuple(region) for region in page_regions[page_index]] if page_regions[page_index] else None))
+                       for page_index in unfinished}
+            pool_stuck = False
+            while pending and not pool_stuck:
+                now = time.time()
+                if deadline and now > deadline:
+                    logger.error(f"OCR of {pdf_path} exceeded {document_timeout:.0f}s; giving up on "
+                                 f"{len(pending)} unfinished pages.")
+                    for page_index in pending:
+                        records[page_index] = None
+                        timed_out.append(page_index)
+                    pending = {}
+                    break
+                for page_index, result in list(pending.items()):
+                    if result.ready():
+                        try:
+                            records[page_index] = result.get()
+                        except Exception as e:
+                            logger.error(f"  Page {page_index + 1}: OCR worker failed: {e}")
+                            records[page_index] = None
+                        del pending[page_index]
+                    elif page_timeout and started_at[page_index] and now - started_at[page_index] > page_timeout:
+                        logger.error(f"  Page {page_index + 1}: OCR timed out after {page_timeout:.0f}s.")
+                        records[page_index] = None
+                        timed_out.append(page_index)
+                        del pending[page_index]
+                        pool_stuck = True
+                if pending and not pool_stuck:
+                    time.sleep(OCR_POLL_INTERVAL_SECONDS)
+            unfinished = list(pending)
+        finally:
+            # terminate() also kills workers still stuck on a timed-out page.
+            pool.terminate()
+            pool.join()
+        if unfinished:
+            logger.warning(f"Restarting the OCR pool for {len(unfinished)} unfinished pages of {pdf_path}.")
+    if timed_out:
+        logger.warning(f"OCR timed out on pages {[i + 1 for i in sorted(timed_out)]} of {pdf_path}.")
+    return records
+
+
+def extract_pages(pdf_source, ocr_threshold=20, language="eng", ocr_dpi=300, workers=1, page_timeout=None,
+                  cache=None, adaptive_dpi=True, min_quality=None, ocr_mode="regions", document_timeout=None):
+    """Extracts text page by page, OCRing what the embedded text layer does not cover.
+
+    With ocr_mode "page", pages with less than ocr_threshold characters of embedded text are OCR'd as a whole. With
+    "regions", only images without a text layer of their own are OCR'd (on any page) and merged with the native text
+    in reading order; pages without such images, or whose images cover nearly all of them, fall back to whole-page OCR
+    when their text layer is too small.
+
+    pdf_source is a file path or the PDF's bytes. With adaptive_dpi, OCR starts at the lower OCR_DPI_STEPS and
+    only re-renders at up to ocr_dpi pages whose result scores below min_quality. With workers > 1, the pages that
+    need OCR are processed in parallel; page order is kept either way. page_timeout and document_timeout (seconds)
+    only apply to parallel OCR. With an OCRCache, identical documents and identical pages are not OCR'd again.
+
+    Returns one record per page: page_number, text and source ("text_layer", "ocr" or "mixed" for native text plus
+    OCR'd regions); OCR'd pages also carry ocr_dpi, ocr_quality, ocr_attempts, ocr_regions, ocr_pixels and
+    ocr_seconds, and cached=True if they came from the cache.
+    """
     doc = None
+    source_label = pdf_source if isinstance(pdf_source, str) else f"<{len(pdf_source)} bytes in memory>"
+    min_quality = OCR_MIN_QUALITY if min_quality is None else min_quality
+    dpi_steps = ocr_dpi_steps(ocr_dpi, adaptive_dpi)
+    # Results depend on the whole DPI ladder, the quality bar and the OCR mode, so all go into the cache keys.
+    dpi_setting = str(ocr_dpi) if len(dpi_steps) == 1 else f"{'/'.join(map(str, dpi_steps))}@q{min_quality:g}"
+    if ocr_mode != "page":
+        dpi_setting += f";mode={ocr_mode}"
     try:
-        doc = fitz.open(pdf_path)
-        logger.info(f"Processing PDF: {pdf_path} with {len(doc)} pages. OCR DPI: {ocr_dpi}, Lang: {language}")
+        document_key = None
+        if cache:
+            document_key = document_cache_key(pdf_source, ocr_settings_fingerprint(language, dpi_setting, ocr_threshold))
+            cached_pages = cache.get_document(document_key)
+            if cached_pages is not None:
+                logger.info(f"OCR cache hit for whole document {source_label}; skipping text extraction and OCR.")
+                return [{**page, "ocr_seconds": 0.0, "cached": True} if page["source"] != "text_layer" else page
+                        for page in cached_pages]
+
+        doc = open_pdf(pdf_source)
+        logger.info(f"Processing PDF: {source_label} with {len(doc)} pages. OCR DPI: {'/'.join(map(str, dpi_steps))}, "
+                    f"Mode: {ocr_mode}, Lang: {language}, Workers: {workers}")
+        pages = []
+        # page index -> regions to OCR, or None to OCR the whole page
+        ocr_plan = {}
         for i, page in enumerate(doc):
             page_num = i + 1
             logger.debug(f" Processing page {page_num}...")
             text = page.get_text("text")
             extracted_text = text.strip() if text else ""
-            if len(extracted_text) < ocr_threshold:
+            regions = untexted_image_regions(page, ocr_threshold) if ocr_mode == "regions" else []
+            region_share = sum(abs(region) for region in regions) / abs(page.rect) if regions else 0.0
+            if regions and (len(extracted_text) >= ocr_threshold or region_share < OCR_FULL_PAGE_REGION_SHARE):
+                logger.info(f"  Page {page_num}: {len(extracted_text)} chars of text and {len(regions)} image "
+                            f"region(s) without text ({region_share:.0%} of the page). OCRing the regions...")
+                ocr_plan[i] = regions
+            elif len(extracted_text) < ocr_threshold:
                 logger.info(
                     f"  Page {page_num}: Standard text minimal ({len(extracted_text)} chars). Attempting OCR...")
-                try:
-                    tp_ocr = page.get_textpage_ocr(language=language, dpi=ocr_dpi, flags=3, full=True)
-                    if tp_ocr:
-                        ocr_text = page.get_text("text", textpage=tp_ocr)
-                        extracted_text = ocr_text.strip() if ocr_text else ""
-                        logger.info(f"  Page {page_num}: OCR successful ({len(extracted_text)} chars).")
-                    else:
-                        logger.info(f"  Page {page_num}: OCR TextPage generation failed.")
-                        extracted_text = ""
-                except RuntimeError as rt_err:
-                    logger.error(f"  Page {page_num}: OCR attempt failed with RuntimeError: {rt_err}")
-                    extracted_text = ""
-                except Exception as ocr_error:
-                    logger.error(f"  Page {page_num}: OCR failed with unexpected error: {ocr_error}")
-                    extracted_text = ""
+                ocr_plan[i] = None
             else:
                 logger.info(f"  Page {page_num}: Standard text extraction sufficient ({len(extracted_text)} chars).")
-            markdown_content += extracted_text + "\n\n"
-        return markdown_content.strip()
+            pages.append({"page_number": page_num, "text": extracted_text, "source": "text_layer"})
+        for i, regions in ocr_plan.items():
+            pages[i]["source"] = "mixed" if regions else "ocr"
+
+        page_keys = {}
+        if cache and ocr_plan:
+            page_settings = ocr_settings_fingerprint(language, dpi_setting)
+            page_keys = {i: page_cache_key(doc[i], page_settings, OCR_CACHE_HASH_DPI) for i in ocr_plan}
+            cached_pages = cache.get_pages(list(page_keys.values()))
+            for i, key in page_keys.items():
+                if key in cached_pages:
+                    pages[i].update({**cached_pages[key], "ocr_seconds": 0.0, "cached": True})
+            logger.info(f"OCR cache: {sum(key in cached_pages for key in page_keys.values())} of "
+                        f"{len(page_keys)} OCR pages found.")
+            ocr_plan = {i: regions for i, regions in ocr_plan.items() if page_keys[i] not in cached_pages}
+
+        ocr_failed = False
+        if ocr_plan:
+            start_time = time.monotonic()
+            if workers > 1 and len(ocr_plan) > 1:
+                # Workers open the document by path; in-memory documents get a (tmpfs) spool file for them to share.
+                with (spooled_pdf([pdf_source]) if not isinstance(pdf_source, str)
+                      else nullcontext(pdf_source)) as worker_pdf_path:
+                    ocr_records = ocr_pages_in_parallel(worker_pdf_path, ocr_plan, language, dpi_steps, min_quality,
+                                                        min(workers, len(ocr_plan)), page_timeout, document_timeout)
+            else:
+                ocr_records = {i: ocr_page_adaptive(doc[i], i + 1, language, dpi_steps, min_quality, regions)
+                               for i, regions in ocr_plan.items()}
+            for i, record in ocr_records.items():
+                if record is None or record["text"] is None:
+                    ocr_failed = True
+                    # A mixed page keeps its native text; a scanned page has nothing worth keeping.
+                    pages[i].update({"text": pages[i]["text"] if ocr_plan[i] else "", "ocr_failed": True})
+                    continue
+                pages[i].update(record)
+                if cache:
+                    cache.put_page(page_keys[i], record["text"], record["ocr_dpi"], record["ocr_quality"])
+            escalated = sum(1 for record in ocr_records.values() if record and record["ocr_attempts"] > 1)
+            ocr_pixels = sum(record["ocr_pixels"] for record in ocr_records.values() if record)
+            full_page_pixels = sum(ocr_pixel_count(doc[i], ocr_dpi) for i in ocr_plan)
+            logger.info(f"OCR of {len(ocr_plan)} pages took {time.monotonic() - start_time:.1f}s "
+                        f"with {min(workers, len(ocr_plan))} worker(s); {escalated} page(s) needed a higher DPI. "
+                        f"{ocr_pixels / 1e6:.1f} MP OCR'd vs {full_page_pixels / 1e6:.1f} MP for whole pages "
+                        f"at {ocr_dpi} DPI.")
+
+        if cache and not ocr_failed:
+            cache.put_document(document_key, [{key: value for key, value in page.items() if key != "cached"}
+                                              for page in pages])
+        return pages
     except Exception as e:
-        logger.error(f"PDF processing failed for {pdf_path}: {e}")
+        logger.error(f"PDF processing failed for {source_label}: {e}")
         raise
     finally:
         if doc: doc.close()
 
 
-def store_ocr_in_exams_db(data):
-    client = None
+def pages_to_markdown(pages):
+    return join_page_texts(page["text"] for page in pages)
+
+
+def content_summary(pages):
+    """What a submission document keeps about its text; the pages themselves go to the pages collection."""
+    content = pages_to_markdown(pages)
+    return {
+        "content_storage": "pages",
+        "page_count": len(pages),
+        "content_chars": len(content),
+        "ocr_page_count": sum(page["source"] != "text_layer" for page in pages),
+        "ocr_ms": round(sum(page.get("ocr_seconds", 0.0) for page in pages) * 1000),
+        "content_preview": content[:CONTENT_PREVIEW_CHARS],
+    }
+
+
+def page_documents(submission_id, pages):
+    """One pages-collection document per page: its text plus chars, OCR use, source, DPI, quality and time."""
+    documents = []
+    for page in pages:
+        document = {key: value for key, value in page.items() if key != "ocr_seconds"}
+        document.update({"submission_id": submission_id, "chars": len(page["text"]),
+                         "ocr_used": page["source"] != "text_layer"})
+        if "ocr_seconds" in page:
+            document["ocr_ms"] = round(page["ocr_seconds"] * 1000)
+        documents.append(document)
+    return documents
+
+
+def pdf_to_markdown(pdf_source, **kwargs):
+    """Text of the whole document; takes the same options as extract_pages."""
+    return pages_to_markdown(extract_pages(pdf_source, **kwargs))
+
+
+def parse_ocr_workers(value):
+    """Validates a requested OCR worker count; None means the service default."""
+    if value is None:
+        return OCR_WORKERS
+    workers = int(value)
+    if not 1 <= workers <= OCR_MAX_WORKERS:
+        raise ValueError(f"ocr_workers must be between 1 and {OCR_MAX_WORKERS}")
+    return workers
+
+
+def ensure_exams_indexes():
+    """Creates the pdf_submissions indexes; existing ones are left alone, so this is cheap on every start."""
+    collection = get_exams_client()[MONGO_EXAMS_DB_NAME][MONGO_EXAMS_COLLECTION_NAME]
+    # Per-course lookups: the grading service's newest question paper/reference material per course, ungraded
+    # answer sheets of a course, and the frontend's answer sheets of a course's students.
+    collection.create_index([("course_id", 1), ("category", 1), ("processing_timestamp", -1)])
+    collection.create_index([("course_id", 1), ("category", 1), ("student_id", 1)])
+    ensure_page_indexes(collection)
+    # batch_ingest.py looks up which rows of an interrupted run are already stored; only its documents have the field.
+    collection.create_index("batch_key", sparse=True)
+    try:
+        # Partial, because CLI uploads have no GridFS file and must not collide on a missing value.
+        collection.create_index("processed_from_gridfs_id", unique=True,
+                                partialFilterExpression={"processed_from_gridfs_id": {"$type": "string"}})
+    except pymongo_errors.OperationFailure as e:
+        duplicates = list(collection.aggregate([
+            {"$match": {"processed_from_gridfs_id": {"$type": "string"}}},
+            {"$group": {"_id": "$processed_from_gridfs_id", "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+            {"$limit": 10}
+        ]))
+        logger.error(f"Could not create the unique index on processed_from_gridfs_id ({e}). GridFS files with "
+                     f"duplicate submissions (first 10): {[d['_id'] for d in duplicates]}. Remove the duplicates "
+                     f"and restart; until then concurrent retries can store a submission twice.")
+
+
+def store_ocr_in_exams_db(data, pages=None):
+    """Stores a submission and, if given, its pages; returns the submission's id (an existing one for a duplicate)."""
+    pages_written = False
     try:
-        client = MongoClient(MONGO_EXAMS_URI)
-        client.admin.command('ping')
-        db = client[MONGO_EXAMS_DB_NAME]
-        collection = db[MONGO_EXAMS_COLLECTION_NAME]
+        collection = get_exams_client()[MONGO_EXAMS_DB_NAME][MONGO_EXAMS_COLLECTION_NAME]
+        document_id = data.get("_id") or ObjectId()
+        if pages:
+            # Pages first, so a reader never finds a submission whose pages are still missing.
+            get_exams_client()[MONGO_EXAMS_DB_NAME][PAGES_COLLECTION_NAME].insert_many(
+                page_documents(document_id, pages))
+            pages_written = True
 
-        if data.get("processed_from_gridfs_id"):
-            existing_doc = collection.find_one({"processed_from_gridfs_id": data.get("processed_from_gridfs_id")})
+        gridfs_id = data.get("processed_from_gridfs_id")
+        if gridfs_id:
+            # One atomic upsert instead of find-then-insert: concurrent retries of the same upload all end up with
+            # the first stored document. BEFORE returns None exactly when this call inserted.
+            for attempt in range(2):
+                try:
+                    existing_doc = collection.find_one_and_update(
+                        {"processed_from_gridfs_id": gridfs_id},
+                        {"$setOnInsert": {**data, "_id": document_id}},
+                        projection={"_id": 1}, upsert=True, return_document=ReturnDocument.BEFORE)
+                    break
+                except pymongo_errors.DuplicateKeyError:
+                    # Two upserts raced on the unique index; the loser retries and now finds the winner's document.
+                    if attempt:
+                        raise
             if existing_doc:
                 logger.info(
-                    f"Submission from GridFS ID {data.get('processed_from_gridfs_id')} has already been processed. Returning existing Exams DB ID: {existing_doc['_id']}")
+                    f"Submission from GridFS ID {gridfs_id} has already been processed. Returning existing Exams DB ID: {existing_doc['_id']}")
+                delete_submission_pages(document_id)
                 return existing_doc['_id']
+            logger.info(
+                f"OCR data stored in '{MONGO_EXAMS_DB_NAME}.{MONGO_EXAMS_COLLECTION_NAME}'. Inserted ID: {document_id}")
+            return document_id
 
-        result = collection.insert_one(data)
+        result = collection.insert_one({**data, "_id": document_id})
         logger.info(
             f"OCR data stored in '{MONGO_EXAMS_DB_NAME}.{MONGO_EXAMS_COLLECTION_NAME}'. Inserted ID: {result.inserted_id}")
         return result.inserted_id
     except pymongo_errors.ConnectionFailure as e:
         logger.error(f"Exams DB ConnectionFailure: {e}")
+        exams_mongo.mark_unhealthy()
         raise
     except Exception as e:
         logger.error(f"Exams DB store operation failed: {e}")
+        if pages_written:
+            delete_submission_pages(document_id)
         raise
-    finally:
-        if client: client.close()
 
 
-# --- Flask Resource ---
+def delete_submission_pages(submission_id):
+    try:
+        get_exams_client()[MONGO_EXAMS_DB_NAME][PAGES_COLLECTION_NAME].delete_many({"submission_id": submission_id})
+    except pymongo_errors.PyMongoError as e:
+        logger.warning(f"Could not remove the pages of unstored submission {submission_id}: {e}")
+
+
+def store_reference_index(course_id, source_document_id, content):
+    """Chunks reference material and stores its BM25 index so the grading service can retrieve relevant passages."""
+    try:
+        index = build_index(content)
+        collection = get_exams_client()[MONGO_EXAMS_DB_NAME][MONGO_REFERENCE_INDEX_COLLECTION_NAME]
+        collection.replace_one(
+            {"_id": source_document_id},
+            {**index, "course_id": course_id, "built_at": datetime.utcnow()},
+            upsert=True
+        )
+        logger.info(
+            f"Reference index for {source_document_id} stored ({len(index['chunks'])} chunks, ~{index['total_tokens']} tokens).")
+    except Exception as e:
+        # The grading service builds the index itself when none is stored, so this is not fatal.
+        logger.error(f"Failed to store reference index for {source_document_id}: {e}")
+
+
+def notify_course_context_changed(course_id):
+    """Best effort: tells the grading service to drop its cached question paper/reference material for a course."""
+    try:
+        requests.post(f"{GRADING_SERVICE_URL}/course_context/{course_id}/invalidate", timeout=2)
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"Could not invalidate grading context cache for course {course_id}: {e}")
+
+
+# --- Submission Processing ---
+def validate_submission_request(json_data):
+    """Returns (params, None) for a valid /process_submission body, or (None, (error_body, status))."""
+    category = json_data.get('category', 'answer_sheet').lower()
+    if category not in ['answer_sheet', 'question_paper', 'reference_material']:
+        return None, ({"message": "Invalid 'category'. Must be 'answer_sheet', 'question_paper', or 'reference_material'."}, 400)
+    try:
+        ocr_workers = parse_ocr_workers(json_data.get('ocr_workers'))
+    except (TypeError, ValueError) as e:
+        return None, ({"message": f"Invalid 'ocr_workers': {e}"}, 400)
+    ocr_mode = json_data.get('ocr_mode', OCR_MODE)
+    if ocr_mode not in OCR_MODES:
+        return None, ({"message": f"Invalid 'ocr_mode'. Must be one of: {', '.join(OCR_MODES)}."}, 400)
+
+    params = {
+        "gridfs_file_id": json_data.get('gridfs_file_id'),
+        "category": category,
+        "student_name": json_data.get('student_name'),
+        "student_id": json_data.get('student_id'),
+        "uploader_username": json_data.get('uploader_username'),
+        "teacher_username": json_data.get('teacher_username'),
+        "course_name": json_data.get('course_name'),
+        "original_filename": json_data.get('original_filename', "unknown.pdf"),
+        "lang": json_data.get('lang', "eng"),
+        "course_id": json_data.get('course_id'),
+        "ocr_workers": ocr_workers,
+        "use_ocr_cache": OCR_CACHE_ENABLED and bool(json_data.get('use_ocr_cache', True)),
+        "adaptive_dpi": bool(json_data.get('adaptive_dpi', OCR_ADAPTIVE_DPI)),
+        "ocr_mode": ocr_mode,
+    }
+    if not params["gridfs_file_id"]:
+        return None, ({"message": "Missing 'gridfs_file_id' in request"}, 400)
+    if not params["course_id"]:
+        return None, ({"message": "Missing 'course_id' in request"}, 400)
+    if not params["uploader_username"]:
+        return None, ({"message": "Missing 'uploader_username' in request"}, 400)
+    if category == 'answer_sheet' and not (params["student_id"] and params["student_name"] and params["teacher_username"]):
+        return None, ({"message": "Missing student_id, student_name, or teacher_username for 'answer_sheet' category"}, 400)
+    return params, None
+
+
+def process_submission(params):
+    """OCRs a GridFS upload and stores it in the Exams DB; returns (response_body, status_code)."""
+    gridfs_file_id_str = params["gridfs_file_id"]
+    category = params["category"]
+    original_filename_from_meta = params["original_filename"]
+    try:
+        frontend_db = get_frontend_client()[MONGO_FRONTEND_DB_NAME]
+        frontend_fs = gridfs.GridFS(frontend_db)
+
+        gridfs_object_id = ObjectId(gridfs_file_id_str)
+        grid_out = frontend_fs.get(gridfs_object_id)
+
+        logger.info(
+            f"File '{original_filename_from_meta}' (GridFS ID: {gridfs_file_id_str}, {grid_out.length / 1e6:.1f} MB) retrieved from GridFS.")
+
+        with log_resource_usage(f"Ingestion of '{original_filename_from_meta}' ({grid_out.length / 1e6:.1f} MB)"):
+            with gridfs_pdf_source(grid_out) as pdf_source:
+                pages = extract_pages(pdf_source=pdf_source, language=params["lang"], workers=params["ocr_workers"],
+                                      page_timeout=OCR_PAGE_TIMEOUT_SECONDS,
+                                      document_timeout=OCR_DOCUMENT_TIMEOUT_SECONDS,
+                                      cache=ocr_cache if params["use_ocr_cache"] else None,
+                                      adaptive_dpi=params["adaptive_dpi"], ocr_mode=params["ocr_mode"])
+        markdown_content = pages_to_markdown(pages)
+        if not markdown_content:
+            logger.warning(
+                f"OCR processing resulted in empty content for {original_filename_from_meta}. Storing empty content.")
+
+        document_data_for_exams_db = {
+            "course_id": params["course_id"],
+            "course_name": params["course_name"],
+            "category": category,
+            **content_summary(pages),
+            "original_pdf_filename": original_filename_from_meta,
+            "processed_from_gridfs_id": gridfs_file_id_str,
+            "uploader_username": params["uploader_username"],
+            "processing_timestamp": datetime.utcnow()
+        }
+        if category == 'answer_sheet':
+            document_data_for_exams_db["student_name"] = params["student_name"]
+            document_data_for_exams_db["student_id"] = params["student_id"]
+            document_data_for_exams_db["teacher_username"] = params["teacher_username"]
+
+        inserted_id_in_exams = store_ocr_in_exams_db(document_data_for_exams_db, pages)
+        if category == 'reference_material':
+            store_reference_index(params["course_id"], inserted_id_in_exams, markdown_content)
+        if category in COURSE_CONTEXT_CATEGORIES:
+            notify_course_context_changed(params["course_id"])
+
+        return {
+            "message": f"Document (category: {category}) processed and OCR'd successfully.",
+            "original_filename": original_filename_from_meta,
+            "exams_db_document_id": str(inserted_id_in_exams)
+        }, 200
+
+    except gridfs.errors.NoFile:
+        logger.error(f"File with GridFS ID {gridfs_file_id_str} not found in '{MONGO_FRONTEND_DB_NAME}'.")
+        return {"message": f"File not found in GridFS: {gridfs_file_id_str}"}, 404
+    except pymongo_errors.ConnectionFailure as e:
+        logger.critical(f"MongoDB connection failed during processing: {e}")
+        frontend_mongo.mark_unhealthy()
+        exams_mongo.mark_unhealthy()
+        return {"message": f"MongoDB connection error: {e}"}, 503
+    except Exception as e:
+        logger.error(f"Error processing document from GridFS ID {gridfs_file_id_str}: {e}", exc_info=True)
+        return {"message": f"Internal server error: {e}"}, 500
+
+
+# --- Background Processing Jobs ---
+processing_queue = queue.Queue(maxsize=PROCESSING_QUEUE_SIZE)
+
+
+def get_processing_jobs_collection():
+    return get_exams_client()[MONGO_EXAMS_DB_NAME][MONGO_PROCESSING_JOBS_COLLECTION_NAME]
+
+
+def enqueue_processing_job(params):
+    """Records a queued job and hands it to the workers; returns its id, or None if the queue is full."""
+    jobs = get_processing_jobs_collection()
+    job_id = jobs.insert_one({"status": "queued", "params": params, "created_at": datetime.utcnow(),
+                              "started_at": None, "finished_at": None, "result": None, "status_code": None}).inserted_id
+    try:
+        processing_queue.put_nowait(job_id)
+    except queue.Full:
+        jobs.delete_one({"_id": job_id})
+        return None
+    return job_id
+
+
+def run_processing_job(job_id):
+    jobs = get_processing_jobs_collection()
+    job = jobs.find_one_and_update({"_id": job_id, "status": "queued"},
+                                   {"$set": {"status": "running", "started_at": datetime.utcnow()}})
+    if not job:
+        logger.warning(f"Processing job {job_id} is no longer queued; skipping.")
+        return
+    logger.info(f"Processing job {job_id} started for GridFS ID {job['params']['gridfs_file_id']}.")
+    try:
+        body, status_code = process_submission(job["params"])
+    except Exception as e:
+        logger.error(f"Processing job {job_id} crashed: {e}", exc_info=True)
+        body, status_code = {"message": f"Internal server error: {e}"}, 500
+    jobs.update_one({"_id": job_id}, {"$set": {
+        "status": "completed" if status_code == 200 else "failed",
+        "finished_at": datetime.utcnow(),
+        "result": body,
+        "status_code": status_code
+    }})
+    logger.info(f"Processing job {job_id} finished with status {status_code}.")
+
+
+def processing_worker():
+    while True:
+        job_id = processing_queue.get()
+        try:
+            run_processing_job(job_id)
+        except Exception as e:
+            logger.error(f"Processing worker failed on job {job_id}: {e}", exc_info=True)
+        finally:
+            processing_queue.task_done()
+
+
+def requeue_interrupted_jobs():
+    """Re-queues jobs a previous run left queued or running; those that no longer fit are marked failed."""
+    jobs = get_processing_jobs_collection()
+    jobs.create_index([("status", 1), ("created_at", 1)])
+    for job in jobs.find({"status": {"$in": ["queued", "running"]}}, {"_id": 1}).sort("created_at", 1):
+        jobs.update_one({"_id": job["_id"]}, {"$set": {"status": "queued", "started_at": None}})
+        try:
+            processing_queue.put_nowait(job["_id"])
+        except queue.Full:
+            jobs.update_one({"_id": job["_id"]}, {"$set": {
+                "status": "failed", "finished_at": datetime.utcnow(), "status_code": 503,
+                "result": {"message": "Job was interrupted by a restart and could not be re-queued."}}})
+
+
+def start_processing_workers():
+    for i in range(PROCESSING_WORKERS):
+        threading.Thread(target=processing_worker, name=f"processing-worker-{i}", daemon=True).start()
+    logger.info(f"Started {PROCESSING_WORKERS} processing workers (queue capacity {PROCESSING_QUEUE_SIZE}).")
+    try:
+        requeue_interrupted_jobs()
+    except pymongo_errors.PyMongoError as e:
+        logger.error(f"Could not re-queue interrupted processing jobs: {e}")
+
+
+def serialize_processing_job(job):
+    return {
+        "job_id": str(job["_id"]),
+        "status": job["status"],
+        "gridfs_file_id": job["params"]["gridfs_file_id"],
+        "category": job["params"]["category"],
+        "original_filename": job["params"]["original_filename"],
+        "created_at": job["created_at"].isoformat() if job.get("created_at") else None,
+        "started_at": job["started_at"].isoformat() if job.get("started_at") else None,
+        "finished_at": job["finished_at"].isoformat() if job.get("finished_at") else None,
+        "result": job.get("result"),
+        "status_code": job.get("status_code"),
+    }
+
+
+# --- Flask Resources ---
 class ProcessDocument(Resource):
+    """Queues a GridFS upload for OCR and answers 202 with a job id; "sync": true processes it within the request."""
+
     def post(self):
         json_data = request.get_json()
         if not json_data:
             return {"message": "Request body must be JSON"}, 400
 
-        gridfs_file_id_str = json_data.get('gridfs_file_id')
-        category = json_data.get('category', 'answer_sheet').lower()
-        if category not in ['answer_sheet', 'question_paper', 'reference_material']:
-            return {"message": "Invalid 'category'. Must be 'answer_sheet', 'question_paper', or 'reference_material'."}, 400
-
-        student_name = json_data.get('student_name')
-        student_id_str = json_data.get('student_id')
-        uploader_username = json_data.get('uploader_username')
-        teacher_username = json_data.get('teacher_username')
-        course_name = json_data.get('course_name')
-        original_filename_from_meta = json_data.get('original_filename', "unknown.pdf")
-        lang = json_data.get('lang', "eng")
-        course_id_str = json_data.get('course_id')
-
-        if not gridfs_file_id_str:
-            return {"message": "Missing 'gridfs_file_id' in request"}, 400
-        if not course_id_str:
-            return {"message": "Missing 'course_id' in request"}, 400
-        if not uploader_username:
-            return {"message": "Missing 'uploader_username' in request"}, 400
-
+        params, error = validate_submission_request(json_data)
+        if error:
+            return error
         logger.info(
-            f"Received API request to process GridFS file ID: {gridfs_file_id_str} for course_id: {course_id_str}, category: {category}")
+            f"Received API request to process GridFS file ID: {params['gridfs_file_id']} for course_id: {params['course_id']}, category: {params['category']}")
 
-        frontend_client = None
-        temp_pdf_path = None
-        try:
-            frontend_client = MongoClient(MONGO_FRONTEND_URI)
-            frontend_db = frontend_client[MONGO_FRONTEND_DB_NAME]
-            frontend_fs = gridfs.GridFS(frontend_db)
+        if json_data.get('sync'):
+            return process_submission(params)
 
-            gridfs_object_id = ObjectId(gridfs_file_id_str)
-            grid_out = frontend_fs.get(gridfs_object_id)
+        try:
+            job_id = enqueue_processing_job(params)
+        except pymongo_errors.PyMongoError as e:
+            logger.error(f"Could not record processing job: {e}")
+            return {"message": f"MongoDB error: {e}"}, 503
+        if job_id is None:
+            logger.warning(f"Processing queue full ({PROCESSING_QUEUE_SIZE}); rejecting {params['gridfs_file_id']}.")
+            return {"message": "Processing queue is full, please retry later."}, 429, \
+                {"Retry-After": str(PROCESSING_RETRY_AFTER_SECONDS)}
+        return {
+            "message": "Document queued for processing.",
+            "job_id": str(job_id),
+            "status_url": f"/jobs/{job_id}",
+            "queue_depth": processing_queue.qsize()
+        }, 202
 
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmpfile_obj:
-                tmpfile_obj.write(grid_out.read())
-                temp_pdf_path = tmpfile_obj.name
 
-            logger.info(
-                f"File '{original_filename_from_meta}' (GridFS ID: {gridfs_file_id_str}) retrieved from GridFS and saved to temp path: {temp_pdf_path}")
-
-            markdown_content = pdf_to_markdown(pdf_path=temp_pdf_path, language=lang)
-            if not markdown_content:
-                logger.warning(
-                    f"OCR processing resulted in empty content for {original_filename_from_meta}. Storing empty content.")
-
-            document_data_for_exams_db = {
-                "course_id": course_id_str,
-                "course_name": course_name,
-                "category": category,
-                "content": markdown_content,
-                "original_pdf_filename": original_filename_from_meta,
-                "processed_from_gridfs_id": gridfs_file_id_str,
-                "uploader_username": uploader_username,
-                "processing_timestamp": datetime.utcnow()
-            }
-            if category == 'answer_sheet':
-                if not (student_id_str and student_name and teacher_username):
-                     return {"message": "Missing student_id, student_name, or teacher_username for 'answer_sheet' category"}, 400
-                document_data_for_exams_db["student_name"] = student_name
-                document_data_for_exams_db["student_id"] = student_id_str
-                document_data_for_exams_db["teacher_username"] = teacher_username
-
-            inserted_id_in_exams = store_ocr_in_exams_db(document_data_for_exams_db)
-
-            return {
-                "message": f"Document (category: {category}) processed and OCR'd successfully.",
-                "original_filename": original_filename_from_meta,
-                "exams_db_document_id": str(inserted_id_in_exams)
-            }, 200
-
-        except gridfs.errors.NoFile:
-            logger.error(f"File with GridFS ID {gridfs_file_id_str} not found in '{MONGO_FRONTEND_DB_NAME}'.")
-            return {"message": f"File not found in GridFS: {gridfs_file_id_str}"}, 404
-        except pymongo_errors.ConnectionFailure as e:
-            logger.critical(f"MongoDB connection failed during processing: {e}")
-            return {"message": f"MongoDB connection error: {e}"}, 503
-        except Exception as e:
-            logger.error(f"Error processing document from GridFS ID {gridfs_file_id_str}: {e}", exc_info=True)
-            return {"message": f"Internal server error: {e}"}, 500
-        finally:
-            if frontend_client: frontend_client.close()
-            if temp_pdf_path and os.path.exists(temp_pdf_path):
-                try:
-                    os.remove(temp_pdf_path); logger.debug(f"Temporary file {temp_pdf_path} removed.")
-                except Exception as e_remove:
-                    logger.warning(f"Could not remove temporary file {temp_pdf_path}: {e_remove}")
+class ProcessingJobStatus(Resource):
+    def get(self, job_id):
+        try:
+            job = get_processing_jobs_collection().find_one({"_id": ObjectId(job_id)})
+        except InvalidId:
+            return {"message": f"Invalid job id: {job_id}"}, 400
+        except pymongo_errors.PyMongoError as e:
+            return {"message": f"MongoDB error: {e}"}, 503
+        if not job:
+            return {"message": f"Job {job_id} not found"}, 404
+        return serialize_processing_job(job), 200
 
 
 @app.route('/health')
@@ -210,7 +943,41 @@ def health_check():
     return jsonify({"status": "ok", "message": "PDF Processor service is healthy"}), 200
 
 
+@app.route('/ocr_cache/stats')
+def ocr_cache_stats():
+    return jsonify({**ocr_cache.stats(), "enabled": OCR_CACHE_ENABLED}), 200
+
+
+@app.route('/processing_queue/stats')
+def processing_queue_stats():
+    return jsonify({"queue_depth": processing_queue.qsize(), "queue_capacity": PROCESSING_QUEUE_SIZE,
+                    "workers": PROCESSING_WORKERS}), 200
+
+
+@app.route('/mongo/stats')
+def mongo_pool_stats():
+    return jsonify({"exams": exams_mongo.stats(), "frontend": frontend_mongo.stats()}), 200
+
+
 api.add_resource(ProcessDocument, '/process_submission')
+api.add_resource(ProcessingJobStatus, '/jobs/<string:job_id>')
+
+def cli_submission_document(pdf_path, pages, course_id, course, category, username, teacher, student_name,
+                            student_id=None):
+    """Exams DB document for a PDF ingested from the command line (single file or batch)."""
+    return {
+        "course_id": course_id,
+        "student_name": student_name,
+        "student_id": student_id if student_id else None,
+        "uploader_username": username,
+        "teacher_username": teacher,
+        "course": course,
+        "category": category,
+        **content_summary(pages),
+        "original_pdf_filename": os.path.basename(pdf_path),
+        "upload_time": datetime.utcnow()
+    }
+
 
 def main_cli():
     parser = argparse.ArgumentParser(description="CLI: Extract text/OCR PDF and upload to MongoDB with metadata")
@@ -226,7 +993,21 @@ def main_cli():
                         help="Type of document")
     parser.add_argument("--lang", default="eng", help="Tesseract language for OCR (e.g., eng, deu)")
     parser.add_argument("--ocr-threshold", type=int, default=20, help="Char count threshold for OCR attempt")
-    parser.add_-argument("--ocr-dpi", type=int, default=300, help="DPI for OCR rendering")
+    parser.add_argument("--ocr-dpi", type=int, default=300,
+                        help="DPI for OCR rendering (the highest DPI tried when adaptive DPI is on)")
+    parser.add_argument("--no-adaptive-dpi", action="store_true",
+                        help="OCR every page at --ocr-dpi instead of trying lower DPIs first")
+    parser.add_argument("--ocr-min-quality", type=float, default=OCR_MIN_QUALITY,
+                        help="Quality score (0-1) below which a page is OCR'd again at a higher DPI")
+    parser.add_argument("--ocr-mode", choices=OCR_MODES, default=OCR_MODE,
+                        help="'regions' OCRs only images without a text layer, 'page' OCRs whole pages")
+    parser.add_argument("--ocr-workers", type=int, default=OCR_WORKERS,
+                        help="Worker processes for OCR of scanned pages (1 = sequential)")
+    parser.add_argument("--ocr-page-timeout", type=float, default=OCR_PAGE_TIMEOUT_SECONDS,
+                        help="Seconds before OCR of a single page is abandoned (parallel OCR only)")
+    parser.add_argument("--ocr-document-timeout", type=float, default=OCR_DOCUMENT_TIMEOUT_SECONDS,
+                        help="Seconds before parallel OCR of the whole document is abandoned (0 = no limit)")
+    parser.add_argument("--no-ocr-cache", action="store_true", help="Always OCR, ignoring cached results")
     args = parser.parse_args()
 
     logger.info(f"--- Starting PDF Processing (CLI Mode) ---")
@@ -236,23 +1017,24 @@ def main_cli():
         print(f"Error: Input PDF file not found: {args.pdf}", file=sys.stderr)
         sys.exit(1)
     try:
-        markdown_content = pdf_to_markdown(pdf_path=args.pdf, ocr_threshold=args.ocr_threshold, language=args.lang,
-                                           ocr_dpi=args.ocr_dpi)
+        with log_resource_usage(f"Ingestion of '{args.pdf}'"):
+            pages = extract_pages(pdf_source=args.pdf, ocr_threshold=args.ocr_threshold, language=args.lang,
+                                  ocr_dpi=args.ocr_dpi, workers=args.ocr_workers, page_timeout=args.ocr_page_timeout,
+                                  document_timeout=args.ocr_document_timeout,
+                                  cache=None if args.no_ocr_cache or not OCR_CACHE_ENABLED else ocr_cache,
+                                  adaptive_dpi=OCR_ADAPTIVE_DPI and not args.no_adaptive_dpi,
+                                  min_quality=args.ocr_min_quality, ocr_mode=args.ocr_mode)
+        markdown_content = pages_to_markdown(pages)
         if not markdown_content: logger.warning(f"Extracted content is empty for {args.pdf}.")
 
-        submission_data = {
-            "course_id": args.course_id,
-            "student_name": args.student_name,
-            "student_id": args.student_id if args.student_id else None,
-            "uploader_username": args.username,
-            "teacher_username": args.teacher,
-            "course": args.course,
-            "category": args.category,
-            "content": markdown_content,
-            "original_pdf_filename": os.path.basename(args.pdf),
-            "upload_time": datetime.utcnow()
-        }
-        inserted_id = store_ocr_in_exams_db(submission_data)
+        submission_data = cli_submission_document(args.pdf, pages, args.course_id, args.course, args.category,
+                                                  args.username, args.teacher, args.student_name, args.student_id)
+        ensure_exams_indexes()
+        inserted_id = store_ocr_in_exams_db(submission_data, pages)
+        if args.category == "reference_material":
+            store_reference_index(args.course_id, inserted_id, markdown_content)
+        if args.category in COURSE_CONTEXT_CATEGORIES:
+            notify_course_context_changed(args.course_id)
         print(f"Submission ID: {inserted_id}")
         logger.info(f"--- CLI Success! PDF processed, data in MongoDB. Submission ID: {inserted_id} ---")
     except Exception as e:
@@ -266,6 +1048,16 @@ if __name__ == '__main__':
         logger.info("Detected CLI mode operation from arguments...")
         main_cli()
     else:
+        try:
+            ensure_exams_indexes()
+        except pymongo_errors.PyMongoError as e:
+            logger.error(f"Could not create Exams DB indexes: {e}")
+        if OCR_CACHE_ENABLED:
+            try:
+                ocr_cache.ensure_indexes()
+            except pymongo_errors.PyMongoError as e:
+                logger.error(f"Could not create OCR cache indexes: {e}")
+        start_processing_workers()
         logger.info(f"Starting PDF Processor service API on port 5003...")
         flask_debug_mode = os.getenv("FLASK_DEBUG", "False").lower() == "true"
         app.run(host='0.0.0.0', port=5003, debug=flask_debug_mode)
@@ -0,0 +1,160 @@
+"""AIMD concurrency limiter for calls to rate-limited LLM providers.
+
+Shared by grading_service and Benchmarking/benchmark.py. The limit grows by about one slot per window of healthy
+calls (additive increase) and is cut by a factor on 429/5xx responses (multiplicative decrease). A Retry-After
+header additionally pauses new calls until the provider asked us to come back.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+OVERLOAD_STATUS_CODES = (429, 500, 502, 503, 504)
+MAX_RETRY_AFTER_SECONDS = 60.0
+
+
+def error_status_code(error):
+    """HTTP status of a provider error (openai.APIStatusError and similar), or None."""
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code
+
+
+def retry_after_seconds(error):
+    """Seconds from the Retry-After header of a provider error, or None if absent or not a number."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        value = float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+    return min(max(value, 0.0), MAX_RETRY_AFTER_SECONDS)
+
+
+class AdaptiveConcurrencyLimiter:
+    """asyncio limiter whose limit adapts to provider health; use one instance per model and event loop.
+
+    Calls run inside `async with limiter.slot():`. A call that finishes within latency_target_seconds (or any
+    successful call if no target is set) counts as healthy, an exception whose status is 429/5xx counts as
+    overload, anything else leaves the limit unchanged.
+    """
+
+    def __init__(self, name, initial_limit=10, min_limit=1, max_limit=100, increase_step=1.0, decrease_factor=0.5,
+                 latency_target_seconds=None):
+        self.name = name
+        self._min_limit = min_limit
+        self._max_limit = max(max_limit, min_limit)
+        self._limit = float(min(max(initial_limit, min_limit), self._max_limit))
+        self._increase_step = increase_step
+        self._decrease_factor = decrease_factor
+        self._latency_target_seconds = latency_target_seconds
+        self._in_flight = 0
+        self._waiters = deque()
+        self._paused_until = 0.0
+        self._last_decrease_at = 0.0
+        self._counters = {"calls": 0, "healthy": 0, "overloaded": 0, "slow": 0, "increases": 0, "decreases": 0,
+                          "retry_after_pauses": 0}
+
+    @property
+    def limit(self):
+        return max(self._min_limit, int(self._limit))
+
+    @asynccontextmanager
+    async def slot(self):
+        await self._acquire()
+        started_at = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self._release()
+            self._record_failure(e, started_at)
+            raise
+        except BaseException:
+            self._release()
+            raise
+        else:
+            self._release()
+            self._record_success(time.monotonic() - started_at)
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "waiting": len(self._waiters),
+            "min_limit": self._min_limit,
+            "max_limit": self._max_limit,
+            "paused_for_seconds": round(max(0.0, self._paused_until - time.monotonic()), 3),
+            **self._counters,
+        }
+
+    async def _acquire(self):
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            if self._in_flight < self.limit:
+                self._in_flight += 1
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                else:
+                    # We were woken but will not take the slot; hand the wake-up to the next waiter.
+                    self._wake_waiters()
+                raise
+
+    def _release(self):
+        self._in_flight -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        free_slots = self.limit - self._in_flight
+        while free_slots > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free_slots -= 1
+
+    def _record_success(self, latency_seconds):
+        self._counters["calls"] += 1
+        if self._latency_target_seconds and latency_seconds > self._latency_target_seconds:
+            self._counters["slow"] += 1
+            return
+        self._counters["healthy"] += 1
+        if self._limit < self._max_limit:
+            previous_limit = self.limit
+            # One step per limit-sized window of healthy calls, as in TCP congestion avoidance.
+            self._limit = min(self._max_limit, self._limit + self._increase_step / max(self._limit, 1.0))
+            if self.limit > previous_limit:
+                self._counters["increases"] += 1
+                self._wake_waiters()
+
+    def _record_failure(self, error, started_at):
+        self._counters["calls"] += 1
+        if error_status_code(error) not in OVERLOAD_STATUS_CODES:
+            return
+        self._counters["overloaded"] += 1
+        retry_after = retry_after_seconds(error)
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._counters["retry_after_pauses"] += 1
+        # Calls that were already in flight at the last cut report the same congestion; cut once per window.
+        if started_at < self._last_decrease_at:
+            return
+        previous_limit = self.limit
+        self._limit = max(float(self._min_limit), self._limit * self._decrease_factor)
+        self._last_decrease_at = time.monotonic()
+        self._counters["decreases"] += 1
+        logger.warning(f"Concurrency limit for {self.name} cut from {previous_limit} to {self.limit} "
+                       f"after HTTP {error_status_code(error)}"
+                       + (f" (Retry-After {retry_after:.1f}s)" if retry_after else ""))
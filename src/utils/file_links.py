@@ -0,0 +1,46 @@
+"""Signed, expiring download links for GridFS files.
+
+The frontend signs a link when it renders a file list; file_service checks the signature before streaming the file,
+so only someone who was shown the link by the frontend can fetch the file, and only until the link expires.
+"""
+import hashlib
+import hmac
+import os
+import time
+from urllib.parse import urlencode
+
+FILE_LINK_SECRET_PATH = "/run/secrets/file_link_secret"
+
+
+def load_file_link_secret():
+    """The signing secret from the file_link_secret Docker secret, falling back to the FILE_LINK_SECRET env var."""
+    try:
+        with open(FILE_LINK_SECRET_PATH, "r") as f:
+            return f.read().strip()
+    except IOError:
+        return os.getenv("FILE_LINK_SECRET", "")
+
+
+def _signature(secret, file_id, expires):
+    return hmac.new(secret.encode("utf-8"), f"{file_id}:{expires}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def signed_file_url(base_url, secret, file_id, ttl_seconds=3600):
+    """URL of a file under base_url that stays valid for between ttl_seconds and twice that.
+
+    The expiry is rounded up to a multiple of ttl_seconds, so reruns that render the same file list produce the same
+    URL instead of a new one every time.
+    """
+    expires = (int(time.time()) // ttl_seconds + 2) * ttl_seconds
+    query = urlencode({"expires": expires, "sig": _signature(secret, file_id, expires)})
+    return f"{base_url.rstrip('/')}/{file_id}?{query}"
+
+
+def verify_file_signature(secret, file_id, expires, signature):
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(_signature(secret, file_id, expires), signature or "")
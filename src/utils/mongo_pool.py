@@ -0,0 +1,157 @@
+"""Shared, lazily created MongoClients with connection pool metrics.
+
+A MongoClient already pools connections and is thread-safe, so a process should hold one per cluster instead of
+opening (and authenticating) a new one per request. PooledMongoClient adds lazy creation, a periodic health check
+that replaces a client that stopped answering, a new client after fork() (clients are not fork-safe) and counters
+from pymongo's connection pool events.
+"""
+import logging
+import os
+import threading
+import time
+
+from pymongo import MongoClient, monitoring, errors as pymongo_errors
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Counts connection pool events and measures how long checkouts wait for a free connection."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checkout_started = threading.local()
+        self._counters = {"connections_created": 0, "connections_closed": 0, "checkouts": 0, "checkout_failures": 0,
+                          "pool_clears": 0}
+        self._in_use = 0
+        self._checkout_wait_total = 0.0
+        self._checkout_wait_max = 0.0
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._counters["pool_clears"] += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self._counters["connections_created"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._counters["connections_closed"] += 1
+
+    def connection_check_out_started(self, event):
+        # Pool events fire on the thread doing the checkout, so a thread-local start time pairs them up.
+        self._checkout_started.at = time.monotonic()
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._counters["checkout_failures"] += 1
+
+    def connection_checked_out(self, event):
+        started_at = getattr(self._checkout_started, "at", None)
+        wait = time.monotonic() - started_at if started_at is not None else 0.0
+        with self._lock:
+            self._counters["checkouts"] += 1
+            self._in_use += 1
+            self._checkout_wait_total += wait
+            self._checkout_wait_max = max(self._checkout_wait_max, wait)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._in_use = max(0, self._in_use - 1)
+
+    def stats(self):
+        with self._lock:
+            checkouts = self._counters["checkouts"]
+            return {
+                **self._counters,
+                "open_connections": self._counters["connections_created"] - self._counters["connections_closed"],
+                "in_use": self._in_use,
+                "avg_checkout_wait_ms": round(self._checkout_wait_total / checkouts * 1000, 3) if checkouts else 0.0,
+                "max_checkout_wait_ms": round(self._checkout_wait_max * 1000, 3),
+            }
+
+
+class PooledMongoClient:
+    """One MongoClient per process for a URI, created on first use and replaced when it fails its health check."""
+
+    def __init__(self, name, uri, max_pool_size=50, min_pool_size=0, server_selection_timeout_ms=5000,
+                 health_check_interval_seconds=30, **client_kwargs):
+        self.name = name
+        self._uri = uri
+        self._client_kwargs = {"maxPoolSize": max_pool_size, "minPoolSize": min_pool_size,
+                               "serverSelectionTimeoutMS": server_selection_timeout_ms, **client_kwargs}
+        self._health_check_interval_seconds = health_check_interval_seconds
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+        self._last_healthy_at = 0.0
+        self._metrics = PoolMetricsListener()
+        self._counters = {"clients_created": 0, "reconnects": 0, "health_checks": 0, "failed_health_checks": 0}
+
+    def get(self):
+        """Returns the shared client; raises pymongo.errors.ConnectionFailure if the server cannot be reached."""
+        with self._lock:
+            if self._client is not None and self._pid != os.getpid():
+                # Inherited from the parent process: its sockets belong to the parent, so start over without closing.
+                self._client = None
+            if self._client is None:
+                self._create()
+            elif time.monotonic() - self._last_healthy_at > self._health_check_interval_seconds:
+                if not self._ping():
+                    logger.warning(f"MongoDB client '{self.name}' failed its health check; reconnecting.")
+                    self._client.close()
+                    self._counters["reconnects"] += 1
+                    self._create()
+            return self._client
+
+    def mark_unhealthy(self):
+        """Forces a health check on the next get(), e.g. after an operation failed with a connection error."""
+        with self._lock:
+            self._last_healthy_at = 0.0
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def stats(self):
+        with self._lock:
+            stats = {"connected": self._client is not None, "max_pool_size": self._client_kwargs["maxPoolSize"],
+                     "min_pool_size": self._client_kwargs["minPoolSize"], **self._counters}
+        stats.update(self._metrics.stats())
+        return stats
+
+    def _create(self):
+        client = MongoClient(self._uri, event_listeners=[self._metrics], **self._client_kwargs)
+        self._client, self._pid = client, os.getpid()
+        self._counters["clients_created"] += 1
+        if not self._ping():
+            self._client = None
+            client.close()
+            raise pymongo_errors.ConnectionFailure(f"MongoDB client '{self.name}' could not reach the server.")
+        logger.info(f"MongoDB client '{self.name}' connected (maxPoolSize={self._client_kwargs['maxPoolSize']}).")
+
+    def _ping(self):
+        self._counters["health_checks"] += 1
+        try:
+            self._client.admin.command('ping')
+        except pymongo_errors.PyMongoError as e:
+            self._counters["failed_health_checks"] += 1
+            logger.warning(f"MongoDB client '{self.name}' ping failed: {e}")
+            return False
+        self._last_healthy_at = time.monotonic()
+        return True
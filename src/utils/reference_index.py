@@ -0,0 +1,132 @@
+"""Chunking and BM25 retrieval over course reference material.
+
+Shared by pdf_to_mongodb (builds the index when reference material is ingested) and grading_service (selects the
+passages that go into a grading prompt), so both sides tokenize identically.
+"""
+import math
+import re
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+PARAGRAPH_SPLIT_PATTERN = re.compile(r"\n\s*\n")
+DEFAULT_CHUNK_CHARS = 1000
+BM25_K1 = 1.5
+BM25_B = 0.75
+INDEX_VERSION = 1
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1]
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English/German prose; good enough for budgeting.
+    return (len(text) + 3) // 4
+
+
+def chunk_text(text, target_chars=DEFAULT_CHUNK_CHARS):
+    """Packs paragraphs into chunks of about target_chars; paragraphs longer than that are split on whitespace."""
+    pieces = []
+    for paragraph in PARAGRAPH_SPLIT_PATTERN.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= target_chars:
+            pieces.append(paragraph)
+            continue
+        words, current = paragraph.split(), ""
+        for word in words:
+            if current and len(current) + len(word) + 1 > target_chars:
+                pieces.append(current)
+                current = word
+            else:
+                current = f"{current} {word}" if current else word
+        if current:
+            pieces.append(current)
+
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 2 > target_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def build_index(text, target_chars=DEFAULT_CHUNK_CHARS):
+    """Returns a Mongo-storable BM25 index: chunk texts with term frequencies plus corpus document frequencies."""
+    chunks = []
+    doc_freq = Counter()
+    for chunk in chunk_text(text, target_chars):
+        term_freq = Counter(tokenize(chunk))
+        doc_freq.update(term_freq.keys())
+        chunks.append({"text": chunk, "tf": dict(term_freq), "length": sum(term_freq.values())})
+    total_length = sum(chunk["length"] for chunk in chunks)
+    return {
+        "version": INDEX_VERSION,
+        "chunks": chunks,
+        "doc_freq": dict(doc_freq),
+        "avg_length": total_length / len(chunks) if chunks else 0.0,
+        "total_tokens": estimate_tokens(text),
+    }
+
+
+def score_chunks(index, query_text, k1=BM25_K1, b=BM25_B):
+    chunks = index["chunks"]
+    chunk_count = len(chunks)
+    avg_length = index["avg_length"] or 1.0
+    query_terms = set(tokenize(query_text))
+    idf = {}
+    for term in query_terms:
+        df = index["doc_freq"].get(term, 0)
+        if df:
+            idf[term] = math.log(1 + (chunk_count - df + 0.5) / (df + 0.5))
+
+    scores = []
+    for chunk in chunks:
+        norm = k1 * (1 - b + b * chunk["length"] / avg_length)
+        score = 0.0
+        for term, term_idf in idf.items():
+            tf = chunk["tf"].get(term, 0)
+            if tf:
+                score += term_idf * tf * (k1 + 1) / (tf + norm)
+        scores.append(score)
+    return scores
+
+
+def select_passages(index, query_text, token_budget, top_k):
+    """Picks the best-scoring chunks that fit the token budget and returns them in document order.
+
+    Returns (text, stats) where stats reports how many prompt tokens the trimming saved.
+    """
+    chunks = index["chunks"]
+    scores = score_chunks(index, query_text)
+    ranked = sorted(range(len(chunks)), key=lambda i: (-scores[i], i))
+    if not any(scores):
+        # Nothing in the query matches; fall back to the start of the material.
+        ranked = list(range(len(chunks)))
+
+    selected, used_tokens = [], 0
+    for i in ranked:
+        if len(selected) >= top_k:
+            break
+        chunk_tokens = estimate_tokens(chunks[i]["text"])
+        if used_tokens + chunk_tokens > token_budget:
+            continue
+        selected.append(i)
+        used_tokens += chunk_tokens
+    selected.sort()
+
+    text = "\n[...]\n".join(chunks[i]["text"] for i in selected)
+    original_tokens = index.get("total_tokens") or sum(estimate_tokens(c["text"]) for c in chunks)
+    selected_tokens = estimate_tokens(text)
+    return text, {
+        "original_tokens": original_tokens,
+        "selected_tokens": selected_tokens,
+        "tokens_saved": max(0, original_tokens - selected_tokens),
+        "passages_selected": len(selected),
+        "passages_total": len(chunks),
+    }
@@ -0,0 +1,45 @@
+"""Page-granular storage of submission text, shared by pdf_to_mongodb (writer) and its readers.
+
+A pdf_submissions document keeps only a content summary (page count, characters, OCR time, a short preview); the
+text lives in one PAGES_COLLECTION_NAME document per page. Documents written before pages existed still carry the
+whole text in "content", so every reader goes through load_content/iter_page_texts.
+"""
+
+PAGES_COLLECTION_NAME = "pdf_submission_pages"
+CONTENT_PREVIEW_CHARS = 300
+# Projection for list views and status checks: everything but the text of documents in the old format.
+SUMMARY_PROJECTION = {"content": 0}
+
+
+def join_page_texts(texts):
+    return "".join(text + "\n\n" for text in texts).strip()
+
+
+def has_inline_content(submission):
+    return "content" in submission
+
+
+def pages_collection(submissions_collection):
+    return submissions_collection.database[PAGES_COLLECTION_NAME]
+
+
+def iter_page_texts(submissions_collection, submission, batch_size=20):
+    """Yields the page texts of a submission in page order, fetching batch_size pages per round-trip."""
+    if has_inline_content(submission):
+        yield submission["content"]
+        return
+    cursor = pages_collection(submissions_collection).find(
+        {"submission_id": submission["_id"]}, {"text": 1, "_id": 0}, batch_size=batch_size).sort("page_number", 1)
+    for page in cursor:
+        yield page["text"]
+
+
+def load_content(submissions_collection, submission):
+    """The whole text of a submission, from its pages or from the legacy "content" field."""
+    if has_inline_content(submission):
+        return submission["content"]
+    return join_page_texts(iter_page_texts(submissions_collection, submission))
+
+
+def ensure_page_indexes(submissions_collection):
+    pages_collection(submissions_collection).create_index([("submission_id", 1), ("page_number", 1)], unique=True)
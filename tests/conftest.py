@@ -0,0 +1,15 @@
+"""Puts the service modules on sys.path so the unit tests can import them the way each Dockerfile lays them out.
+
+The unit tests (test_*.py) run against mongomock with `pytest tests`; test.py and verify.py are the end-to-end
+scripts for a running docker-compose stack.
+"""
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for module_dir in ("src/utils", "grading_service", "pdf_to_mongodb", "file_service"):
+    path = os.path.join(REPO_ROOT, module_dir)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+os.environ.setdefault("SEEDBOX_API_KEY", "test-key")
@@ -29,6 +29,7 @@ MONGO_ROOT_USER = "root"
 MONGO_ROOT_PASSWORD = "example"
 MONGO_EXAMS_DB_NAME = "Exams"
 MONGO_PDF_SUBMISSIONS_COLLECTION = "pdf_submissions"
+MONGO_PDF_SUBMISSION_PAGES_COLLECTION = "pdf_submission_pages"
 
 # Global variables to store fetched IDs
 TEACHER_USERNAME = "test_teacher_dyn"
@@ -185,6 +186,10 @@ def cleanup_test_data():
             result = exams_db[MONGO_PDF_SUBMISSIONS_COLLECTION].delete_one({"_id": ObjectId(LOREM_IPSUM_OCR_EXAMS_ID)})
             if result.deleted_count > 0:
                 print(f"Deleted document from Exams DB with ID {LOREM_IPSUM_OCR_EXAMS_ID}")
+            result = exams_db[MONGO_PDF_SUBMISSION_PAGES_COLLECTION].delete_many(
+                {"submission_id": ObjectId(LOREM_IPSUM_OCR_EXAMS_ID)})
+            if result.deleted_count > 0:
+                print(f"Deleted {result.deleted_count} pages of document {LOREM_IPSUM_OCR_EXAMS_ID} from Exams DB")
         else:
             print("No MongoDB document ID to cleanup.")
         print("MongoDB cleanup attempt finished.")
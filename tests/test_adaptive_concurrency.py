@@ -0,0 +1,165 @@
+import asyncio
+import types
+
+import httpx
+import mongomock
+import openai
+import pytest
+
+import adaptive_concurrency
+import grading_service as gs
+from adaptive_concurrency import AdaptiveConcurrencyLimiter, error_status_code, retry_after_seconds
+
+
+class ProviderError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = types.SimpleNamespace(status_code=status_code, headers=headers or {})
+
+
+def succeed(limiter, times=1):
+    async def run():
+        for _ in range(times):
+            async with limiter.slot():
+                pass
+    asyncio.run(run())
+
+
+def fail(limiter, error):
+    async def run():
+        with pytest.raises(type(error)):
+            async with limiter.slot():
+                raise error
+    asyncio.run(run())
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    # Each call starts strictly after the previous decrease, so every overload counts as a new window.
+    ticks = iter(range(1, 10 ** 6))
+    monkeypatch.setattr(adaptive_concurrency, "time", types.SimpleNamespace(monotonic=lambda: float(next(ticks))))
+
+
+def test_additive_increase_adds_one_slot_per_window_of_healthy_calls():
+    limiter = AdaptiveConcurrencyLimiter("m", initial_limit=4, max_limit=10)
+
+    succeed(limiter, times=3)
+    assert limiter.limit == 4
+    succeed(limiter, times=2)
+    assert limiter.limit == 5
+    assert limiter.stats()["increases"] == 1
+
+
+def test_multiplicative_decrease_on_429():
+    limiter = AdaptiveConcurrencyLimiter("m", initial_limit=16, decrease_factor=0.5)
+
+    fail(limiter, ProviderError(429))
+    assert limiter.limit == 8
+    fail(limiter, ProviderError(503))
+    assert limiter.limit == 4
+    assert limiter.stats()["decreases"] == 2
+
+
+def test_non_overload_errors_leave_limit_unchanged():
+    limiter = AdaptiveConcurrencyLimiter("m", initial_limit=8)
+
+    fail(limiter, ProviderError(400))
+    fail(limiter, ValueError("bad json"))
+    assert limiter.limit == 8
+
+
+def test_limit_never_drops_below_min():
+    limiter = AdaptiveConcurrencyLimiter("m", initial_limit=4, min_limit=2)
+
+    for _ in range(5):
+        fail(limiter, ProviderError(429))
+    assert limiter.limit == 2
+
+
+def test_limit_never_exceeds_max():
+    limiter = AdaptiveConcurrencyLimiter("m", initial_limit=2, max_limit=3)
+
+    succeed(limiter, times=50)
+    assert limiter.limit == 3
+
+
+def test_initial_limit_is_clamped():
+    assert AdaptiveConcurrencyLimiter("m", initial_limit=500, max_limit=20).limit == 20
+    assert AdaptiveConcurrencyLimiter("m", initial_limit=0, min_limit=1).limit == 1
+
+
+def test_slow_calls_do_not_raise_the_limit():
+    limiter = AdaptiveConcurrencyLimiter("m", initial_limit=1, latency_target_seconds=0.5)
+
+    succeed(limiter, times=5)
+    assert limiter.limit == 1
+    assert limiter.stats()["slow"] == 5
+
+
+def test_in_flight_calls_never_exceed_limit():
+    limiter = AdaptiveConcurrencyLimiter("m", initial_limit=3, max_limit=3)
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.stats()["in_flight"])
+            await asyncio.sleep(0)
+
+    async def run():
+        await asyncio.gather(*(call() for _ in range(20)))
+
+    asyncio.run(run())
+    assert peak == 3
+
+
+def test_error_helpers_read_status_and_retry_after():
+    assert error_status_code(ProviderError(429)) == 429
+    assert retry_after_seconds(ProviderError(429, {"retry-after": "2.5"})) == 2.5
+    assert retry_after_seconds(ProviderError(429, {"retry-after": "soon"})) is None
+    assert retry_after_seconds(ProviderError(429, {"retry-after": "3600"})) == adaptive_concurrency.MAX_RETRY_AFTER_SECONDS
+
+
+def rate_limit_error():
+    request = httpx.Request("POST", "https://llm.example/v1/chat/completions")
+    return openai.RateLimitError("Rate limit reached", response=httpx.Response(429, request=request), body=None)
+
+
+def test_async_grading_clients_leave_retries_to_the_limiter_and_job_queue():
+    client, release = gs.async_openai_clients.acquire("https://llm.example/v1", "sk-test")
+    try:
+        assert client.max_retries == 0
+    finally:
+        release()
+
+
+def test_rate_limited_grading_call_cuts_the_model_limit(monkeypatch):
+    database = mongomock.MongoClient()[gs.MONGO_DB_NAME]
+    submissions = database[gs.MONGO_COLLECTION_NAME]
+    submissions.insert_one({"course_id": "c1", "category": "question_paper", "content": "Explain photosynthesis.",
+                            "processing_timestamp": 1})
+    document_id = str(submissions.insert_one({"course_id": "c1", "category": "answer_sheet",
+                                              "content": "Light becomes sugar.", "processing_timestamp": 2}).inserted_id)
+    monkeypatch.setattr(gs, "get_mongo_client", lambda: database.client)
+    monkeypatch.setattr(gs, "model_limiters", {})
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        raise rate_limit_error()
+
+    client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)))
+
+    async def grade():
+        limiter = gs.get_model_limiter(gs.SEEDBOX_CHAT_MODEL)
+        initial_limit = limiter.limit
+        result = await gs.grade_document_async(client, submissions, document_id, use_cache=False)
+        return initial_limit, limiter.limit, result
+
+    initial_limit, limit, result = asyncio.run(grade())
+
+    assert len(calls) == 1
+    assert limit < initial_limit
+    # Reported as a 5xx failure, so finish_job puts the job back on the queue.
+    assert result["status"] == "failed" and result["status_code"] >= 500
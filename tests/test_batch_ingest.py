@@ -0,0 +1,122 @@
+import json
+
+import mongomock
+import pytest
+from pymongo import errors as pymongo_errors
+
+import batch_ingest
+import pdf_to_mongodb as ingest
+
+
+@pytest.fixture
+def exams_db(monkeypatch):
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(ingest, "get_exams_client", lambda: client)
+    ingest.ensure_exams_indexes()
+    return client[ingest.MONGO_EXAMS_DB_NAME]
+
+
+@pytest.fixture
+def submissions(exams_db):
+    return exams_db[ingest.MONGO_EXAMS_COLLECTION_NAME]
+
+
+@pytest.fixture
+def pages_collection(exams_db):
+    return exams_db[ingest.PAGES_COLLECTION_NAME]
+
+
+def buffered_writer(collection, checkpoint_path, keys):
+    writer = batch_ingest.BatchWriter(collection, str(checkpoint_path), batch_size=len(keys) + 1)
+    for key in keys:
+        pages = [{"page_number": n, "text": f"{key} page {n}", "source": "text_layer"} for n in (1, 2)]
+        document = ingest.cli_submission_document(f"{key}.pdf", pages, "7", "Law 101", "answer_sheet", "teacher1",
+                                                  "teacher1", key)
+        document["batch_key"] = key
+        writer.add(document, pages)
+    return writer
+
+
+def checkpointed_keys(checkpoint_path):
+    with open(checkpoint_path, encoding="utf-8") as f:
+        return [json.loads(line)["key"] for line in f]
+
+
+def submission_id_of(collection, key):
+    return collection.find_one({"batch_key": key})["_id"]
+
+
+def disconnect(*args, **kwargs):
+    raise pymongo_errors.AutoReconnect("connection reset")
+
+
+def submission_id(writer, index):
+    return writer._buffer[index][0]["_id"]
+
+
+def test_flush_stores_documents_with_their_pages(submissions, pages_collection, tmp_path):
+    writer = buffered_writer(submissions, tmp_path / "run.checkpoint.jsonl", ["a", "b"])
+
+    writer.close()
+
+    assert submissions.count_documents({}) == 2
+    assert pages_collection.count_documents({}) == 4
+    assert checkpointed_keys(tmp_path / "run.checkpoint.jsonl") == ["a", "b"]
+
+
+def test_page_write_error_skips_only_that_submission(submissions, pages_collection, tmp_path):
+    writer = buffered_writer(submissions, tmp_path / "run.checkpoint.jsonl", ["a", "b"])
+    # A page of b is already there, so its insert hits the unique (submission_id, page_number) index.
+    pages_collection.insert_one({"submission_id": submission_id(writer, 1), "page_number": 1, "text": "stale"})
+
+    writer.flush()
+
+    assert [d["batch_key"] for d in submissions.find()] == ["a"]
+    assert pages_collection.count_documents({"submission_id": submission_id_of(submissions, "a")}) == 2
+    assert pages_collection.count_documents({}) == 2
+    assert [key for key, _ in writer.failed] == ["b"]
+    assert checkpointed_keys(tmp_path / "run.checkpoint.jsonl") == ["a"]
+
+
+def test_connection_lost_mid_insert_keeps_stored_documents_and_drops_orphaned_pages(submissions, pages_collection,
+                                                                                    monkeypatch, tmp_path):
+    writer = buffered_writer(submissions, tmp_path / "run.checkpoint.jsonl", ["a", "b"])
+
+    def insert_first_then_disconnect(documents, ordered=True):
+        submissions.insert_one(documents[0])
+        raise pymongo_errors.AutoReconnect("connection reset")
+
+    monkeypatch.setattr(submissions, "insert_many", insert_first_then_disconnect)
+    writer.flush()
+
+    assert [d["batch_key"] for d in submissions.find()] == ["a"]
+    assert {page["submission_id"] for page in pages_collection.find()} == {submission_id_of(submissions, "a")}
+    assert writer.failed == [("b", "connection reset")]
+    assert checkpointed_keys(tmp_path / "run.checkpoint.jsonl") == ["a"]
+
+
+def test_pages_are_kept_when_it_is_unknown_which_submissions_were_stored(submissions, pages_collection, monkeypatch,
+                                                                         tmp_path):
+    writer = buffered_writer(submissions, tmp_path / "run.checkpoint.jsonl", ["a"])
+
+    monkeypatch.setattr(submissions, "insert_many", disconnect)
+    monkeypatch.setattr(submissions, "distinct", disconnect)
+    writer.flush()
+
+    assert pages_collection.count_documents({}) == 2
+    assert [key for key, _ in writer.failed] == ["a"]
+    assert checkpointed_keys(tmp_path / "run.checkpoint.jsonl") == []
+
+
+def test_pages_write_failure_does_not_stop_the_run(submissions, pages_collection, monkeypatch, tmp_path):
+    writer = buffered_writer(submissions, tmp_path / "run.checkpoint.jsonl", ["a", "b"])
+    monkeypatch.setattr(writer._pages_collection, "insert_many", disconnect)
+
+    writer.flush()
+
+    assert submissions.count_documents({}) == 0
+    assert [key for key, _ in writer.failed] == ["a", "b"]
+
+
+def test_resume_lookup_uses_a_batch_key_index(submissions):
+    assert any(index["key"] == [("batch_key", 1)] for index in submissions.index_information().values())
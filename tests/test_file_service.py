@@ -0,0 +1,91 @@
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import file_service
+from file_links import signed_file_url, verify_file_signature
+from file_service import RangeNotSatisfiable, parse_byte_range
+
+SECRET = "test-file-link-secret"
+FILE_ID = "65f000000000000000000001"
+
+
+def link_params(url):
+    query = parse_qs(urlsplit(url).query)
+    return query["expires"][0], query["sig"][0]
+
+
+def test_signed_link_verifies():
+    expires, signature = link_params(signed_file_url("/files", SECRET, FILE_ID))
+
+    assert verify_file_signature(SECRET, FILE_ID, expires, signature)
+
+
+def test_expired_link_is_rejected(monkeypatch):
+    expires, signature = link_params(signed_file_url("/files", SECRET, FILE_ID, ttl_seconds=60))
+    monkeypatch.setattr(time, "time", lambda: int(expires) + 1)
+
+    assert not verify_file_signature(SECRET, FILE_ID, expires, signature)
+
+
+@pytest.mark.parametrize("secret, file_id, signature", [
+    ("another-secret", FILE_ID, None),
+    (SECRET, "65f000000000000000000002", None),
+    (SECRET, FILE_ID, "0" * 64),
+    (SECRET, FILE_ID, ""),
+])
+def test_wrong_signature_is_rejected(secret, file_id, signature):
+    expires, valid_signature = link_params(signed_file_url("/files", SECRET, FILE_ID))
+
+    assert not verify_file_signature(secret, file_id, expires, signature if signature is not None else valid_signature)
+
+
+def test_tampered_expiry_is_rejected():
+    expires, signature = link_params(signed_file_url("/files", SECRET, FILE_ID))
+
+    assert not verify_file_signature(SECRET, FILE_ID, str(int(expires) + 3600), signature)
+    assert not verify_file_signature(SECRET, FILE_ID, "never", signature)
+    assert not verify_file_signature(SECRET, FILE_ID, None, signature)
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=0-1,5-9", None),
+    ("items=0-1", None),
+])
+def test_parse_byte_range(header, expected):
+    assert parse_byte_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize("header, length", [
+    ("bytes=1000-", 1000),
+    ("bytes=1500-2000", 1000),
+    ("bytes=-0", 1000),
+    ("bytes=9-3", 1000),
+    ("bytes=0-", 0),
+    ("bytes=-10", 0),
+])
+def test_unsatisfiable_ranges(header, length):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_byte_range(header, length)
+
+
+def test_download_requires_a_valid_link(monkeypatch):
+    monkeypatch.setattr(file_service, "FILE_LINK_SECRET", SECRET)
+    client = file_service.app.test_client()
+    expires, signature = link_params(signed_file_url("/files", SECRET, FILE_ID))
+
+    assert client.get(f"/files/{FILE_ID}?expires={expires}&sig={'0' * 64}").status_code == 403
+    assert client.get(f"/files/{FILE_ID}?expires={int(time.time()) - 1}&sig={signature}").status_code == 403
+
+
+def test_downloads_are_refused_without_a_secret(monkeypatch):
+    monkeypatch.setattr(file_service, "FILE_LINK_SECRET", "")
+
+    assert file_service.app.test_client().get(f"/files/{FILE_ID}").status_code == 503
@@ -0,0 +1,138 @@
+import asyncio
+
+import mongomock
+import pytest
+
+import grading_service as gs
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(gs, "get_mongo_client", lambda: client)
+    gs.job_api_keys.clear()
+    yield client
+    gs.job_api_keys.clear()
+
+
+def run_claimed_job(monkeypatch, graded_with):
+    async def fake_grade(async_client, collection, document_id, custom_api_key=None, use_cache=True):
+        graded_with.append(custom_api_key)
+        return {'document_id': document_id, 'status': 'graded', 'evaluation_details': {'final_grade': 90}}
+
+    monkeypatch.setattr(gs, "grade_document_async", fake_grade)
+    job = gs.claim_next_job("worker-1")
+    asyncio.run(gs.run_job(job, "worker-1"))
+    return gs.get_jobs_collection().find_one({"_id": job["_id"]})
+
+
+def test_custom_api_key_is_not_stored_in_job_document(mongo):
+    job_ids = gs.enqueue_grading_jobs(["doc-1", "doc-2"], "https://llm.example", "sk-user-secret")
+
+    for job in gs.get_jobs_collection().find():
+        assert "custom_api_key" not in job
+        assert "sk-user-secret" not in repr(job)
+        assert job["uses_custom_api_key"] is True
+    assert [gs.job_api_key(gs.ObjectId(job_id)) for job_id in job_ids] == ["sk-user-secret"] * 2
+
+
+def test_job_runs_with_in_memory_key_and_forgets_it(mongo, monkeypatch):
+    gs.enqueue_grading_jobs(["doc-1"], "https://llm.example", "sk-user-secret")
+    graded_with = []
+
+    job = run_claimed_job(monkeypatch, graded_with)
+
+    assert graded_with == ["sk-user-secret"]
+    assert job["status"] == "completed"
+    assert gs.job_api_keys == {}
+
+
+def test_job_fails_when_restart_lost_its_key(mongo, monkeypatch):
+    gs.enqueue_grading_jobs(["doc-1"], "https://llm.example", "sk-user-secret")
+    gs.job_api_keys.clear()
+    graded_with = []
+
+    job = run_claimed_job(monkeypatch, graded_with)
+
+    assert graded_with == []
+    assert job["status"] == "failed"
+    assert job["result"]["status_code"] == 409
+
+
+def test_purge_removes_keys_stored_by_older_versions(mongo):
+    gs.get_jobs_collection().insert_one({"document_id": "doc-1", "status": "queued", "custom_api_key": "sk-old"})
+
+    gs.purge_stored_api_keys()
+
+    job = gs.get_jobs_collection().find_one()
+    assert "custom_api_key" not in job
+    assert job["uses_custom_api_key"] is True
+
+
+def queue_batch(document_ids, max_in_flight):
+    batch_id, _ = gs.create_grading_batch(document_ids, "course-1", max_in_flight)
+    return batch_id
+
+
+def test_batch_never_runs_more_than_max_in_flight_jobs(mongo):
+    batch_id = queue_batch(["doc-1", "doc-2", "doc-3"], max_in_flight=2)
+
+    claimed = [gs.claim_next_job(f"worker-{i}") for i in range(3)]
+
+    assert [job["document_id"] for job in claimed[:2]] == ["doc-1", "doc-2"]
+    assert claimed[2] is None
+    batch = gs.get_batches_collection().find_one({"_id": batch_id})
+    assert batch["in_flight"] == 2 and batch["full"] is True
+    assert set(batch["slot_job_ids"]) == {claimed[0]["_id"], claimed[1]["_id"]}
+
+
+def test_job_taken_over_after_lease_expiry_keeps_its_single_slot(mongo):
+    batch_id = queue_batch(["doc-1", "doc-2"], max_in_flight=2)
+    job = gs.claim_next_job("worker-1")
+    gs.get_jobs_collection().update_one({"_id": job["_id"]},
+                                        {"$set": {"lease_expires_at": gs.datetime.utcnow() - gs.timedelta(seconds=1)}})
+
+    taken_over = gs.claim_next_job("worker-2")
+
+    assert taken_over["_id"] == job["_id"]
+    assert gs.get_batches_collection().find_one({"_id": batch_id})["slot_job_ids"] == [job["_id"]]
+
+
+def test_finished_job_releases_its_slot(mongo):
+    batch_id = queue_batch(["doc-1", "doc-2"], max_in_flight=1)
+    job = gs.claim_next_job("worker-1")
+
+    gs.finish_job(job, "worker-1", {"status": "graded", "document_id": "doc-1"})
+
+    batch = gs.get_batches_collection().find_one({"_id": batch_id})
+    assert batch["slot_job_ids"] == [] and batch["in_flight"] == 0 and batch["full"] is False
+    assert gs.claim_next_job("worker-1")["document_id"] == "doc-2"
+
+
+def test_stale_slots_of_jobs_that_stopped_running_are_released(mongo):
+    batch_id = queue_batch(["doc-1", "doc-2"], max_in_flight=2)
+    finished, running = gs.claim_next_job("worker-1"), gs.claim_next_job("worker-2")
+    # The service stopped after recording the outcome but before releasing the slot.
+    gs.get_jobs_collection().update_one({"_id": finished["_id"]}, {"$set": {"status": "completed"}})
+
+    gs.release_stale_batch_slots()
+
+    batch = gs.get_batches_collection().find_one({"_id": batch_id})
+    assert batch["slot_job_ids"] == [running["_id"]] and batch["in_flight"] == 1 and batch["full"] is False
+
+
+def test_max_in_flight_is_limited_to_the_worker_count(mongo, monkeypatch):
+    monkeypatch.setattr(gs, "BATCH_MAX_IN_FLIGHT_LIMIT", 4)
+    client = gs.app.test_client()
+
+    response = client.post("/grade_batches", json={"document_ids": ["doc-1"], "max_in_flight": 5})
+
+    assert response.status_code == 400
+    assert "at most 4" in response.get_json()["message"]
+    assert gs.get_batches_collection().count_documents({}) == 0
+    assert client.get("/batches").get_json()["max_in_flight_limit"] == 4
+
+
+def test_max_in_flight_limit_never_exceeds_the_worker_count():
+    assert gs.BATCH_MAX_IN_FLIGHT_LIMIT <= gs.GRADING_WORKER_COUNT
+    assert gs.BATCH_DEFAULT_MAX_IN_FLIGHT <= gs.BATCH_MAX_IN_FLIGHT_LIMIT
@@ -0,0 +1,100 @@
+import fitz
+import mongomock
+import pytest
+from pymongo import errors as pymongo_errors
+
+import pdf_to_mongodb as ingest
+from ocr_cache import OCRCache, document_cache_key, ocr_settings_fingerprint, page_cache_key
+
+SETTINGS = ocr_settings_fingerprint("eng", "300")
+
+
+def scanned_pdf(*shades):
+    """PDF bytes with one text-less page per shade, so every page needs OCR and renders differently."""
+    doc = fitz.open()
+    for shade in shades:
+        page = doc.new_page()
+        page.draw_rect(fitz.Rect(50, 50, 300, 300), color=None, fill=(shade, shade, shade))
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+@pytest.fixture
+def cache():
+    collection = mongomock.MongoClient()["Exams"]["ocr_cache"]
+    return OCRCache(lambda: collection)
+
+
+def test_document_key_depends_on_bytes_and_settings(tmp_path):
+    data = scanned_pdf(0.2)
+    path = tmp_path / "scan.pdf"
+    path.write_bytes(data)
+
+    key = document_cache_key(data, SETTINGS)
+
+    assert key.startswith("doc:")
+    assert document_cache_key(str(path), SETTINGS) == key
+    assert document_cache_key(data, ocr_settings_fingerprint("deu", "300")) != key
+    assert document_cache_key(scanned_pdf(0.5), SETTINGS) != key
+
+
+def test_page_key_matches_the_same_page_in_another_pdf():
+    first, second = fitz.open(stream=scanned_pdf(0.2, 0.5)), fitz.open(stream=scanned_pdf(0.5))
+
+    key = page_cache_key(second[0], SETTINGS, 72)
+
+    assert key.startswith("page:")
+    assert page_cache_key(first[1], SETTINGS, 72) == key
+    assert page_cache_key(first[0], SETTINGS, 72) != key
+    assert page_cache_key(second[0], ocr_settings_fingerprint("eng", "150"), 72) != key
+
+
+def test_pages_and_documents_round_trip(cache):
+    assert cache.get_pages(["page:a", "page:b"]) == {}
+    assert cache.get_document("doc:a") is None
+
+    cache.put_page("page:a", "Answer 1", ocr_dpi=150, ocr_quality=0.9)
+    cache.put_document("doc:a", [{"page_number": 1, "text": "Answer 1", "source": "ocr"}])
+
+    assert cache.get_pages(["page:a", "page:b"]) == {"page:a": {"text": "Answer 1", "ocr_dpi": 150, "ocr_quality": 0.9}}
+    assert cache.get_document("doc:a") == [{"page_number": 1, "text": "Answer 1", "source": "ocr"}]
+    stats = cache.stats()
+    assert (stats["page_hits"], stats["page_misses"]) == (1, 3)
+    assert (stats["document_hits"], stats["document_misses"]) == (1, 1)
+
+
+def test_unreachable_cache_is_a_miss():
+    def unreachable():
+        raise pymongo_errors.ServerSelectionTimeoutError("no servers")
+
+    cache = OCRCache(unreachable)
+
+    assert cache.get_pages(["page:a"]) == {}
+    cache.put_page("page:a", "Answer 1")
+
+
+def test_cached_pages_are_merged_with_freshly_ocrd_ones(cache, monkeypatch):
+    data = scanned_pdf(0.2, 0.5)
+    doc = fitz.open(stream=data)
+    cache.put_page(page_cache_key(doc[0], SETTINGS, ingest.OCR_CACHE_HASH_DPI), "cached answer", 300, 0.8)
+    ocrd = []
+
+    def fake_ocr(page, page_num, language, dpi_steps, min_quality, regions=None):
+        ocrd.append(page_num)
+        return {"text": f"fresh answer {page_num}", "ocr_dpi": dpi_steps[-1], "ocr_quality": 0.9,
+                "ocr_attempts": 1, "ocr_regions": 0, "ocr_pixels": 1, "ocr_seconds": 0.5}
+
+    monkeypatch.setattr(ingest, "ocr_page_adaptive", fake_ocr)
+    options = {"ocr_dpi": 300, "adaptive_dpi": False, "ocr_mode": "page", "cache": cache}
+
+    pages = ingest.extract_pages(data, **options)
+
+    assert ocrd == [2]
+    assert [(page["text"], page.get("cached", False)) for page in pages] == [("cached answer", True),
+                                                                            ("fresh answer 2", False)]
+    assert cache.get_pages([page_cache_key(doc[1], SETTINGS, ingest.OCR_CACHE_HASH_DPI)])
+
+    # The merged result is stored for the whole document, so the next run does no OCR at all.
+    assert [page["text"] for page in ingest.extract_pages(data, **options)] == ["cached answer", "fresh answer 2"]
+    assert ocrd == [2]
@@ -0,0 +1,56 @@
+import time
+
+import fitz
+import pytest
+
+import pdf_to_mongodb as ingest
+
+# Pages whose OCR never finishes. The worker functions below run in the pool's processes, which import this module
+# by name, so they must live at module level.
+STUCK_PAGES = {0, 1}
+
+
+def _ocr_stuck_on_some_pages(page_index, language, dpi_steps, min_quality, region_tuples):
+    ingest._worker_started_at[page_index] = time.time()
+    if page_index in STUCK_PAGES:
+        time.sleep(3600)
+    return {"text": f"page {page_index + 1}", "ocr_attempts": 1}
+
+
+def _ocr_stuck_before_starting(page_index, language, dpi_steps, min_quality, region_tuples):
+    # Never records a start time, so only the document timeout can end it.
+    time.sleep(3600)
+
+
+@pytest.fixture
+def pdf_path(tmp_path):
+    doc = fitz.open()
+    for _ in range(4):
+        doc.new_page()
+    path = str(tmp_path / "scan.pdf")
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def test_stuck_pages_time_out_and_the_rest_finish_in_a_fresh_pool(monkeypatch, pdf_path):
+    monkeypatch.setattr(ingest, "_ocr_page_in_worker", _ocr_stuck_on_some_pages)
+    monkeypatch.setattr(ingest, "OCR_POLL_INTERVAL_SECONDS", 0.05)
+    start = time.monotonic()
+    # Both workers get stuck on pages 1 and 2 before pages 3 and 4 ever start.
+    records = ingest.ocr_pages_in_parallel(pdf_path, {0: None, 1: None, 2: None, 3: None}, "eng", [150], 0.6,
+                                           workers=2, page_timeout=1, document_timeout=60)
+    assert time.monotonic() - start < 30
+    assert records[0] is None and records[1] is None
+    assert records[2]["text"] == "page 3"
+    assert records[3]["text"] == "page 4"
+
+
+def test_document_timeout_gives_up_on_all_unfinished_pages(monkeypatch, pdf_path):
+    monkeypatch.setattr(ingest, "_ocr_page_in_worker", _ocr_stuck_before_starting)
+    monkeypatch.setattr(ingest, "OCR_POLL_INTERVAL_SECONDS", 0.05)
+    start = time.monotonic()
+    records = ingest.ocr_pages_in_parallel(pdf_path, {0: None, 2: [fitz.Rect(0, 0, 10, 10)]}, "eng", [150], 0.6,
+                                           workers=2, page_timeout=None, document_timeout=1)
+    assert time.monotonic() - start < 30
+    assert records == {0: None, 2: None}
@@ -0,0 +1,153 @@
+import json
+import types
+from datetime import datetime, timedelta
+
+import mongomock
+import pytest
+
+import grading_service as gs
+from client_registry import ClientRegistry
+import response_cache
+from response_cache import ResponseCache, make_cache_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = datetime(2024, 1, 1)
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(response_cache, "_utcnow", clock)
+    return clock
+
+
+@pytest.fixture
+def collection():
+    return mongomock.MongoClient()["Exams"]["llm_response_cache"]
+
+
+def make_cache(collection, **kwargs):
+    return ResponseCache(lambda: collection, **kwargs)
+
+
+def test_cache_key_depends_on_request_content():
+    request = {"model": "m", "messages": [{"role": "user", "content": "a"}], "temperature": 0}
+    assert make_cache_key(request) == make_cache_key(dict(request))
+    assert make_cache_key(request) != make_cache_key({**request, "messages": [{"role": "user", "content": "b"}]})
+
+
+def test_miss_then_memory_hit(collection, clock):
+    cache = make_cache(collection)
+
+    assert cache.get("k") is None
+    cache.put("k", '{"grade": 1}', "m")
+
+    assert cache.get("k") == '{"grade": 1}'
+    stats = cache.stats()
+    assert (stats["misses"], stats["memory_hits"], stats["persistent_hits"]) == (1, 1, 0)
+
+
+def test_persistent_hit_after_restart(collection, clock):
+    make_cache(collection).put("k", "response", "m")
+    restarted = make_cache(collection)
+
+    assert restarted.get("k") == "response"
+    assert restarted.get("k") == "response"
+    stats = restarted.stats()
+    assert (stats["persistent_hits"], stats["memory_hits"]) == (1, 1)
+    assert collection.find_one({"_id": "k"})["hits"] == 1
+
+
+def test_entries_expire_after_ttl_in_both_tiers(collection, clock):
+    cache = make_cache(collection, ttl_seconds=60)
+    cache.put("k", "response")
+
+    clock.now += timedelta(seconds=59)
+    assert cache.get("k") == "response"
+    assert make_cache(collection, ttl_seconds=60).get("k") == "response"
+
+    clock.now += timedelta(seconds=2)
+    assert cache.get("k") is None
+    assert make_cache(collection, ttl_seconds=60).get("k") is None
+
+
+def test_ttl_index_is_created(collection):
+    make_cache(collection, ttl_seconds=60).ensure_indexes()
+
+    ttl_index = [index for index in collection.index_information().values() if index["key"] == [("created_at", 1)]]
+    assert ttl_index[0]["expireAfterSeconds"] == 60
+
+
+def test_memory_tier_evicts_least_recently_used(collection, clock):
+    cache = make_cache(collection, max_memory_entries=2)
+    cache.put("a", "A")
+    cache.put("b", "B")
+    cache.get("a")
+    cache.put("c", "C")
+
+    assert cache.stats()["memory_entries"] == 2
+    collection.delete_many({})
+    assert cache.get("a") == "A"
+    assert cache.get("c") == "C"
+    assert cache.get("b") is None
+
+
+def test_persistent_tier_evicts_least_recently_accessed(collection, clock):
+    cache = make_cache(collection, max_persistent_entries=2, eviction_check_interval=1)
+    for key in ("a", "b"):
+        cache.put(key, key.upper())
+        clock.now += timedelta(seconds=1)
+    make_cache(collection).get("a")
+    clock.now += timedelta(seconds=1)
+    cache.put("c", "C")
+
+    assert sorted(entry["_id"] for entry in collection.find()) == ["a", "c"]
+    assert cache.stats()["evictions"] == 1
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = 0
+
+    def create(self, **kwargs):
+        self.calls += 1
+        content = json.dumps({criterion: {"score": 80, "justification": "ok"} for criterion in gs.GRADING_WEIGHTS})
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))],
+            usage=types.SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15,
+                                        prompt_tokens_details=types.SimpleNamespace(cached_tokens=0)))
+
+
+@pytest.fixture
+def grading_setup(monkeypatch):
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(gs, "get_mongo_client", lambda: client)
+    submissions = client[gs.MONGO_DB_NAME][gs.MONGO_COLLECTION_NAME]
+    submissions.insert_one({"course_id": "c1", "category": "question_paper", "content": "Explain photosynthesis.",
+                            "processing_timestamp": 1})
+    submissions.insert_one({"course_id": "c1", "category": "reference_material", "content": "Plants use light.",
+                            "processing_timestamp": 1})
+    document_id = str(submissions.insert_one({"course_id": "c1", "category": "answer_sheet",
+                                              "content": "Light becomes sugar.", "processing_timestamp": 2}).inserted_id)
+    completions = FakeCompletions()
+    fake_client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+    monkeypatch.setattr(gs, "openai_clients", ClientRegistry(lambda base_url, api_key: fake_client, lambda c: None))
+    monkeypatch.setattr(gs, "response_cache", make_cache(client[gs.MONGO_DB_NAME]["llm_response_cache"]))
+    return gs.app.test_client(), document_id, completions
+
+
+def test_use_cache_flag_controls_lookup(grading_setup):
+    http, document_id, completions = grading_setup
+
+    first = http.post("/grade_document", json={"document_id": document_id})
+    second = http.post("/grade_document", json={"document_id": document_id})
+    uncached = http.post("/grade_document", json={"document_id": document_id, "use_cache": False})
+
+    assert [r.status_code for r in (first, second, uncached)] == [200, 200, 200]
+    assert [r.get_json()["cached"] for r in (first, second, uncached)] == [False, True, False]
+    assert completions.calls == 2
@@ -0,0 +1,86 @@
+import mongomock
+import pytest
+from bson.objectid import ObjectId
+from pymongo import errors as pymongo_errors
+
+import pdf_to_mongodb as ingest
+
+PAGES = [{"page_number": 1, "text": "Answer 1", "source": "text_layer"},
+         {"page_number": 2, "text": "Answer 2", "source": "ocr", "ocr_seconds": 0.5}]
+
+
+@pytest.fixture
+def exams_db(monkeypatch):
+    client = mongomock.MongoClient()
+    monkeypatch.setattr(ingest, "get_exams_client", lambda: client)
+    ingest.ensure_exams_indexes()
+    return client[ingest.MONGO_EXAMS_DB_NAME]
+
+
+def submission(gridfs_id="65f0000000000000000000aa"):
+    data = {"course_id": "7", "category": "answer_sheet", "student_id": "42", **ingest.content_summary(PAGES)}
+    if gridfs_id:
+        data["processed_from_gridfs_id"] = gridfs_id
+    return data
+
+
+def race_on_first_upsert(monkeypatch, winner_id, failures=1):
+    """Makes the next find_one_and_update calls lose a race: another request stores the same upload first."""
+    original = mongomock.collection.Collection.find_one_and_update
+    calls = []
+
+    def find_one_and_update(self, filter, update, *args, **kwargs):
+        calls.append(filter)
+        if len(calls) <= failures:
+            if not self.find_one(filter):
+                self.insert_one({**update["$setOnInsert"], "_id": winner_id})
+            raise pymongo_errors.DuplicateKeyError("E11000 duplicate key error: processed_from_gridfs_id")
+        return original(self, filter, update, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "find_one_and_update", find_one_and_update)
+    return calls
+
+
+def test_gridfs_id_index_is_unique_for_uploads_only(exams_db):
+    collection = exams_db[ingest.MONGO_EXAMS_COLLECTION_NAME]
+    index = next(index for index in collection.index_information().values()
+                 if index["key"] == [("processed_from_gridfs_id", 1)])
+    assert index["unique"] is True
+
+    # CLI ingests have no GridFS file and must not collide on the missing value.
+    ingest.store_ocr_in_exams_db(submission(gridfs_id=None), PAGES)
+    ingest.store_ocr_in_exams_db(submission(gridfs_id=None), PAGES)
+    assert collection.count_documents({}) == 2
+
+
+def test_identical_submissions_are_stored_once(exams_db):
+    first_id = ingest.store_ocr_in_exams_db(submission(), PAGES)
+    second_id = ingest.store_ocr_in_exams_db(submission(), PAGES)
+
+    assert second_id == first_id
+    assert exams_db[ingest.MONGO_EXAMS_COLLECTION_NAME].count_documents({}) == 1
+    # The duplicate's pages were written before the upsert and are removed again.
+    pages = list(exams_db[ingest.PAGES_COLLECTION_NAME].find())
+    assert len(pages) == 2 and {page["submission_id"] for page in pages} == {first_id}
+
+
+def test_losing_a_race_on_the_unique_index_returns_the_winner(exams_db, monkeypatch):
+    winner_id = ObjectId()
+    calls = race_on_first_upsert(monkeypatch, winner_id)
+
+    stored_id = ingest.store_ocr_in_exams_db(submission(), PAGES)
+
+    assert stored_id == winner_id
+    assert len(calls) == 2
+    assert exams_db[ingest.MONGO_EXAMS_COLLECTION_NAME].count_documents({}) == 1
+    assert exams_db[ingest.PAGES_COLLECTION_NAME].count_documents({}) == 0
+
+
+def test_second_duplicate_key_error_is_raised_and_pages_removed(exams_db, monkeypatch):
+    calls = race_on_first_upsert(monkeypatch, ObjectId(), failures=2)
+
+    with pytest.raises(pymongo_errors.DuplicateKeyError):
+        ingest.store_ocr_in_exams_db(submission(), PAGES)
+
+    assert len(calls) == 2
+    assert exams_db[ingest.PAGES_COLLECTION_NAME].count_documents({}) == 0